@@ -19,6 +19,10 @@ export function mediaUrl(mediaId: string, forBotId: string): string {
   return apiUrl(`/media/${encode(mediaId)}?bot_id=${encode(forBotId)}`);
 }
 
+export function mediaPreviewUrl(mediaId: string, forBotId: string): string {
+  return apiUrl(`/media/${encode(mediaId)}/preview?bot_id=${encode(forBotId)}`);
+}
+
 export async function deleteMedia(mediaId: string, forBotId: string): Promise<Result<null>> {
   const res = await fetchApi(`/media/${encode(mediaId)}?bot_id=${encode(forBotId)}`, {
     method: "DELETE",
@@ -18,6 +18,8 @@ from telebot_constructor.auth.telegram_auth import TelegramAuth
 from telebot_constructor.store.media import (
     AwsS3Credentials,
     AwsS3MediaStore,
+    CachedMediaStore,
+    DeduplicatingMediaStore,
     FilesystemMediaStore,
     MediaStore,
 )
@@ -94,12 +96,15 @@ async def main() -> None:
         media_store: MediaStore = AwsS3MediaStore(
             credentials=AwsS3Credentials.model_validate_json(os.environ["MEDIA_STORE_AWS_S3_CREDENTIALS"])
         )
+        media_cache_dir = os.environ.get("MEDIA_STORE_CACHE_DIR")
+        media_store = CachedMediaStore(media_store, disk_dir=Path(media_cache_dir) if media_cache_dir else None)
         logging.info("AWS S3 media store set up")
     except Exception:
         media_dir = Path(".media").absolute()
         media_dir.mkdir(exist_ok=True)
         media_store = FilesystemMediaStore(media_dir)
         logging.info("Filesystem media store set up")
+    media_store = DeduplicatingMediaStore(media_store, redis)
 
     app = ModuliApp(
         redis=redis,
@@ -4,7 +4,6 @@ import datetime
 import fnmatch
 import json
 import logging
-import mimetypes
 import re
 import uuid
 from dataclasses import dataclass
@@ -26,6 +25,7 @@ from telebot_components.utils.secrets import SecretStore
 
 from telebot_constructor.app_models import (
     BotErrorsPage,
+    BotErrorStatsPage,
     BotInfo,
     BotInfoList,
     BotTokenPayload,
@@ -42,18 +42,37 @@ from telebot_constructor.app_models import (
 )
 from telebot_constructor.auth.auth import Auth
 from telebot_constructor.bot_config import BotConfig
+from telebot_constructor.bots_startup import StoredBot, StoredBotsStarter
 from telebot_constructor.build_time_config import BASE_PATH, VERSION
 from telebot_constructor.constants import FILENAME_HEADER
-from telebot_constructor.construct import BotFactory, construct_bot, make_bare_bot
+from telebot_constructor.construct import (
+    BotFactory,
+    construct_bot,
+    constructed_bot_prefix,
+    make_bare_bot,
+)
 from telebot_constructor.cors import setup_cors
 from telebot_constructor.debug import setup_debugging
+from telebot_constructor.error_alerts import ErrorAlertsDigester
 from telebot_constructor.group_chat_discovery import GroupChatDiscoveryHandler
+from telebot_constructor.media_processing import (
+    ImageNormalizer,
+    InvalidImageError,
+    is_normalizable,
+    is_normalized_image,
+)
 from telebot_constructor.runners import (
     ConstructedBotRunner,
     PollingConstructedBotRunner,
     WebhookAppConstructedBotRunner,
 )
-from telebot_constructor.static import get_prefilled_messages, static_file_content
+from telebot_constructor.static import (
+    IMMUTABLE_CACHE_CONTROL,
+    get_prefilled_messages,
+    is_fingerprinted_asset,
+    preload_static_files,
+    static_file_response,
+)
 from telebot_constructor.store.errors import BotError, BotErrorContext
 from telebot_constructor.store.form_results import (
     TIMESTAMP_KEY,
@@ -78,11 +97,14 @@ from telebot_constructor.utils import (
     hash_token,
     log_prefix,
     page_params_to_redis_indices,
-    send_telegram_alert,
 )
+from telebot_constructor.utils.store import purge_cached_stores
 
 logger = logging.getLogger(__name__)
 
+MAX_REQUEST_BODY_SIZE = 10 * 1024**2  # 10 Mib
+MEDIA_STREAMING_CHUNK_SIZE = 256 * 1024
+
 
 PydanticModelT = TypeVar("PydanticModelT", bound=pydantic.BaseModel)
 
@@ -101,6 +123,9 @@ class ModuliApp:
     Main application class, managing aiohttp app setup (routes, middlewares) and running bots (via bot runner)
     """
 
+    # form results are loaded from the store and written to the CSV export response in pages of this size
+    FORM_RESULTS_EXPORT_PAGE_SIZE = 500
+
     def __init__(
         self,
         redis: RedisInterface,
@@ -115,6 +140,12 @@ class ModuliApp:
         server_side_config_processors: dict[str, dict[str, Callable[[BotConfig], Awaitable[BotConfig]]]] | None = None,
         server_side_bot_processors: dict[str, dict[str, Callable[[BotRunner], Awaitable[BotRunner]]]] | None = None,
         root_user_ids: list[str] | None = None,
+        stored_bots_startup_concurrency: int = 32,
+        stored_bots_startup_rate: float = 20.0,  # bot constructions started per second
+        error_alerts_digest_window: float = 60.0,  # sec
+        media_processing_workers: int = 2,
+        # upload content blocks' media to the owner chat on bot start to get Telegram file ids in advance
+        warm_up_media_file_ids: bool = False,
     ) -> None:
         self.auth = auth
         self.secret_store = secret_store
@@ -125,8 +156,11 @@ class ModuliApp:
 
         self.telegram_files_downloader = telegram_files_downloader or InmemoryCacheTelegramFilesDownloader()
         self.store = Store(redis)
+        self.error_alerts = ErrorAlertsDigester(make_bot=self._make_bare_bot, window=error_alerts_digest_window)
         self.store.errors.error_callback = self.send_alert_on_error
         self.media_store = media_store
+        self.image_normalizer = ImageNormalizer(max_workers=media_processing_workers)
+        self.warm_up_media_file_ids = warm_up_media_file_ids
         self.group_chat_discovery_handler = GroupChatDiscoveryHandler(
             redis=redis, telegram_files_downloader=self.telegram_files_downloader
         )
@@ -140,6 +174,12 @@ class ModuliApp:
         self._server_side_bot_processors = server_side_bot_processors or {}
         self._root_user_ids = set(root_user_ids or [])
 
+        self.stored_bots_starter = StoredBotsStarter(
+            start_bot=self._start_stored_bot,
+            max_concurrency=stored_bots_startup_concurrency,
+            max_starts_per_second=stored_bots_startup_rate,
+        )
+
     @property
     def runner(self) -> ConstructedBotRunner:
         if self._runner is None:
@@ -354,20 +394,15 @@ class ModuliApp:
         )
 
     async def send_alert_on_error(self, ctx: BotErrorContext) -> None:
-        await send_telegram_alert(
-            message=ctx.error.message,
-            error_data=ctx.error.exc_data,
-            traceback=ctx.error.exc_traceback,
-            bot=await self._make_bare_bot(ctx.owner_id, ctx.bot_id),
-            alerts_chat_id=ctx.alert_chat_id,
-        )
+        await self.error_alerts.on_error(ctx)
 
     async def _with_server_side_config_processor(self, owner_id: str, bot_id: str, bot_config: BotConfig) -> BotConfig:
         if custom_processor := self._server_side_config_processors.get(bot_id, {}).get(owner_id):
             log_prefix = self._log_prefix(owner_id, bot_id)
             logger.info(f"{log_prefix} Found server-side config processor, applying...")
             try:
-                return await custom_processor(bot_config)
+                # loaded configs are shared with the store's cache, so processors get their own copy
+                return await custom_processor(bot_config.model_copy(deep=True))
             except Exception:
                 logger.exception(f"{log_prefix} Error applying server-side config processor, will run without it")
 
@@ -387,6 +422,7 @@ class ModuliApp:
             group_chat_discovery_handler=self.group_chat_discovery_handler,
             owner_chat_id=self.auth.owner_chat_id(owner_id),
             media_store=self.media_store.adapter_for(owner_id) if self.media_store else None,
+            warm_up_media_file_ids=self.warm_up_media_file_ids,
             _bot_factory=self._bot_factory,
         )
 
@@ -416,7 +452,12 @@ class ModuliApp:
 
     async def stop_bot(self, a: BotAccessAuthorization) -> bool:
         log_prefix = self._log_prefix(a.owner_id, a.bot_id, actor_id=a.actor_id)
-        if await self.runner.stop(a.owner_id, a.bot_id):
+        is_stopped = await self.runner.stop(a.owner_id, a.bot_id)
+        # stopped, deleted or restarted bot's cached data is not needed / may be outdated
+        cache_stats = purge_cached_stores(constructed_bot_prefix(a.owner_id, a.bot_id))
+        if cache_stats:
+            logger.info(f"{log_prefix} Purged cached stores: {cache_stats}")
+        if is_stopped:
             logger.info(f"{log_prefix} Stopped bot")
             await self.store.set_bot_not_running(a.owner_id, a.bot_id)
             await self.store.save_event(
@@ -493,7 +534,7 @@ class ModuliApp:
 
     async def create_constructor_web_app(self) -> web.Application:
         app = web.Application(
-            client_max_size=10 * 1024**2,  # 10 Mib
+            client_max_size=MAX_REQUEST_BODY_SIZE,
         )
         routes = web.RouteTableDef()
 
@@ -601,6 +642,8 @@ class ModuliApp:
                     author_username=a.actor_id,
                 ),
             )
+            # new config may use a different token
+            self.error_alerts.forget_bot(a.owner_id, a.bot_id)
 
             new_bot_version_count = await self.store.bot_config_version_count(a.owner_id, a.bot_id)
             new_version = new_bot_version_count - 1  # i.e. the last one
@@ -649,7 +692,9 @@ class ModuliApp:
             # HACK: the display name is stored separately and frontend can get it from bot info
             #       it should be removed from here when frontend stops depending on it :)
             if "with_display_name" in request.query:
-                config.display_name = await self.store.load_bot_display_name(a.owner_id, a.bot_id)
+                config = config.model_copy(
+                    update={"display_name": await self.store.load_bot_display_name(a.owner_id, a.bot_id)}
+                )
 
             if "server_side_processing" in request.query:
                 config = await self._with_server_side_config_processor(
@@ -672,6 +717,7 @@ class ModuliApp:
             config = await self.load_bot_config(a.owner_id, a.bot_id, version=-1)
             await self.stop_bot(a)
             await self.store.remove_bot_config(a.owner_id, a.bot_id)
+            self.error_alerts.forget_bot(a.owner_id, a.bot_id)
             await self.delete_secret(owner_id=a.owner_id, secret_name=config.token_secret_name, is_token=True)
             await self.store.save_event(
                 a.owner_id,
@@ -803,10 +849,7 @@ class ModuliApp:
             owner_bot_to_load = sorted(owner_bot_to_load_set)
             logger.info(f"Total to load: {len(owner_bot_to_load)} bot infos")
 
-            maybe_bot_infos = [
-                await self.store.load_bot_info(owner_id=owner_id, bot_id=bot_id, detailed=detailed)
-                for owner_id, bot_id in owner_bot_to_load
-            ]
+            maybe_bot_infos = await self.store.load_bot_infos(owner_bot_to_load, detailed=detailed)
 
             bot_infos = [bi for bi in maybe_bot_infos if bi is not None]
 
@@ -892,39 +935,51 @@ class ModuliApp:
             form_info = await self.store.form_results.load_form_info(global_form_id)
             if not form_info:
                 raise web.HTTPNotFound(reason="Form not found")
-            MAX_RESULTS_COUNT = 1000
-            results, is_full = await self.store.form_results.load(
-                form_id=global_form_id,
-                filter=filter,
-                load_page_size=100,
-                max_results_count=MAX_RESULTS_COUNT,
+            response = web.StreamResponse(
+                status=200,
+                headers={
+                    hdrs.CONTENT_DISPOSITION: (
+                        f'attachment; filename="Results for {form_info.title or "Unnamed form"} '
+                        + f"({filter.describe()}; generated on "
+                        + f'{datetime.datetime.now().isoformat(timespec="minutes")}).csv"'
+                    ),
+                },
             )
+            response.content_type = "text/csv"
+            response.charset = "utf-8"
+            response.enable_chunked_encoding()
+            await response.prepare(request)
+
+            # CSV is written to the buffer page by page and flushed to the response after each one
             csv_out_stream = StringIO()
             csv_writer = csv.DictWriter(
                 f=csv_out_stream,
                 fieldnames=[TIMESTAMP_KEY, USER_KEY] + list(form_info.field_names.keys()),
             )
+
+            async def flush() -> None:
+                await response.write(csv_out_stream.getvalue().encode("utf-8"))
+                csv_out_stream.seek(0)
+                csv_out_stream.truncate()
+
             if with_header:
                 header = {TIMESTAMP_KEY: "Timestamp", USER_KEY: "User", **form_info.field_names}
                 csv_writer.writerow(header)
-            for r in results:
-                if TIMESTAMP_KEY in r:
-                    timestamp = r.get(TIMESTAMP_KEY)
-                    if isinstance(timestamp, float):
-                        r[TIMESTAMP_KEY] = datetime.datetime.fromtimestamp(timestamp).isoformat()
-                csv_writer.writerow(r)
-            return web.Response(
-                status=200 if is_full else 206,
-                text=csv_out_stream.getvalue(),
-                content_type="text/csv",
-                headers={
-                    hdrs.CONTENT_DISPOSITION: (
-                        f'attachment; filename="Results for {form_info.title or "Unnamed form"} '
-                        + f"({filter.describe()}; generated on "
-                        + f'{datetime.datetime.now().isoformat(timespec="minutes")}).csv"'
-                    ),
-                },
-            )
+                await flush()
+            async for page in self.store.form_results.iter_pages(
+                form_id=global_form_id,
+                filter=filter,
+                load_page_size=self.FORM_RESULTS_EXPORT_PAGE_SIZE,
+            ):
+                for r in page:
+                    if TIMESTAMP_KEY in r:
+                        timestamp = r.get(TIMESTAMP_KEY)
+                        if isinstance(timestamp, float):
+                            r[TIMESTAMP_KEY] = datetime.datetime.fromtimestamp(timestamp).isoformat()
+                    csv_writer.writerow(r)
+                await flush()
+            await response.write_eof()
+            return response
 
         @routes.put("/api/forms/{bot_id}/{form_block_id}/title")
         async def update_form_title(request: web.Request) -> web.Response:
@@ -968,17 +1023,79 @@ class ModuliApp:
             """
             media_store = self.ensure_media_store()
             media_owner = await self.authorize_media_owner(request)
-            media_id = await media_store.save_media(
-                owner_id=media_owner,
-                media=Media(content=await request.read(), filename=request.headers.get(FILENAME_HEADER)),
-            )
+            filename = request.headers.get(FILENAME_HEADER)
+            if is_normalizable(filename):
+                # images are downscaled and recompressed before saving, with a preview saved alongside
+                media = Media(content=await request.read(), filename=filename)
+                try:
+                    normalized = await self.image_normalizer.normalize(media)
+                except InvalidImageError as e:
+                    if is_normalized_image(filename):
+                        raise web.HTTPBadRequest(reason=str(e))
+                    normalized = None  # unknown or undecodable media type, saving as is
+                media_id = await media_store.save_media(
+                    owner_id=media_owner,
+                    media=normalized.media if normalized is not None else media,
+                )
+                if media_id is not None and normalized is not None:
+                    preview_media_id = await media_store.save_media(owner_id=media_owner, media=normalized.preview)
+                    if preview_media_id is not None:
+                        await self.store.save_media_preview_id(media_owner, media_id, preview_media_id)
+            elif request.content_length is not None:
+                # streaming request body to the media store without reading it fully
+                if request.content_length > MAX_REQUEST_BODY_SIZE:
+                    raise web.HTTPRequestEntityTooLarge(
+                        max_size=MAX_REQUEST_BODY_SIZE,
+                        actual_size=request.content_length,
+                    )
+                media_id = await media_store.save_media_stream(
+                    owner_id=media_owner,
+                    chunks=request.content.iter_chunked(MEDIA_STREAMING_CHUNK_SIZE),
+                    filename=filename,
+                )
+            else:
+                media_id = await media_store.save_media(
+                    owner_id=media_owner,
+                    media=Media(content=await request.read(), filename=filename),
+                )
             if media_id is None:
                 raise web.HTTPServiceUnavailable(reason="Media store failed")
             else:
                 return web.Response(text=media_id)
 
+        async def media_response(request: web.Request, media_owner: str, media_id: str) -> web.StreamResponse:
+            media_store = self.ensure_media_store()
+            headers = {
+                hdrs.CACHE_CONTROL: "private, max-age=31536000",  # a year, as we use unique media ids
+            }
+
+            # fast path for local files: sent by the OS (using sendfile) without reading them in the app
+            media_file_path = await media_store.media_file_path(owner_id=media_owner, media_id=media_id)
+            if media_file_path is not None:
+                return web.FileResponse(media_file_path, headers=headers)
+
+            media_stream = await media_store.load_media_stream(owner_id=media_owner, media_id=media_id)
+            if media_stream is None:
+                raise web.HTTPNotFound(reason=f"Media not found: {media_id}")
+
+            response = web.StreamResponse(headers=headers)
+            if media_stream.filename is not None:
+                response.headers[FILENAME_HEADER] = media_stream.filename
+            if media_stream.mimetype is not None:
+                response.content_type = media_stream.mimetype
+            if media_stream.size is not None:
+                response.content_length = media_stream.size
+            try:
+                await response.prepare(request)
+                async for chunk in media_stream.chunks:
+                    await response.write(chunk)
+            finally:
+                await media_stream.chunks.aclose()
+            await response.write_eof()
+            return response
+
         @routes.get("/api/media/{media_id}")
-        async def serve_media(request: web.Request) -> web.Response:
+        async def serve_media(request: web.Request) -> web.StreamResponse:
             """
             ---
             description: Load media from media store by its id
@@ -988,19 +1105,25 @@ class ModuliApp:
                 "200":
                     description: Media body
             """
-            media_store = self.ensure_media_store()
             media_owner = await self.authorize_media_owner(request)
             media_id = self.parse_path_part(request, part_name="media_id")
-            media = await media_store.load_media(owner_id=media_owner, media_id=media_id)
-            if media is None:
-                raise web.HTTPNotFound(reason=f"Media not found: {media_id}")
-            else:
-                headers = {
-                    hdrs.CACHE_CONTROL: "private, max-age=31536000",  # a year, as we use unique media ids
-                }
-                if media.filename is not None:
-                    headers[FILENAME_HEADER] = media.filename
-                return web.Response(body=media.content, content_type=media.mimetype, headers=headers)
+            return await media_response(request, media_owner, media_id)
+
+        @routes.get("/api/media/{media_id}/preview")
+        async def serve_media_preview(request: web.Request) -> web.StreamResponse:
+            """
+            ---
+            description: Load small media preview, or the media itself if it has no preview
+            produces:
+            - */*
+            responses:
+                "200":
+                    description: Media preview body
+            """
+            media_owner = await self.authorize_media_owner(request)
+            media_id = self.parse_path_part(request, part_name="media_id")
+            preview_media_id = await self.store.load_media_preview_id(media_owner, media_id)
+            return await media_response(request, media_owner, preview_media_id or media_id)
 
         @routes.delete("/api/media/{media_id}")
         async def delete_media(request: web.Request) -> web.Response:
@@ -1016,10 +1139,16 @@ class ModuliApp:
             media_store = self.ensure_media_store()
             media_owner = await self.authorize_media_owner(request)
             media_id = self.parse_path_part(request, part_name="media_id")
-            if await media_store.delete_media(owner_id=media_owner, media_id=media_id):
-                return web.Response(text="Media deleted")
-            else:
+            is_deleted = await media_store.release_media(owner_id=media_owner, media_id=media_id)
+            if is_deleted is None:
                 raise web.HTTPNotFound(reason=f"Media not found: {media_id}")
+            preview_media_id = await self.store.load_media_preview_id(media_owner, media_id)
+            if preview_media_id is not None:
+                # preview is saved on every upload of the media, so its references mirror the media's
+                await media_store.release_media(owner_id=media_owner, media_id=preview_media_id)
+                if is_deleted:
+                    await self.store.remove_media_preview_id(media_owner, media_id)
+            return web.Response(text="Media deleted")
 
         # endregion
         ##################################################################################
@@ -1042,6 +1171,24 @@ class ModuliApp:
             errors = await self.store.errors.load_errors(a.owner_id, a.bot_id, offset, count)
             return web.json_response(text=BotErrorsPage(errors=errors, bot_info=bot_info).model_dump_json())
 
+        @routes.get("/api/error-stats/{bot_id}")
+        async def get_bot_error_stats(request: web.Request) -> web.Response:
+            """
+            ---
+            description: Get bot errors aggregated by fingerprint, most recently seen first
+            produces:
+            - application/json
+            responses:
+                "200":
+                    description: OK
+            """
+            a = await self.authorize(request)
+            bot_info = await self.load_nondetailed_bot_info(a)
+            error_stats = await self.store.errors.load_error_stats(a.owner_id, a.bot_id)
+            return web.json_response(
+                text=BotErrorStatsPage(error_stats=error_stats, bot_info=bot_info).model_dump_json()
+            )
+
         @routes.post("/api/alert-chat-id/{bot_id}")
         async def set_new_alert_chat_id(request: web.Request) -> web.Response:
             """
@@ -1074,6 +1221,7 @@ class ModuliApp:
                         owner_id=a.owner_id,
                         bot_id=a.bot_id,
                         error=BotError.from_last_exception(message="Example report of an unexpected error"),
+                        bypass_sampling=True,
                     )
                     if not res:
                         raise web.HTTPServerError(reason="Alert chat test failed")
@@ -1336,18 +1484,35 @@ class ModuliApp:
         @routes.get("/")
         @routes.get("")
         async def landing_page(request: web.Request) -> web.Response:
-            return web.Response(
-                body=static_file_content(self.static_files_dir / "landing.html"),
-                content_type="text/html",
-                headers={
-                    hdrs.CACHE_CONTROL: "private, max-age=2628000",  # ~month
-                },
+            return await static_file_response(
+                request,
+                self.static_files_dir / "landing.html",
+                cache_control="private, max-age=2628000",  # ~month
             )
 
         @routes.get("/api/version")
         async def api_version(request: web.Request) -> web.Response:
             return web.Response(text=VERSION or "<unset>")
 
+        @routes.get("/api/startup-progress")
+        async def get_startup_progress(request: web.Request) -> web.Response:
+            """
+            ---
+            description: Progress of starting stored bots after constructor startup, for use in health checks
+            produces:
+            - application/json
+            responses:
+                "200":
+                    description: All stored bots were processed (some might have failed to start)
+                "503":
+                    description: Stored bots are still starting
+            """
+            progress = self.stored_bots_starter.progress()
+            return web.json_response(
+                text=progress.model_dump_json(),
+                status=200 if progress.is_completed else 503,
+            )
+
         STATIC_FILE_GLOBS = ["assets/*", "landing-assets/*", "favicon.*", "*.png", "*.jpg", "icons/*"]
 
         @routes.get("/{path:(?!api/).*}")  # mathing all paths except those starting with /api prefix
@@ -1356,13 +1521,17 @@ class ModuliApp:
             if static_file_path is None:
                 raise web.HTTPNotFound()
             if any(fnmatch.fnmatch(static_file_path, glob) for glob in STATIC_FILE_GLOBS):
-                mime_type, _ = mimetypes.guess_type(static_file_path, strict=False)
-                return web.Response(
-                    body=static_file_content(self.static_files_dir / static_file_path),
-                    content_type=mime_type,
-                    headers={
-                        hdrs.CACHE_CONTROL: "private, max-age=2628000",  # ~month
-                    },
+                path = (self.static_files_dir / static_file_path).resolve()
+                if not path.is_relative_to(self.static_files_dir.resolve()):
+                    raise web.HTTPNotFound()
+                return await static_file_response(
+                    request,
+                    path,
+                    cache_control=(
+                        IMMUTABLE_CACHE_CONTROL
+                        if is_fingerprinted_asset(static_file_path)
+                        else "private, max-age=2628000"  # ~month
+                    ),
                 )
             else:
                 # if not static file -- must be an app route, so authenticate and serve
@@ -1373,12 +1542,10 @@ class ModuliApp:
                     return await self.auth.unauthenticated_client_response(
                         request, static_files_dir=self.static_files_dir
                     )
-                return web.Response(
-                    body=static_file_content(self.static_files_dir / "index.html"),
-                    content_type="text/html",
-                    headers={
-                        hdrs.CACHE_CONTROL: "private, max-age=31536000",  # ~year
-                    },
+                return await static_file_response(
+                    request,
+                    self.static_files_dir / "index.html",
+                    cache_control="private, max-age=31536000",  # ~year
                 )
 
         # endregion
@@ -1396,30 +1563,42 @@ class ModuliApp:
 
     # region constructor lifecycle
 
+    async def _start_stored_bot(self, stored_bot: StoredBot) -> bool:
+        owner_id = stored_bot.owner_id
+        bot_id = stored_bot.bot_id
+        log_prefix = self._log_prefix(owner_id, bot_id, stored_bot.version)
+        logger.debug(f"{log_prefix} Starting stored bot")
+        try:
+            bot_config = await self.store.load_bot_config(owner_id, bot_id, stored_bot.version)
+            if bot_config is None:
+                raise RuntimeError("Bot is marked as running bot no config found")
+            bot_runner = await self._construct_bot(owner_id, bot_id, bot_config)
+            if not await self.runner.start(owner_id=owner_id, bot_id=bot_id, bot_runner=bot_runner):
+                raise RuntimeError(f"Runner {self.runner} refused to start the bot, maybe see error above")
+            return True
+        except Exception:
+            logger.exception(f"{log_prefix} Error starting stored bot, will mark it as not running")
+            try:
+                await self.store.set_bot_not_running(owner_id, bot_id)
+            except Exception:
+                logger.exception(f"{log_prefix} Failed to mark bot as non-running after failed startup")
+            return False
+
     def start_stored_bots_in_background(self) -> None:
         async def _start_stored_bots() -> None:
             logger.info("Starting stored bots...")
-            total_bots = 0
-            started_bots = 0
-            async for owner_id, bot_id, version in self.store.iter_running_bot_versions():
-                total_bots += 1
-                log_prefix = self._log_prefix(owner_id, bot_id, version)
-                logger.debug(f"{log_prefix} Starting stored bot (#{total_bots})")
-                try:
-                    bot_config = await self.store.load_bot_config(owner_id, bot_id, version)
-                    if bot_config is None:
-                        raise RuntimeError("Bot is marked as running bot no config found")
-                    bot_runner = await self._construct_bot(owner_id, bot_id, bot_config)
-                    if not await self.runner.start(owner_id=owner_id, bot_id=bot_id, bot_runner=bot_runner):
-                        raise RuntimeError(f"Runner {self.runner} refused to start the bot, maybe see error above")
-                    started_bots += 1
-                except Exception:
-                    logger.exception(f"{log_prefix} Error starting stored bot, will mark it as not running")
-                    try:
-                        await self.store.set_bot_not_running(owner_id, bot_id)
-                    except Exception:
-                        logger.exception(f"{log_prefix} Failed to mark bot as non-running after failed startup")
-            logger.info(f"Started {started_bots}/{total_bots} bots in total")
+            running_bot_versions = [rbv async for rbv in self.store.iter_running_bot_versions()]
+            last_event_timestamps = await self.store.load_last_event_timestamps(
+                [(owner_id, bot_id) for owner_id, bot_id, _ in running_bot_versions]
+            )
+            await self.stored_bots_starter.run(
+                [
+                    StoredBot(owner_id=owner_id, bot_id=bot_id, version=version, last_activity=last_activity)
+                    for (owner_id, bot_id, version), last_activity in zip(running_bot_versions, last_event_timestamps)
+                ]
+            )
+            progress = self.stored_bots_starter.progress()
+            logger.info(f"Started {progress.started}/{progress.total} bots in total")
 
         self._start_stored_bots_task = create_error_logging_task(_start_stored_bots(), name="Start stored bots")
 
@@ -1432,15 +1611,19 @@ class ModuliApp:
         await self.telegram_files_downloader.setup()
         if self.media_store is not None:
             await self.media_store.setup()
+        await asyncio.to_thread(preload_static_files, self.static_files_dir)
         logger.info("Setup completed")
 
     async def cleanup(self) -> None:
         logger.info("Cleanup started")
         await self.telegram_files_downloader.cleanup()
         await self.runner.cleanup()
+        await self.store.errors.flush()
+        await self.error_alerts.flush()
         # await telebot.api.session_manager.close_session()
         if self.media_store is not None:
             await self.media_store.cleanup()
+        self.image_normalizer.shutdown()
         logger.info("Cleanup completed")
 
     # public methods to run constructor in different scenarios
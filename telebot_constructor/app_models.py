@@ -7,7 +7,7 @@ from telebot import AsyncTeleBot
 from telebot import types as tg
 
 from telebot_constructor.bot_config import BotConfig
-from telebot_constructor.store.errors import BotError
+from telebot_constructor.store.errors import BotError, BotErrorStats
 from telebot_constructor.store.form_results import FormInfo, FormInfoBasic, FormResult
 from telebot_constructor.store.types import BotConfigVersionMetadata, BotEvent
 from telebot_constructor.telegram_files_downloader import TelegramFilesDownloader
@@ -200,7 +200,20 @@ class BotErrorsPage(BaseModel):
     errors: list[BotError]
 
 
+class BotErrorStatsPage(BaseModel):
+    bot_info: BotInfo
+    error_stats: list[BotErrorStats]
+
+
 class BotVersionsPage(BaseModel):
     bot_info: BotInfo
     versions: list[BotVersionInfo]
     total_versions: int
+
+
+class StoredBotsStartupProgress(BaseModel):
+    total: int
+    started: int
+    failed: int
+    pending: int
+    is_completed: bool
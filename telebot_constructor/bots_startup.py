@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from telebot_constructor.app_models import StoredBotsStartupProgress
+from telebot_constructor.store.types import BotVersion
+from telebot_constructor.utils import log_prefix
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StoredBot:
+    """Bot marked as running in the store, to be started on constructor startup"""
+
+    owner_id: str
+    bot_id: str
+    version: BotVersion
+    last_activity: float | None  # timestamp of the last bot event, None if unknown
+
+
+# returns True if the bot was started successfully
+StartStoredBotCallback = Callable[[StoredBot], Awaitable[bool]]
+
+
+class StartRateLimiter:
+    """Spaces out acquisitions so that on average at most `rate` of them happen per second"""
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        if self._interval == 0:
+            return
+        now = time.monotonic()
+        wait_for = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self._interval
+        if wait_for > 0:
+            await asyncio.sleep(wait_for)
+
+
+class StoredBotsStarter:
+    """
+    Starts stored bots concurrently, with a bounded number of bots being constructed at once
+    and a limit on how many constructions begin each second (each one makes several Bot API
+    calls, e.g. getMe and setMyCommands). Most recently active bots are started first.
+    """
+
+    def __init__(
+        self,
+        start_bot: StartStoredBotCallback,
+        max_concurrency: int,
+        max_starts_per_second: float,
+    ) -> None:
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be positive, got {max_concurrency=}")
+        self._start_bot = start_bot
+        self.max_concurrency = max_concurrency
+        self._rate_limiter = StartRateLimiter(rate=max_starts_per_second)
+
+        self._total = 0
+        self._started = 0
+        self._failed = 0
+        self._is_completed = False
+
+    def progress(self) -> StoredBotsStartupProgress:
+        return StoredBotsStartupProgress(
+            total=self._total,
+            started=self._started,
+            failed=self._failed,
+            pending=self._total - self._started - self._failed,
+            is_completed=self._is_completed,
+        )
+
+    @staticmethod
+    def prioritized(stored_bots: list[StoredBot]) -> list[StoredBot]:
+        return sorted(
+            stored_bots,
+            key=lambda sb: sb.last_activity if sb.last_activity is not None else float("-inf"),
+            reverse=True,
+        )
+
+    async def _start_one(self, stored_bot: StoredBot) -> None:
+        await self._rate_limiter.acquire()
+        try:
+            is_started = await self._start_bot(stored_bot)
+        except Exception:
+            logger.exception(f"{log_prefix(stored_bot.owner_id, stored_bot.bot_id)} Unexpected error starting bot")
+            is_started = False
+        if is_started:
+            self._started += 1
+        else:
+            self._failed += 1
+
+    async def run(self, stored_bots: list[StoredBot]) -> None:
+        queue = iter(self.prioritized(stored_bots))
+        self._total += len(stored_bots)
+
+        async def worker() -> None:
+            # the iterator is shared between workers, so bots are started in the priority order
+            for stored_bot in queue:
+                await self._start_one(stored_bot)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, len(stored_bots)))))
+        finally:
+            self._is_completed = True
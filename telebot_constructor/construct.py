@@ -43,6 +43,11 @@ async def make_bare_bot(
     )
 
 
+def constructed_bot_prefix(owner_id: str, bot_id: str) -> str:
+    """Prefix for all the stores of the constructed bot"""
+    return f"{CONSTRUCTOR_PREFIX}/{owner_id}/{bot_id}"
+
+
 async def construct_bot(
     *,
     owner_id: str,
@@ -55,10 +60,11 @@ async def construct_bot(
     owner_chat_id: int,
     media_store: UserSpecificMediaStore | None = None,
     group_chat_discovery_handler: GroupChatDiscoveryHandler | None = None,
+    warm_up_media_file_ids: bool = False,
     _bot_factory: BotFactory = AsyncTeleBot,  # used for testing
 ) -> BotRunner:
     """Core bot construction function responsible for turning a config into a functional bot"""
-    bot_prefix = f"{CONSTRUCTOR_PREFIX}/{owner_id}/{bot_id}"
+    bot_prefix = constructed_bot_prefix(owner_id, bot_id)
     logger = logging.getLogger(__name__ + log_prefix(owner_id, bot_id))
     errors_store.instrument(logger)
     logger.info("Constructing bot")
@@ -104,6 +110,7 @@ async def construct_bot(
             errors_store=errors_store,
             media_store=media_store,
             owner_chat_id=owner_chat_id,
+            warm_up_media_file_ids=warm_up_media_file_ids,
         )
 
         logger.debug(f"Got result: {user_flow_setup_result}")
@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from telebot import AsyncTeleBot
+from telebot_components.utils import telegram_html_escape
+
+from telebot_constructor.store.errors import BotError, BotErrorContext
+from telebot_constructor.utils import log_prefix, send_telegram_alert
+
+logger = logging.getLogger(__name__)
+
+
+MakeAlertsBot = Callable[[str, str], Awaitable[AsyncTeleBot]]
+
+AlertWindowKey = tuple[str, str, int | str]  # owner id, bot id, alert chat id
+
+
+@dataclass
+class _AlertWindow:
+    """Errors accumulated for one alert chat since the last alert/digest was sent"""
+
+    started_at: float
+    count: int = 0
+    fingerprint_counts: collections.Counter[str] = field(default_factory=collections.Counter)
+    fingerprint_examples: dict[str, BotError] = field(default_factory=dict)
+
+    def add(self, error: BotError) -> None:
+        fingerprint = error.fingerprint()
+        self.count += 1
+        self.fingerprint_counts[fingerprint] += 1
+        self.fingerprint_examples.setdefault(fingerprint, error)
+
+
+class ErrorAlertsDigester:
+    """
+    Coalesces error alerts: the first error for an alert chat is sent right away, and the errors
+    that follow within a time window are merged into a single digest message with counts and top
+    error kinds. Windows keep being extended while errors keep coming. Bot clients used to send
+    alerts are reused between messages.
+    """
+
+    TOP_FINGERPRINTS_IN_DIGEST = 5
+    MAX_DIGEST_LINE_LENGTH = 200
+
+    def __init__(self, make_bot: MakeAlertsBot, window: float, bot_ttl: float = 600) -> None:
+        self._make_bot = make_bot
+        self.window = window
+        self.bot_ttl = bot_ttl
+        self._bots: dict[tuple[str, str], tuple[AsyncTeleBot, float]] = {}
+        self._windows: dict[AlertWindowKey, _AlertWindow] = {}
+        self._window_tasks: dict[AlertWindowKey, asyncio.Task[None]] = {}
+
+    async def _get_bot(self, owner_id: str, bot_id: str) -> AsyncTeleBot:
+        now = time.time()
+        # expired clients are dropped here, so that clients of the bots that stopped erroring don't pile up
+        for expired_key in [key for key, (_, created_at) in self._bots.items() if now - created_at >= self.bot_ttl]:
+            del self._bots[expired_key]
+        cached = self._bots.get((owner_id, bot_id))
+        if cached is not None:
+            bot, _ = cached
+            return bot
+        bot = await self._make_bot(owner_id, bot_id)
+        self._bots[(owner_id, bot_id)] = (bot, time.time())
+        return bot
+
+    def forget_bot(self, owner_id: str, bot_id: str) -> None:
+        """Drop cached bot client, e.g. when bot's token might have changed"""
+        self._bots.pop((owner_id, bot_id), None)
+
+    async def _send_alert(self, ctx: BotErrorContext) -> None:
+        try:
+            await send_telegram_alert(
+                message=ctx.error.message,
+                error_data=ctx.error.exc_data,
+                traceback=ctx.error.exc_traceback,
+                bot=await self._get_bot(ctx.owner_id, ctx.bot_id),
+                alerts_chat_id=ctx.alert_chat_id,
+            )
+        except Exception:
+            logger.exception(f"{log_prefix(ctx.owner_id, ctx.bot_id)} Error sending error alert")
+            if ctx.send_immediately:
+                # e.g. test alert, the caller must know it has failed
+                raise
+
+    def format_digest(self, alert_window: _AlertWindow, now: float) -> str:
+        minutes = max(1, round((now - alert_window.started_at) / 60))
+        lines = [f"⚠️ <b>{alert_window.count} more error(s)</b> in the last {minutes} min"]
+        for fingerprint, count in alert_window.fingerprint_counts.most_common(self.TOP_FINGERPRINTS_IN_DIGEST):
+            example = alert_window.fingerprint_examples[fingerprint]
+            description = example.message_template()
+            if len(description) > self.MAX_DIGEST_LINE_LENGTH:
+                description = description[: self.MAX_DIGEST_LINE_LENGTH] + "..."
+            line = f"• {count}× "
+            if example.exc_type is not None:
+                line += f"<code>{telegram_html_escape(example.exc_type)}</code> "
+            line += telegram_html_escape(description)
+            if (location := example.location()) is not None:
+                line += f" (<code>{telegram_html_escape(location)}</code>)"
+            lines.append(line)
+        other_fingerprints_count = len(alert_window.fingerprint_counts) - self.TOP_FINGERPRINTS_IN_DIGEST
+        if other_fingerprints_count > 0:
+            lines.append(f"... and {other_fingerprints_count} other kind(s) of errors")
+        return "\n\n".join(lines)
+
+    async def _send_digest(self, key: AlertWindowKey, alert_window: _AlertWindow) -> None:
+        owner_id, bot_id, alert_chat_id = key
+        try:
+            bot = await self._get_bot(owner_id, bot_id)
+            await bot.send_message(
+                chat_id=alert_chat_id,
+                text=self.format_digest(alert_window, now=time.time()),
+                parse_mode="HTML",
+                auto_split_message=False,
+            )
+        except Exception:
+            logger.exception(f"{log_prefix(owner_id, bot_id)} Error sending errors digest")
+
+    async def _run_window(self, key: AlertWindowKey) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.window)
+                alert_window = self._windows.pop(key)
+                if alert_window.count == 0:
+                    return
+                self._windows[key] = _AlertWindow(started_at=time.time())
+                await self._send_digest(key, alert_window)
+        finally:
+            # the window might have been already closed and reopened by flush
+            if self._window_tasks.get(key) is asyncio.current_task():
+                del self._window_tasks[key]
+                self._windows.pop(key, None)
+
+    async def on_error(self, ctx: BotErrorContext) -> None:
+        key: AlertWindowKey = (ctx.owner_id, ctx.bot_id, ctx.alert_chat_id)
+        alert_window = self._windows.get(key)
+        if alert_window is not None and not ctx.send_immediately:
+            alert_window.add(ctx.error)
+            return
+        if alert_window is None:
+            self._windows[key] = _AlertWindow(started_at=time.time())
+            self._window_tasks[key] = asyncio.create_task(self._run_window(key), name=f"Alerts window for {key}")
+        await self._send_alert(ctx)
+
+    async def flush(self) -> None:
+        """Send pending digests right away and close all windows, used on shutdown"""
+        for task in list(self._window_tasks.values()):
+            task.cancel()
+        pending_windows = list(self._windows.items())
+        self._windows.clear()
+        self._window_tasks.clear()
+        for key, alert_window in pending_windows:
+            if alert_window.count > 0:
+                await self._send_digest(key, alert_window)
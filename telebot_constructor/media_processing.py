@@ -0,0 +1,116 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import PurePath
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from telebot_constructor.store.media import Media, guess_mimetype
+
+logger = logging.getLogger(__name__)
+
+
+# Telegram downscales photos to 2560px on the longer side, larger images only cost storage and traffic
+MAX_IMAGE_SIDE = 2560
+PREVIEW_SIDE = 320
+JPEG_QUALITY = 87
+PREVIEW_JPEG_QUALITY = 75
+
+# other formats (e.g. animated GIFs) are stored as is
+NORMALIZED_FORMATS = {"JPEG", "PNG", "WEBP", "MPO"}
+# uploads with these types are rejected if they can't be decoded, anything else is stored as is
+NORMALIZED_MIMETYPES = {"image/jpeg", "image/png", "image/webp"}
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+@dataclass
+class NormalizedImage:
+    media: Media
+    preview: Media
+
+
+def _encode(image: Image.Image, keep_png: bool, jpeg_quality: int) -> tuple[bytes, str]:
+    """Returns encoded image and its extension; metadata (EXIF etc) is not preserved"""
+    buffer = io.BytesIO()
+    if keep_png:
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue(), ".png"
+    else:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+        return buffer.getvalue(), ".jpg"
+
+
+def _with_extension(filename: str | None, extension: str) -> str | None:
+    if filename is None:
+        return None
+    return str(PurePath(filename).with_suffix(extension))
+
+
+def normalize_image(media: Media) -> NormalizedImage | None:
+    """
+    Downscale image to the max size useful in Telegram, recompress it without metadata and make a small
+    preview. Returns None for unsupported formats, raises InvalidImageError if the content is not a valid
+    image. CPU-bound, meant to be run in a process pool.
+    """
+    try:
+        with Image.open(io.BytesIO(media.content)) as original:
+            if original.format not in NORMALIZED_FORMATS:
+                return None
+            original.load()
+            image = ImageOps.exif_transpose(original) or original
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise InvalidImageError(f"Invalid image: {e}") from e
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    keep_png = original.format == "PNG" or has_alpha
+
+    image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), resample=Image.Resampling.LANCZOS)
+    content, extension = _encode(image, keep_png=keep_png, jpeg_quality=JPEG_QUALITY)
+
+    image.thumbnail((PREVIEW_SIDE, PREVIEW_SIDE), resample=Image.Resampling.LANCZOS)
+    preview_content, preview_extension = _encode(image, keep_png=False, jpeg_quality=PREVIEW_JPEG_QUALITY)
+
+    return NormalizedImage(
+        media=Media(content=content, filename=_with_extension(media.filename, extension)),
+        preview=Media(content=preview_content, filename=_with_extension(media.filename, preview_extension)),
+    )
+
+
+def is_normalizable(filename: str | None) -> bool:
+    """Whether uploaded media must go through normalization (decided before reading it)"""
+    mimetype = guess_mimetype(filename)
+    return mimetype is None or (mimetype.startswith("image/") and mimetype != "image/svg+xml")
+
+
+def is_normalized_image(filename: str | None) -> bool:
+    """Whether uploaded media is confidently identified as an image in one of the normalized formats"""
+    return guess_mimetype(filename) in NORMALIZED_MIMETYPES
+
+
+class ImageNormalizer:
+    """Runs image normalization in a process pool, not to block the event loop and use all CPU cores"""
+
+    def __init__(self, max_workers: int = 2) -> None:
+        self.max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+
+    async def normalize(self, media: Media) -> NormalizedImage | None:
+        if self._pool is None:
+            # the app is multi-threaded (e.g. asyncio.to_thread), so worker processes must not be forked from it
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._pool, normalize_image, media)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -1,8 +1,15 @@
+import asyncio
+import gzip
+import hashlib
 import json
+import logging
+import mimetypes
+import re
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
-from aiohttp import web
+from aiohttp import hdrs, web
 
 from telebot_constructor.debug import DEBUG
 from telebot_constructor.user_flow.blocks.constants import (
@@ -10,19 +17,142 @@ from telebot_constructor.user_flow.blocks.constants import (
     FORM_SKIP_FIELD_CMD,
 )
 
-STATIC_FILES_CACHE: dict[Path, bytes] = dict()
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
 
+logger = logging.getLogger(__name__)
 
-def static_file_content(path: Path) -> bytes:
-    if not path.exists():
-        raise web.HTTPNotFound(reason=f"Static path {path} does not exist")
+
+# only text-like files benefit from compression, images and fonts are already compressed
+COMPRESSIBLE_MIMETYPES = {"application/javascript", "application/json", "image/svg+xml", "application/manifest+json"}
+MIN_COMPRESSED_SIZE = 256  # bytes
+
+# Vite puts content hash in the bundled asset names, e.g. assets/index-4ed993c7.js
+FINGERPRINTED_ASSET_RE = re.compile(r"^assets/[^/]+-[\w-]{8}\.\w+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@dataclass(frozen=True)
+class StaticFile:
+    """Static file content along with its precompressed versions (encoding -> content)"""
+
+    content: bytes
+    mimetype: str | None
+    etag: str
+    encoded: dict[str, bytes]
+
+    def encoding_for(self, accept_encoding: str) -> str | None:
+        accepted: set[str] = set()
+        rejected: set[str] = set()  # explicitly, with q=0, must not be used even if "*" is accepted
+        for item in accept_encoding.split(","):
+            coding, *params = item.split(";")
+            q = 1.0
+            for param in params:
+                name, _, value = param.strip().partition("=")
+                if name == "q":
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0
+            (accepted if q > 0 else rejected).add(coding.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.encoded and (encoding in accepted or ("*" in accepted and encoding not in rejected)):
+                return encoding
+        return None
+
+
+def _compress(content: bytes, mimetype: str | None) -> dict[str, bytes]:
+    if len(content) < MIN_COMPRESSED_SIZE:
+        return {}
+    if mimetype is None or not (mimetype.startswith("text/") or mimetype in COMPRESSIBLE_MIMETYPES):
+        return {}
+    encoded = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(content, quality=11)
+    return {encoding: data for encoding, data in encoded.items() if len(data) < len(content)}
+
+
+def _read_static_file(path: Path) -> StaticFile:
+    content = path.read_bytes()
+    mimetype, _ = mimetypes.guess_type(path.name, strict=False)
+    return StaticFile(
+        content=content,
+        mimetype=mimetype,
+        etag=hashlib.sha256(content).hexdigest()[:32],
+        encoded=_compress(content, mimetype),
+    )
+
+
+STATIC_FILES_CACHE: dict[Path, StaticFile] = dict()
+
+
+def load_static_file(path: Path) -> StaticFile:
+    """Load static file from the cache or read it from disk; blocking, cache keys are resolved paths"""
+    path = path.resolve()
     cached = STATIC_FILES_CACHE.get(path)
     if cached is not None:
         return cached
-    data = path.read_bytes()
+    if not path.is_file():
+        raise web.HTTPNotFound(reason=f"Static path {path} does not exist")
+    static_file = _read_static_file(path)
     if not DEBUG:
-        STATIC_FILES_CACHE[path] = data
-    return data
+        STATIC_FILES_CACHE[path] = static_file
+    return static_file
+
+
+def static_file_content(path: Path) -> bytes:
+    return load_static_file(path).content
+
+
+def preload_static_files(static_files_dir: Path) -> None:
+    """Read and precompress all static files in advance, so that the first requests are served from memory"""
+    if DEBUG:
+        return
+    total_size = 0
+    for path in static_files_dir.rglob("*"):
+        if path.is_file():
+            total_size += len(load_static_file(path).content)
+    logger.info(f"Preloaded {len(STATIC_FILES_CACHE)} static files, {total_size / 1024:.1f} KiB in total")
+
+
+def is_fingerprinted_asset(static_file_path: str) -> bool:
+    return FINGERPRINTED_ASSET_RE.match(static_file_path) is not None
+
+
+async def static_file_response(request: web.Request, path: Path, cache_control: str) -> web.Response:
+    """
+    Serve static file in the best encoding accepted by the client, with a strong ETag per encoding;
+    conditional requests with a matching ETag get 304 Not Modified
+    """
+    path = path.resolve()
+    static_file = STATIC_FILES_CACHE.get(path)
+    if static_file is None:
+        # e.g. file added after startup or DEBUG mode, reading and compressing it off the event loop
+        static_file = await asyncio.to_thread(load_static_file, path)
+    encoding = static_file.encoding_for(request.headers.get(hdrs.ACCEPT_ENCODING, ""))
+    etag = static_file.etag if encoding is None else f"{static_file.etag}-{encoding}"
+    headers = {
+        hdrs.CACHE_CONTROL: cache_control,
+        hdrs.ETAG: f'"{etag}"',
+        hdrs.VARY: hdrs.ACCEPT_ENCODING,
+    }
+
+    if_none_match = request.headers.get(hdrs.IF_NONE_MATCH)
+    if if_none_match is not None:
+        requested_etags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+        if etag in requested_etags or "*" in requested_etags:
+            return web.Response(status=304, headers=headers)
+
+    if encoding is not None:
+        headers[hdrs.CONTENT_ENCODING] = encoding
+    return web.Response(
+        body=static_file.content if encoding is None else static_file.encoded[encoding],
+        content_type=static_file.mimetype,
+        headers=headers,
+    )
 
 
 _PREFILLED_MESSAGES_JSON: Optional[str] = None
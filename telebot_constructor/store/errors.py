@@ -1,5 +1,8 @@
 import asyncio
+import datetime
+import hashlib
 import logging
+import re
 import sys
 import time
 import traceback
@@ -8,14 +11,25 @@ from typing import Any, Awaitable, Callable, cast
 
 import pydantic
 from telebot_components.redis_utils.interface import RedisInterface
-from telebot_components.stores.generic import KeyListStore, KeyValueStore
+from telebot_components.stores.generic import (
+    KeyDictStore,
+    KeyIntegerStore,
+    KeyListStore,
+    KeyValueStore,
+)
 
 from telebot_constructor.constants import CONSTRUCTOR_PREFIX
+from telebot_constructor.store.types import BotDataUpdatedCallback
 from telebot_constructor.utils import page_params_to_redis_indices
 
 logger = logging.getLogger(__name__)
 
 
+# numbers and hex ids (user ids, message ids, object addresses, ...) vary between otherwise identical errors
+_MESSAGE_VARIABLE_PARTS_RE = re.compile(r"0x[0-9a-fA-F]+|\d+")
+_TRACEBACK_FRAME_RE = re.compile(r'File "(?P<file>[^"]+)", line (?P<line>\d+), in (?P<func>\S+)')
+
+
 class BotError(pydantic.BaseModel):
     timestamp: float
     message: str  # message used in logger.error("some message")
@@ -62,6 +76,36 @@ class BotError(pydantic.BaseModel):
             exc_traceback=exc_traceback,
         )
 
+    def message_template(self) -> str:
+        return _MESSAGE_VARIABLE_PARTS_RE.sub("<N>", self.message)
+
+    def location(self) -> str | None:
+        """Innermost traceback frame, e.g. 'telebot_constructor/blocks/error.py:20 in enter'"""
+        if self.exc_traceback is None:
+            return None
+        frames = list(_TRACEBACK_FRAME_RE.finditer(self.exc_traceback))
+        if not frames:
+            return None
+        last_frame = frames[-1]
+        return f"{last_frame['file']}:{last_frame['line']} in {last_frame['func']}"
+
+    def fingerprint(self) -> str:
+        """Identifies errors that are likely caused by the same problem"""
+        parts = [self.exc_type or "", self.message_template(), self.location() or ""]
+        return hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class BotErrorStats(pydantic.BaseModel):
+    """Aggregated info on all errors with the same fingerprint"""
+
+    fingerprint: str
+    exc_type: str | None
+    message_template: str
+    location: str | None
+    count: int = 0  # not a part of the stored stats, kept in a separate counter to be incremented atomically
+    first_seen: float
+    last_seen: float
+
 
 class BotErrorsStoreLogHandler(logging.Handler):
     def __init__(self, store: "BotErrorsStore", owner_id: str, bot_id: str) -> None:
@@ -69,7 +113,6 @@ class BotErrorsStoreLogHandler(logging.Handler):
         self.owner_id = owner_id
         self.bot_id = bot_id
         logging.Handler.__init__(self, level=logging.ERROR)
-        self._tasks: set[asyncio.Task[Any]] = set()
 
     def __eq__(self, other: Any) -> bool:
         return (
@@ -84,15 +127,15 @@ class BotErrorsStoreLogHandler(logging.Handler):
     def emit(self, record: Any) -> None:
         if not isinstance(record, logging.LogRecord):
             return
-        task = asyncio.create_task(
-            self.store.process_error(
-                owner_id=self.owner_id,
-                bot_id=self.bot_id,
-                error=BotError.from_log_record(record),
-            )
+        if self.store.is_queue_full():
+            # checking before formatting the traceback to keep error storms cheap
+            self.store.count_dropped_error()
+            return
+        self.store.enqueue_error(
+            owner_id=self.owner_id,
+            bot_id=self.bot_id,
+            error=BotError.from_log_record(record),
         )
-        task.add_done_callback(self._tasks.discard)
-        self._tasks.add(task)
 
 
 @dataclass
@@ -101,6 +144,7 @@ class BotErrorContext:
     bot_id: str
     alert_chat_id: int | str
     error: BotError
+    send_immediately: bool = False  # e.g. for test alerts, that must not be coalesced
 
 
 BotErrorCallback = Callable[[BotErrorContext], Awaitable[Any]]
@@ -109,7 +153,19 @@ BotErrorCallback = Callable[[BotErrorContext], Awaitable[Any]]
 class BotErrorsStore:
     STORE_PREFIX = f"{CONSTRUCTOR_PREFIX}/errors"
 
+    # raw errors are stored as samples: at most this many per fingerprint and per bot in each window
+    SAMPLING_WINDOW = datetime.timedelta(hours=1)
+    MAX_SAMPLES_PER_FINGERPRINT = 10
+    MAX_SAMPLES_PER_BOT = 100
+    # the oldest samples and least recently seen fingerprints are removed when these are exceeded
+    MAX_STORED_SAMPLES = 1000
+    MAX_FINGERPRINTS_PER_BOT = 100
+    # errors from log records are queued and written by a single background task in batches
+    QUEUE_SIZE = 10_000
+    WRITE_BATCH_SIZE = 100
+
     def __init__(self, redis: RedisInterface) -> None:
+        self._redis = redis
         self._bot_errors_store = KeyListStore[BotError](
             name="errors",
             prefix=self.STORE_PREFIX,
@@ -124,7 +180,46 @@ class BotErrorsStore:
             redis=redis,
             expiration_time=None,
         )
+        # for each bot, fingerprint -> aggregated stats, except for count
+        self._error_stats_store = KeyDictStore[BotErrorStats](
+            name="error-stats",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            loader=BotErrorStats.model_validate_json,
+            dumper=lambda stats: stats.model_dump_json(exclude={"count"}),
+        )
+        # owner id + bot id + fingerprint -> total number of errors
+        self._error_count_store = KeyIntegerStore(
+            name="error-count",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+        )
+        # number of errors (sampled or not) per fingerprint in the current sampling window
+        self._fingerprint_window_count_store = KeyIntegerStore(
+            name="fingerprint-window-count",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=self.SAMPLING_WINDOW,
+        )
+        # number of sampled errors per bot in the current sampling window
+        self._bot_window_samples_store = KeyIntegerStore(
+            name="bot-window-samples",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=self.SAMPLING_WINDOW,
+        )
         self.error_callback: BotErrorCallback | None = None
+        self.bot_data_updated_callback: BotDataUpdatedCallback | None = None
+
+        self._queue: asyncio.Queue[tuple[str, str, BotError]] = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._writer_task: asyncio.Task[None] | None = None
+        self.dropped_errors_count = 0
+
+    async def _bot_data_updated(self, owner_id: str, bot_id: str) -> None:
+        if self.bot_data_updated_callback is not None:
+            await self.bot_data_updated_callback(owner_id, bot_id)
 
     def _composite_key(self, owner_id: str, bot_id: str) -> str:
         return f"{owner_id}/{bot_id}"
@@ -136,24 +231,192 @@ class BotErrorsStore:
             bot_id=bot_id,
         )
 
-    async def process_error(self, owner_id: str, bot_id: str, error: BotError) -> bool:
+    def is_queue_full(self) -> bool:
+        return self._queue.full()
+
+    def count_dropped_error(self) -> None:
+        self.dropped_errors_count += 1
+        # logging only on powers of two to avoid flooding logs during the error storm
+        if self.dropped_errors_count & (self.dropped_errors_count - 1) == 0:
+            logger.warning(f"Errors queue is full, dropped {self.dropped_errors_count} errors so far")
+
+    def enqueue_error(self, owner_id: str, bot_id: str, error: BotError) -> bool:
+        """Queue error to be processed by the background writer; must be called from the event loop"""
+        try:
+            self._queue.put_nowait((owner_id, bot_id, error))
+        except asyncio.QueueFull:
+            self.count_dropped_error()
+            return False
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._write_queued_errors(), name="Bot errors writer")
+        return True
+
+    async def _write_queued_errors(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.WRITE_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                errors_by_bot: dict[tuple[str, str], list[BotError]] = {}
+                for owner_id, bot_id, error in batch:
+                    errors_by_bot.setdefault((owner_id, bot_id), []).append(error)
+                for (owner_id, bot_id), errors in errors_by_bot.items():
+                    await self.process_errors(owner_id, bot_id, errors)
+            except Exception:
+                logger.exception("Unexpected error writing queued bot errors")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def flush(self, timeout: float = 10) -> None:
+        """Wait for queued errors to be written and stop the background writer, used on shutdown"""
+        if self._writer_task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out flushing bot errors, {self._queue.qsize()} errors not written")
+        self._writer_task.cancel()
+        self._writer_task = None
+
+    async def _evict_least_recently_seen_fingerprints(self, owner_id: str, bot_id: str, count: int) -> None:
+        key = self._composite_key(owner_id, bot_id)
+        all_stats = await self._error_stats_store.list_values(key)
+        for stats in sorted(all_stats, key=lambda stats: stats.last_seen)[:count]:
+            await self._error_stats_store.remove_subkey(key, stats.fingerprint)
+            await self._error_count_store.drop(f"{key}/{stats.fingerprint}")
+
+    async def process_error(
+        self,
+        owner_id: str,
+        bot_id: str,
+        error: BotError,
+        bypass_sampling: bool = False,
+    ) -> bool:
+        return await self.process_errors(owner_id, bot_id, [error], bypass_sampling=bypass_sampling)
+
+    async def process_errors(
+        self,
+        owner_id: str,
+        bot_id: str,
+        errors: list[BotError],
+        bypass_sampling: bool = False,
+    ) -> bool:
+        """
+        Aggregate errors into per-fingerprint stats and store them as raw samples if the sampling
+        limits allow it. Sampling counters are only changed with INCR and sampling is decided from
+        the values it returns, so that the limits hold with concurrent writers. All errors are processed
+        in at most three pipelined round trips.
+        """
+        if not errors:
+            return True
         try:
             key = self._composite_key(owner_id, bot_id)
-            await self._bot_errors_store.push(key, error)
-            if self.error_callback is not None:
-                alert_chat_id = await self._alert_chat_store.load(key)
-                if alert_chat_id is not None:
+            fingerprints = [error.fingerprint() for error in errors]
+            unique_fingerprints = list(dict.fromkeys(fingerprints))
+            windows = [int(error.timestamp // self.SAMPLING_WINDOW.total_seconds()) for error in errors]
+
+            def fingerprint_window_key(fingerprint: str, window: int) -> str:
+                return self._fingerprint_window_count_store._full_key(f"{key}/{fingerprint}/{window}")
+
+            def bot_window_key(window: int) -> str:
+                return self._bot_window_samples_store._full_key(f"{key}/{window}")
+
+            async with self._redis.pipeline() as pipe:
+                await pipe.get(self._alert_chat_store._full_key(key))
+                await pipe.hlen(self._error_stats_store._full_key(key))
+                for fingerprint in unique_fingerprints:
+                    await pipe.hget(self._error_stats_store._full_key(key), fingerprint)
+                for fingerprint, window in zip(fingerprints, windows):
+                    await pipe.incr(fingerprint_window_key(fingerprint, window))
+                    await pipe.expire(fingerprint_window_key(fingerprint, window), self.SAMPLING_WINDOW)
+                alert_chat_id_dump, fingerprints_count, *rest = await pipe.execute()
+
+            stats_dumps = cast(list[bytes | None], rest[: len(unique_fingerprints)])
+            fingerprint_window_counts = cast(list[int], rest[len(unique_fingerprints) :: 2])
+
+            stats_by_fingerprint = {
+                fingerprint: self._error_stats_store.loader(dump.decode("utf-8"))
+                for fingerprint, dump in zip(unique_fingerprints, stats_dumps)
+                if dump is not None
+            }
+            new_fingerprints_count = len(unique_fingerprints) - len(stats_by_fingerprint)
+            if new_fingerprints_count > 0:
+                excess_count = cast(int, fingerprints_count) + new_fingerprints_count - self.MAX_FINGERPRINTS_PER_BOT
+                if excess_count > 0:
+                    await self._evict_least_recently_seen_fingerprints(owner_id, bot_id, count=excess_count)
+
+            # errors passing the per-fingerprint limit, the per-bot limit is checked after incrementing its counter
+            sample_candidates: list[tuple[BotError, int]] = []
+            for error, fingerprint, window, fingerprint_window_count in zip(
+                errors, fingerprints, windows, fingerprint_window_counts
+            ):
+                stats = stats_by_fingerprint.get(fingerprint)
+                if stats is not None:
+                    stats.first_seen = min(stats.first_seen, error.timestamp)
+                    stats.last_seen = max(stats.last_seen, error.timestamp)
+                else:
+                    stats_by_fingerprint[fingerprint] = BotErrorStats(
+                        fingerprint=fingerprint,
+                        exc_type=error.exc_type,
+                        message_template=error.message_template(),
+                        location=error.location(),
+                        first_seen=error.timestamp,
+                        last_seen=error.timestamp,
+                    )
+                if bypass_sampling or fingerprint_window_count <= self.MAX_SAMPLES_PER_FINGERPRINT:
+                    sample_candidates.append((error, window))
+
+            async with self._redis.pipeline() as pipe:
+                for fingerprint in fingerprints:
+                    await pipe.incr(self._error_count_store._full_key(f"{key}/{fingerprint}"))
+                # concurrent writers may overwrite each other's first/last seen timestamps here, but not counts
+                await pipe.hset(
+                    self._error_stats_store._full_key(key),
+                    mapping={
+                        fingerprint: self._error_stats_store.dumper(stats).encode("utf-8")
+                        for fingerprint, stats in stats_by_fingerprint.items()
+                    },
+                )
+                for _, window in sample_candidates:
+                    await pipe.incr(bot_window_key(window))
+                    await pipe.expire(bot_window_key(window), self.SAMPLING_WINDOW)
+                results = await pipe.execute()
+
+            bot_window_samples = cast(list[int], results[len(fingerprints) + 1 :: 2])
+            sampled_errors = [
+                error
+                for (error, _), bot_window_sample in zip(sample_candidates, bot_window_samples)
+                if bypass_sampling or bot_window_sample <= self.MAX_SAMPLES_PER_BOT
+            ]
+            if sampled_errors:
+                async with self._redis.pipeline() as pipe:
+                    await pipe.rpush(
+                        self._bot_errors_store._full_key(key),
+                        *(self._bot_errors_store.dumper(error).encode("utf-8") for error in sampled_errors),
+                    )
+                    await pipe.ltrim(self._bot_errors_store._full_key(key), -self.MAX_STORED_SAMPLES, -1)
+                    await pipe.execute()
+
+            if sampled_errors:
+                await self._bot_data_updated(owner_id, bot_id)
+            # all errors are passed to the callback, not only sampled ones, so that alerts can report
+            # accurate counts; callback is expected to coalesce them
+            if self.error_callback is not None and alert_chat_id_dump is not None:
+                alert_chat_id = self._alert_chat_store.loader(cast(bytes, alert_chat_id_dump).decode("utf-8"))
+                for error in errors:
                     await self.error_callback(
                         BotErrorContext(
                             owner_id=owner_id,
                             bot_id=bot_id,
                             alert_chat_id=alert_chat_id,
                             error=error,
+                            send_immediately=bypass_sampling,
                         )
                     )
             return True
         except Exception:
-            logger.exception(f"Error processing error: {owner_id=} {bot_id=} {error=}")
+            logger.exception(f"Error processing errors: {owner_id=} {bot_id=} {errors=}")
             return False
 
     def instrument(self, li: logging.Logger, owner_id: str, bot_id: str) -> None:
@@ -178,14 +441,44 @@ class BotErrorsStore:
             or []
         )
 
+    async def load_error_stats(self, owner_id: str, bot_id: str) -> list[BotErrorStats]:
+        """Aggregated errors stats, most recently seen first"""
+        key = self._composite_key(owner_id, bot_id)
+        stats = await self._error_stats_store.list_values(key)
+        if not stats:
+            return []
+        async with self._redis.pipeline() as pipe:
+            for s in stats:
+                await pipe.get(self._error_count_store._full_key(f"{key}/{s.fingerprint}"))
+            count_dumps = cast(list[bytes | None], await pipe.execute())
+        for s, count_dump in zip(stats, count_dumps):
+            s.count = int(count_dump.decode("utf-8")) if count_dump is not None else 0
+        return sorted(stats, key=lambda s: s.last_seen, reverse=True)
+
     async def load_alert_chat_id(self, owner_id: str, bot_id: str) -> int | str | None:
         return await self._alert_chat_store.load(key=self._composite_key(owner_id, bot_id))
 
     async def save_alert_chat_id(self, owner_id: str, bot_id: str, chat_id: int | str) -> bool:
-        return await self._alert_chat_store.save(key=self._composite_key(owner_id, bot_id), value=chat_id)
+        is_saved = await self._alert_chat_store.save(key=self._composite_key(owner_id, bot_id), value=chat_id)
+        await self._bot_data_updated(owner_id, bot_id)
+        return is_saved
 
     async def remove_alert_chat_id(self, owner_id: str, bot_id: str) -> bool:
-        return await self._alert_chat_store.drop(key=self._composite_key(owner_id, bot_id))
+        is_removed = await self._alert_chat_store.drop(key=self._composite_key(owner_id, bot_id))
+        await self._bot_data_updated(owner_id, bot_id)
+        return is_removed
+
+    async def remove_errors(self, owner_id: str, bot_id: str) -> None:
+        """Drop stored errors samples and stats of the bot, e.g. when it's deleted"""
+        key = self._composite_key(owner_id, bot_id)
+        fingerprints = await self._error_stats_store.list_subkeys(key)
+        async with self._redis.pipeline() as pipe:
+            await pipe.delete(
+                self._bot_errors_store._full_key(key),
+                self._error_stats_store._full_key(key),
+                *(self._error_count_store._full_key(f"{key}/{fingerprint}") for fingerprint in fingerprints),
+            )
+            await pipe.execute()
 
 
 @dataclass
@@ -2,13 +2,20 @@ import datetime
 import operator
 import time
 from dataclasses import dataclass
-from typing import Callable, Mapping, MutableMapping, cast
+from typing import AsyncGenerator, Callable, Mapping, MutableMapping, cast
 
 from pydantic import BaseModel
 from telebot_components.redis_utils.interface import RedisInterface
-from telebot_components.stores.generic import KeyDictStore, KeyListStore, KeyValueStore
+from telebot_components.stores.generic import (
+    KeyDictStore,
+    KeyFlagStore,
+    KeyListStore,
+    KeySetStore,
+    KeyValueStore,
+)
 
 from telebot_constructor.constants import CONSTRUCTOR_PREFIX
+from telebot_constructor.store.types import BotDataUpdatedCallback
 from telebot_constructor.utils import page_params_to_redis_indices
 
 FieldId = str
@@ -97,7 +104,14 @@ class FormResultsFilter:
 class FormResultsStore:
     STORE_PREFIX = f"{CONSTRUCTOR_PREFIX}/form-results"
 
+    # results are timestamped right before being appended, so the list is ordered by the timestamps
+    # of a single process; results appended by different processes (e.g. when a bot is moved to another
+    # host) might be out of order because of clock skew between them, so range queries start this much
+    # earlier to catch them
+    RESULTS_ORDER_TOLERANCE = 10 * 60  # sec
+
     def __init__(self, redis: RedisInterface) -> None:
+        self._redis = redis
         # list of responses/results for a particular form
         self._results_store = KeyListStore[FormResult](
             name="data",
@@ -132,6 +146,31 @@ class FormResultsStore:
             dumper=noop,
             loader=noop,
         )
+        # for each bot, set of form block ids with saved results
+        self._bot_forms_store = KeySetStore[str](
+            name="bot-forms",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            dumper=noop,
+            loader=noop,
+        )
+        # for each bot, whether forms saved before the registry was introduced have been added to it
+        self._bot_forms_registered_store = KeyFlagStore(
+            name="bot-forms-registered",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+        )
+        self.bot_data_updated_callback: BotDataUpdatedCallback | None = None
+
+    @staticmethod
+    def _bot_key(owner_id: str, bot_id: str) -> str:
+        return f"{owner_id}/{bot_id}"
+
+    async def _bot_data_updated(self, form_id: GlobalFormId) -> None:
+        if self.bot_data_updated_callback is not None:
+            await self.bot_data_updated_callback(form_id.owner_id, form_id.bot_id)
 
     def adapter_for(self, owner_id: str, bot_id: str) -> "BotSpecificFormResultsStore":
         return BotSpecificFormResultsStore(
@@ -141,7 +180,38 @@ class FormResultsStore:
         )
 
     async def save(self, form_id: GlobalFormId, result: FormResult) -> bool:
-        return (await self._results_store.push(key=form_id.as_key(), item=result)) == 1
+        is_saved = (await self._results_store.push(key=form_id.as_key(), item=result)) > 0
+        await self._bot_forms_store.add(self._bot_key(form_id.owner_id, form_id.bot_id), form_id.form_block_id)
+        await self._bot_data_updated(form_id)
+        return is_saved
+
+    async def save_form_result(
+        self,
+        form_id: GlobalFormId,
+        result: FormResult,
+        field_names: Mapping[FieldId, str],
+        prompt: str,
+    ) -> bool:
+        """Save the result along with form metadata and register the form for the bot, all in one round trip"""
+        key = form_id.as_key()
+        async with self._redis.pipeline() as pipe:
+            await pipe.rpush(
+                self._results_store._full_key(key),
+                self._results_store.dumper(result).encode("utf-8"),
+            )
+            await pipe.set(self._prompt_store._full_key(key), prompt.encode("utf-8"))
+            await pipe.sadd(
+                self._bot_forms_store._full_key(self._bot_key(form_id.owner_id, form_id.bot_id)),
+                form_id.form_block_id.encode("utf-8"),
+            )
+            if field_names:
+                await pipe.hset(
+                    self._field_names_store._full_key(key),
+                    mapping={field_id: name.encode("utf-8") for field_id, name in field_names.items()},
+                )
+            results_count, *_ = await pipe.execute()
+        await self._bot_data_updated(form_id)
+        return cast(int, results_count) > 0
 
     async def save_field_names(self, form_id: GlobalFormId, id_to_names: Mapping[str, str]) -> bool:
         return await self._field_names_store.set_multiple_subkeys(
@@ -150,13 +220,15 @@ class FormResultsStore:
         )
 
     async def save_form_title(self, form_id: GlobalFormId, title: str) -> bool:
-        return await self._title_store.save(form_id.as_key(), title)
+        is_saved = await self._title_store.save(form_id.as_key(), title)
+        await self._bot_data_updated(form_id)
+        return is_saved
 
     async def save_form_prompt(self, form_id: GlobalFormId, prompt: str) -> bool:
         return await self._prompt_store.save(form_id.as_key(), prompt)
 
-    async def list_forms(self, owner_id: str, bot_id: str) -> list[FormInfoBasic]:
-        """Returns dict of bot id -> list of form block ids with saved data"""
+    async def _register_existing_forms(self, owner_id: str, bot_id: str) -> set[str]:
+        """Add forms saved before the per-bot registry was introduced to it; done once per bot"""
         form_keys = await self._results_store.find_keys(
             pattern=GlobalFormId(
                 owner_id,
@@ -173,33 +245,81 @@ class FormResultsStore:
                 f"Parsed global form ids not matching the query: {owner_id = } {bot_id = } {invalid_form_ids = }"
             )
 
-        prompts = await self._prompt_store.load_multiple(form_keys)
-        if keys_without_prompt := [key for prompt, key in zip(prompts, form_keys) if prompt is None]:
-            raise ValueError(f"Prompt not found for keys: {keys_without_prompt}")
+        form_block_ids = {gfid.form_block_id for gfid in global_form_ids}
+        if form_block_ids:
+            await self._bot_forms_store.add_multiple(self._bot_key(owner_id, bot_id), form_block_ids)
+        await self._bot_forms_registered_store.set_flag(self._bot_key(owner_id, bot_id))
+        return form_block_ids
 
-        titles = await self._title_store.load_multiple(form_keys)
+    async def list_forms(self, owner_id: str, bot_id: str) -> list[FormInfoBasic]:
+        """Returns info on bot's forms with saved data"""
+        bot_key = self._bot_key(owner_id, bot_id)
+        async with self._redis.pipeline() as pipe:
+            await pipe.smembers(self._bot_forms_store._full_key(bot_key))
+            await pipe.exists(self._bot_forms_registered_store._full_key(bot_key))
+            form_block_id_dumps, is_registered = await pipe.execute()
+
+        if is_registered:
+            form_block_ids = {dump.decode("utf-8") for dump in cast(list[bytes], form_block_id_dumps)}
+        else:
+            form_block_ids = await self._register_existing_forms(owner_id, bot_id)
+
+        form_block_ids_ordered = sorted(form_block_ids)
+        form_keys = [
+            GlobalFormId(owner_id=owner_id, bot_id=bot_id, form_block_id=form_block_id).as_key()
+            for form_block_id in form_block_ids_ordered
+        ]
+        async with self._redis.pipeline() as pipe:
+            for key in form_keys:
+                await pipe.get(self._prompt_store._full_key(key))
+                await pipe.get(self._title_store._full_key(key))
+                await pipe.llen(self._results_store._full_key(key))
+            dumps = await pipe.execute()
+
+        prompt_dumps = cast(list[bytes | None], dumps[0::3])
+        if keys_without_prompt := [key for prompt, key in zip(prompt_dumps, form_keys) if prompt is None]:
+            raise ValueError(f"Prompt not found for keys: {keys_without_prompt}")
 
         return [
             FormInfoBasic(
-                form_block_id=global_form_id.form_block_id,
-                prompt=cast(str, prompt),  # see check above
-                title=title,
-                total_responses=await self._results_store.length(global_form_id.as_key()),
+                form_block_id=form_block_id,
+                prompt=cast(bytes, prompt_dump).decode("utf-8"),  # see check above
+                title=title_dump.decode("utf-8") if title_dump is not None else None,
+                total_responses=total_responses,
+            )
+            for form_block_id, prompt_dump, title_dump, total_responses in zip(
+                form_block_ids_ordered,
+                prompt_dumps,
+                cast(list[bytes | None], dumps[1::3]),
+                cast(list[int], dumps[2::3]),
             )
-            for global_form_id, prompt, title in zip(global_form_ids, prompts, titles)
         ]
 
     async def load_form_info(self, form_id: GlobalFormId) -> FormInfo | None:
         key = form_id.as_key()
-        prompt = await self._prompt_store.load(key)
-        if prompt is None:
+        async with self._redis.pipeline() as pipe:
+            await pipe.get(self._prompt_store._full_key(key))
+            await pipe.get(self._title_store._full_key(key))
+            # hkeys and hvals are returned in the same order for the same hash
+            await pipe.hkeys(self._field_names_store._full_key(key))
+            await pipe.hvals(self._field_names_store._full_key(key))
+            await pipe.llen(self._results_store._full_key(key))
+            prompt_dump, title_dump, field_id_dumps, field_name_dumps, total_responses = await pipe.execute()
+
+        if prompt_dump is None:
             return None  # we consider only prompt as a mandatory field, no prompt = form not found
         return FormInfo(
             form_block_id=form_id.form_block_id,
-            prompt=prompt,
-            title=await self._title_store.load(key),
-            field_names=await self._field_names_store.load(key),
-            total_responses=await self._results_store.length(key),
+            prompt=cast(bytes, prompt_dump).decode("utf-8"),
+            title=cast(bytes, title_dump).decode("utf-8") if title_dump is not None else None,
+            field_names={
+                field_id.decode("utf-8"): field_name.decode("utf-8")
+                for field_id, field_name in zip(
+                    cast(list[bytes], field_id_dumps),
+                    cast(list[bytes], field_name_dumps),
+                )
+            },
+            total_responses=cast(int, total_responses),
         )
 
     async def load_page(self, form_id: GlobalFormId, offset: int, count: int) -> list[FormResult]:
@@ -213,31 +333,77 @@ class FormResultsStore:
             or []
         )
 
-    async def load(
+    async def _timestamp_at(self, key: str, position: int) -> float | None:
+        items = await self._results_store.slice(key, start=position, end=position)
+        if not items:
+            return None
+        timestamp = items[0].get(TIMESTAMP_KEY)
+        return timestamp if isinstance(timestamp, float) else None
+
+    async def _first_position_not_older_than(self, key: str, timestamp: float) -> int:
+        """
+        Binary search over the results list, which is itself ordered by timestamp, so it serves
+        as an index for range queries: O(log n) single-item reads instead of a full scan
+        """
+        lo = 0
+        hi = await self._results_store.length(key)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_timestamp = await self._timestamp_at(key, mid)
+            # results without a timestamp are never filtered out, so we conservatively move left
+            if mid_timestamp is not None and mid_timestamp < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    async def iter_pages(
         self,
         form_id: GlobalFormId,
         filter: FormResultsFilter,
         load_page_size: int = 100,
-        max_results_count: int = 10_000,
-    ) -> tuple[list[FormResult], bool]:
+    ) -> AsyncGenerator[list[FormResult], None]:
+        """Iterate over results matching the filter in chronological order, page by page"""
         key = form_id.as_key()
-        results: list[FormResult] = []
-        start = 0
-        while len(results) < max_results_count:
+        if filter.min_timestamp is None:
+            start = 0
+        else:
+            start = await self._first_position_not_older_than(
+                key, timestamp=filter.min_timestamp - self.RESULTS_ORDER_TOLERANCE
+            )
+        while True:
             page = await self._results_store.slice(key, start, start + load_page_size - 1)
             if not page:
                 # no more results to load
-                return results, True
+                return
             start += len(page)
+            matching_results: list[FormResult] = []
             for r in page:
                 if filter.is_too_new(r):
                     # results are ordered chronologically, so we return as soon as
                     # we see the results that's too new
-                    return results, True
+                    if matching_results:
+                        yield matching_results
+                    return
                 if filter.is_too_old(r):
                     continue
-                results.append(r)
-        return results, False
+                matching_results.append(r)
+            if matching_results:
+                yield matching_results
+
+    async def load(
+        self,
+        form_id: GlobalFormId,
+        filter: FormResultsFilter,
+        load_page_size: int = 100,
+        max_results_count: int = 10_000,
+    ) -> tuple[list[FormResult], bool]:
+        results: list[FormResult] = []
+        async for page in self.iter_pages(form_id, filter, load_page_size):
+            results.extend(page)
+            if len(results) >= max_results_count:
+                return results, False
+        return results, True
 
 
 @dataclass
@@ -256,10 +422,9 @@ class BotSpecificFormResultsStore:
         prompt: str,
     ) -> bool:
         form_id = GlobalFormId(owner_id=self.owner_id, bot_id=self.bot_id, form_block_id=form_block_id)
-        return all(
-            (
-                await self.storage.save(form_id, result=form_result),
-                await self.storage.save_field_names(form_id, id_to_names=field_names),
-                await self.storage.save_form_prompt(form_id, prompt),
-            )
+        return await self.storage.save_form_result(
+            form_id,
+            result=form_result,
+            field_names=field_names,
+            prompt=prompt,
         )
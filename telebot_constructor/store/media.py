@@ -1,16 +1,23 @@
 import abc
+import asyncio
+import collections
+import datetime
+import hashlib
 import logging
 import mimetypes
 import uuid
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncGenerator, AsyncIterator
 
 import aiobotocore.client  # type: ignore
 import aiobotocore.session  # type: ignore
 import pydantic
 from telebot_components.redis_utils.interface import RedisInterface
+from telebot_components.stores.generic import KeySetStore, KeyValueStore
 
 from telebot_constructor.constants import CONSTRUCTOR_PREFIX
+from telebot_constructor.utils.store import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +34,44 @@ class Media(pydantic.BaseModel):
 
     @property
     def mimetype(self) -> str | None:
-        if self.filename is not None:
-            mimetype, _ = mimetypes.guess_type(self.filename)
-            return mimetype
-        else:
-            return None
+        return guess_mimetype(self.filename)
+
+
+def guess_mimetype(filename: str | None) -> str | None:
+    if filename is not None:
+        mimetype, _ = mimetypes.guess_type(filename)
+        return mimetype
+    else:
+        return None
+
+
+@dataclass
+class MediaStream:
+    """Media content as an async iterator of chunks, to transfer media without holding it in memory"""
+
+    chunks: AsyncGenerator[bytes, None]
+    filename: str | None
+    size: int | None = None  # in bytes, if known in advance
+
+    @property
+    def mimetype(self) -> str | None:
+        return guess_mimetype(self.filename)
+
+
+async def read_at_least(chunks: AsyncIterator[bytes], size: int | None) -> bytes:
+    """Read chunks until at least size bytes are read (or all of them if size is None) or the iterator is exhausted"""
+    if size is not None and size <= 0:
+        return b""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        if size is not None and len(buffer) >= size:
+            break
+    return bytes(buffer)
+
+
+async def _single_chunk(content: bytes) -> AsyncGenerator[bytes, None]:
+    yield content
 
 
 MediaId = str
@@ -47,6 +87,30 @@ class MediaStore(abc.ABC):
     @abc.abstractmethod
     async def delete_media(self, owner_id: str, media_id: MediaId) -> bool: ...
 
+    async def save_media_stream(
+        self, owner_id: str, chunks: AsyncIterator[bytes], filename: str | None
+    ) -> MediaId | None:
+        """Save media from a stream; by default the stream is read fully, backends may transfer it in parts"""
+        return await self.save_media(owner_id, Media(content=await read_at_least(chunks, None), filename=filename))
+
+    async def media_file_path(self, owner_id: str, media_id: MediaId) -> Path | None:
+        """Path to the local file with media content, if the store keeps it on the local filesystem"""
+        return None
+
+    async def release_media(self, owner_id: str, media_id: MediaId) -> bool | None:
+        """
+        Like delete_media, but for stores sharing stored media between several saves, tells if the media
+        is actually deleted (True) or only one of its references is removed (False); None if not found
+        """
+        return True if await self.delete_media(owner_id, media_id) else None
+
+    async def load_media_stream(self, owner_id: str, media_id: MediaId) -> MediaStream | None:
+        """Load media as a stream; by default it's loaded fully, backends may read it in parts"""
+        media = await self.load_media(owner_id, media_id)
+        if media is None:
+            return None
+        return MediaStream(chunks=_single_chunk(media.content), filename=media.filename, size=len(media.content))
+
     async def setup(self) -> None: ...
 
     async def cleanup(self) -> None: ...
@@ -108,6 +172,11 @@ class AwsS3Credentials(pydantic.BaseModel):
 
 
 class AwsS3MediaStore(MediaStore):
+    # media larger than this is uploaded with multipart upload, in parts of the same size (S3 requires
+    # all the parts except the last one to be at least 5 MiB); this bounds memory used for streaming upload
+    MULTIPART_PART_SIZE = 8 * 1024**2
+    DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
     def __init__(self, credentials: AwsS3Credentials) -> None:
         self.credentials = credentials
         self._client: aiobotocore.client.AioBaseClient | None = None
@@ -136,17 +205,25 @@ class AwsS3MediaStore(MediaStore):
             await self._client.__aexit__(None, None, None)
         self._client = None
 
+    @staticmethod
+    def _object_kwargs(filename: str | None) -> dict[str, Any]:
+        kwargs: dict[str, Any] = dict()
+        content_type = guess_mimetype(filename)
+        if content_type is not None:
+            kwargs["ContentType"] = content_type
+        if filename is not None:
+            kwargs["Metadata"] = {"filename": filename}
+        return kwargs
+
     async def save_media(self, owner_id: str, media: Media) -> MediaId | None:
+        if len(media.content) > self.MULTIPART_PART_SIZE:
+            return await self.save_media_stream(owner_id, _single_chunk(media.content), media.filename)
+
         media_id = str(uuid.uuid4())
 
         # see docs at
         # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/put_object.html
-        put_object_kwargs: dict[str, Any] = dict()
-        content_type = media.mimetype
-        if content_type is not None:
-            put_object_kwargs["ContentType"] = content_type
-        if media.filename is not None:
-            put_object_kwargs["Metadata"] = {"filename": media.filename}
+        put_object_kwargs = self._object_kwargs(media.filename)
 
         try:
             resp = await self.client.put_object(  # type: ignore
@@ -175,6 +252,92 @@ class AwsS3MediaStore(MediaStore):
                 logger.exception("Unexpected error getting an object from S3")
             return None
 
+    async def save_media_stream(
+        self, owner_id: str, chunks: AsyncIterator[bytes], filename: str | None
+    ) -> MediaId | None:
+        part = await read_at_least(chunks, self.MULTIPART_PART_SIZE + 1)
+        if len(part) <= self.MULTIPART_PART_SIZE:
+            return await self.save_media(owner_id, Media(content=part, filename=filename))
+
+        # see docs at
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/create_multipart_upload.html
+        media_id = str(uuid.uuid4())
+        key = f"{owner_id}/{media_id}"
+        try:
+            upload = await self.client.create_multipart_upload(  # type: ignore
+                Bucket=self.credentials.bucket,
+                Key=key,
+                **self._object_kwargs(filename),
+            )
+        except Exception:
+            logger.exception("Error creating multipart upload in S3 bucket")
+            return None
+        upload_id = upload["UploadId"]
+
+        try:
+            parts: list[dict[str, Any]] = []
+            buffer = part
+            while buffer:
+                # the last part may be up to twice as large to avoid uploading a tiny trailing part
+                part, buffer = buffer[: self.MULTIPART_PART_SIZE], buffer[self.MULTIPART_PART_SIZE :]
+                buffer += await read_at_least(chunks, self.MULTIPART_PART_SIZE - len(buffer))
+                if len(buffer) < self.MULTIPART_PART_SIZE:
+                    part += buffer
+                    buffer = b""
+                part_number = len(parts) + 1
+                resp = await self.client.upload_part(  # type: ignore
+                    Bucket=self.credentials.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=part,
+                )
+                parts.append({"ETag": resp["ETag"], "PartNumber": part_number})
+            await self.client.complete_multipart_upload(  # type: ignore
+                Bucket=self.credentials.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+            return media_id
+        except Exception:
+            logger.exception("Error uploading media to S3 bucket in parts, aborting the upload")
+            try:
+                await self.client.abort_multipart_upload(  # type: ignore
+                    Bucket=self.credentials.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                )
+            except Exception:
+                logger.exception("Error aborting multipart upload")
+            return None
+
+    async def load_media_stream(self, owner_id: str, media_id: MediaId) -> MediaStream | None:
+        try:
+            resp = await self.client.get_object(  # type: ignore
+                Bucket=self.credentials.bucket,
+                Key=f"{owner_id}/{media_id}",
+            )
+        except Exception as exc:
+            if exc.__class__.__name__ != "NoSuchKey":
+                logger.exception("Unexpected error getting an object from S3")
+            return None
+
+        body = resp["Body"]
+
+        async def iter_body() -> AsyncGenerator[bytes, None]:
+            try:
+                async for chunk in body.iter_chunks(self.DOWNLOAD_CHUNK_SIZE):
+                    yield chunk
+            finally:
+                body.close()
+
+        return MediaStream(
+            chunks=iter_body(),
+            filename=resp.get("Metadata", {}).get("filename"),
+            size=resp.get("ContentLength"),
+        )
+
     async def delete_media(self, owner_id: str, media_id: MediaId) -> bool:
         try:
             # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/delete_object.html
@@ -190,45 +353,423 @@ class AwsS3MediaStore(MediaStore):
 
 
 class UserSpecificMediaStore:
-    """Thin adapter to use in contexts without easy access to user"""
+    """
+    Thin adapter to use in contexts without easy access to user; created for each constructed bot,
+    so it also limits the number of concurrent media loads per bot
+    """
+
+    MAX_CONCURRENT_LOADS = 4
 
-    def __init__(self, media_store: MediaStore, owner_id: str) -> None:
+    def __init__(
+        self, media_store: MediaStore, owner_id: str, max_concurrent_loads: int = MAX_CONCURRENT_LOADS
+    ) -> None:
         self.media_store = media_store
         self.owner_id = owner_id
+        self._loads_semaphore = asyncio.Semaphore(max_concurrent_loads)
 
     async def load_media(self, media_id: MediaId) -> Media | None:
-        return await self.media_store.load_media(owner_id=self.owner_id, media_id=media_id)
+        async with self._loads_semaphore:
+            return await self.media_store.load_media(owner_id=self.owner_id, media_id=media_id)
+
+    async def load_media_multiple(self, media_ids: list[MediaId]) -> list[Media | None]:
+        """Load media concurrently (within the per-bot limit), preserving the order"""
+        return list(await asyncio.gather(*(self.load_media(media_id) for media_id in media_ids)))
 
 
 class FilesystemMediaStore(MediaStore):
+    """Store for standalone deployments; all file operations run in worker threads not to block the event loop"""
+
     def __init__(self, dir: Path) -> None:
         self._dir = dir
         assert self._dir.exists(), f"{self._dir} does not exist"
         assert self._dir.is_dir(), f"{self._dir} is not a directory"
 
     def _filename(self, owner_id: str, media_id: MediaId) -> Path:
-        owner_dir = self._dir / owner_id
-        owner_dir.mkdir(exist_ok=True)
-        return owner_dir / media_id
+        return self._dir / owner_id / media_id
+
+    def _write(self, owner_id: str, media_id: MediaId, content: bytes) -> None:
+        filename = self._filename(owner_id, media_id)
+        filename.parent.mkdir(exist_ok=True)
+        filename.write_bytes(content)
+
+    def _read(self, owner_id: str, media_id: MediaId) -> bytes | None:
+        try:
+            return self._filename(owner_id, media_id).read_bytes()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def _delete(self, owner_id: str, media_id: MediaId) -> bool:
+        filename = self._filename(owner_id, media_id)
+        if not filename.is_file():
+            return False
+        filename.unlink()
+        return True
+
+    def _existing_file(self, owner_id: str, media_id: MediaId) -> Path | None:
+        filename = self._filename(owner_id, media_id)
+        return filename if filename.is_file() else None
 
     async def save_media(self, owner_id: str, media: Media) -> MediaId | None:
         media_id = str(uuid.uuid4())
-        self._filename(owner_id, media_id).write_bytes(media.content)
+        await asyncio.to_thread(self._write, owner_id, media_id, media.content)
         return media_id
 
     async def load_media(self, owner_id: str, media_id: MediaId) -> Media | None:
-        filename = self._filename(owner_id, media_id)
-        if not filename.exists():
+        content = await asyncio.to_thread(self._read, owner_id, media_id)
+        if content is None:
             return None
-        else:
-            return Media(
-                content=filename.read_bytes(),
-                filename=None,
-            )
+        return Media(content=content, filename=None)
 
     async def delete_media(self, owner_id: str, media_id: MediaId) -> bool:
-        filename = self._filename(owner_id, media_id)
-        if not filename.exists():
-            return False
-        filename.unlink()
-        return True
+        return await asyncio.to_thread(self._delete, owner_id, media_id)
+
+    async def media_file_path(self, owner_id: str, media_id: MediaId) -> Path | None:
+        return await asyncio.to_thread(self._existing_file, owner_id, media_id)
+
+
+class CachedMediaStore(MediaStore):
+    """
+    Read-through cache in front of another media store: size-bounded in-memory LRU tier, optional
+    local disk tier (also LRU, bounded by the total size of files) and a short-lived cache of missing
+    media ids. Media is immutable once saved, so the cache is only invalidated on deletion.
+    """
+
+    def __init__(
+        self,
+        media_store: MediaStore,
+        max_memory_bytes: int = 64 * 1024**2,
+        disk_dir: Path | None = None,
+        max_disk_bytes: int = 1024**3,
+        missing_ttl: datetime.timedelta = datetime.timedelta(minutes=1),
+    ) -> None:
+        self.media_store = media_store
+        self._memory = LRUCache[Media](max_size=max_memory_bytes, sizeof=lambda media: len(media.content))
+        self._missing = LRUCache[bool](max_size=10_000, ttl=missing_ttl)
+        self._disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        # relative path -> file size, in least to most recently used order
+        self._disk_index = collections.OrderedDict[str, int]()
+        self._disk_total_bytes = 0
+        # deletions are counted to detect the ones made while media is being loaded, so that deleted media is
+        # not put back into the cache
+        self._deletion_count = 0
+        self._loads_in_flight = dict[str, int]()  # key -> number of concurrent loads
+        self._last_deletion_during_load = dict[str, int]()  # key -> deletion count
+
+    @staticmethod
+    def _key(owner_id: str, media_id: MediaId) -> str:
+        return f"{owner_id}/{media_id}"
+
+    async def setup(self) -> None:
+        await self.media_store.setup()
+        if self._disk_dir is not None:
+            self._disk_dir.mkdir(parents=True, exist_ok=True)
+            for key, size in await asyncio.to_thread(self._list_disk_tier):
+                self._disk_index_add(key, size)
+
+    async def cleanup(self) -> None:
+        await self.media_store.cleanup()
+
+    def _list_disk_tier(self) -> list[tuple[str, int]]:
+        """Returns (key, size) pairs of the files cached on disk, from the oldest to the newest"""
+        assert self._disk_dir is not None
+        files = [f for f in self._disk_dir.glob("*/*") if f.is_file() and f.suffix != ".filename"]
+        files.sort(key=lambda f: f.stat().st_mtime)
+        return [(str(f.relative_to(self._disk_dir)), f.stat().st_size) for f in files]
+
+    def _disk_index_add(self, key: str, size: int) -> None:
+        self._disk_index_remove(key)
+        self._disk_index[key] = size
+        self._disk_total_bytes += size
+
+    def _disk_index_remove(self, key: str) -> None:
+        size = self._disk_index.pop(key, None)
+        if size is not None:
+            self._disk_total_bytes -= size
+
+    def _disk_paths(self, key: str) -> tuple[Path, Path]:
+        assert self._disk_dir is not None
+        content_path = self._disk_dir / key
+        return content_path, content_path.with_name(content_path.name + ".filename")
+
+    def _read_from_disk(self, key: str) -> Media | None:
+        content_path, filename_path = self._disk_paths(key)
+        try:
+            content = content_path.read_bytes()
+        except FileNotFoundError:
+            return None
+        filename = filename_path.read_text() if filename_path.exists() else None
+        return Media(content=content, filename=filename)
+
+    def _write_to_disk(self, key: str, media: Media) -> None:
+        content_path, filename_path = self._disk_paths(key)
+        content_path.parent.mkdir(exist_ok=True)
+        content_path.write_bytes(media.content)
+        if media.filename is not None:
+            filename_path.write_text(media.filename)
+
+    def _delete_from_disk(self, keys: list[str]) -> None:
+        for key in keys:
+            for path in self._disk_paths(key):
+                path.unlink(missing_ok=True)
+
+    async def _save_to_disk_tier(self, key: str, media: Media) -> None:
+        # NOTE: disk index is only modified in the event loop thread, files are read/written in worker threads
+        await asyncio.to_thread(self._write_to_disk, key, media)
+        self._disk_index_add(key, len(media.content))
+        evicted: list[str] = []
+        while self._disk_total_bytes > self.max_disk_bytes and len(self._disk_index) > 1:
+            evicted_key = next(iter(self._disk_index))
+            self._disk_index_remove(evicted_key)
+            evicted.append(evicted_key)
+        if evicted:
+            await asyncio.to_thread(self._delete_from_disk, evicted)
+
+    async def save_media(self, owner_id: str, media: Media) -> MediaId | None:
+        return await self.media_store.save_media(owner_id, media)
+
+    async def _load_cached(self, key: str) -> tuple[bool, Media | None]:
+        """Returns (is cached, media) tuple, media is None for cached missing media"""
+        is_cached, media = self._memory.get(key)
+        if is_cached:
+            return True, media
+        is_missing, _ = self._missing.get(key)
+        if is_missing:
+            return True, None
+
+        if self._disk_dir is not None and key in self._disk_index:
+            media = await asyncio.to_thread(self._read_from_disk, key)
+            if media is not None:
+                self._disk_index.move_to_end(key)
+                self._memory.set(key, media)
+                return True, media
+            self._disk_index_remove(key)
+        return False, None
+
+    async def save_media_stream(
+        self, owner_id: str, chunks: AsyncIterator[bytes], filename: str | None
+    ) -> MediaId | None:
+        return await self.media_store.save_media_stream(owner_id, chunks, filename)
+
+    async def media_file_path(self, owner_id: str, media_id: MediaId) -> Path | None:
+        # local files are served faster directly than from the memory cache
+        return await self.media_store.media_file_path(owner_id, media_id)
+
+    async def load_media_stream(self, owner_id: str, media_id: MediaId) -> MediaStream | None:
+        is_cached, media = await self._load_cached(self._key(owner_id, media_id))
+        if is_cached:
+            if media is None:
+                return None
+            return MediaStream(chunks=_single_chunk(media.content), filename=media.filename, size=len(media.content))
+        # not populating cache here, as the stream is passed through without holding it in memory
+        return await self.media_store.load_media_stream(owner_id, media_id)
+
+    async def load_media(self, owner_id: str, media_id: MediaId) -> Media | None:
+        key = self._key(owner_id, media_id)
+        is_cached, media = await self._load_cached(key)
+        if is_cached:
+            return media
+
+        load_started_at = self._deletion_count
+        self._loads_in_flight[key] = self._loads_in_flight.get(key, 0) + 1
+        try:
+            media = await self.media_store.load_media(owner_id, media_id)
+            if self._is_deleted_since(key, load_started_at):
+                return media
+            if media is None:
+                self._missing.set(key, True)
+                return None
+            self._memory.set(key, media)
+            if self._disk_dir is not None:
+                try:
+                    await self._save_to_disk_tier(key, media)
+                    if self._is_deleted_since(key, load_started_at):
+                        self._disk_index_remove(key)
+                        await asyncio.to_thread(self._delete_from_disk, [key])
+                except Exception:
+                    logger.exception("Error writing media to the disk cache")
+            return media
+        finally:
+            self._loads_in_flight[key] -= 1
+            if self._loads_in_flight[key] == 0:
+                del self._loads_in_flight[key]
+                self._last_deletion_during_load.pop(key, None)
+
+    def _is_deleted_since(self, key: str, deletion_count: int) -> bool:
+        last_deletion = self._last_deletion_during_load.get(key)
+        return last_deletion is not None and last_deletion > deletion_count
+
+    async def delete_media(self, owner_id: str, media_id: MediaId) -> bool:
+        key = self._key(owner_id, media_id)
+        self._deletion_count += 1
+        if key in self._loads_in_flight:
+            self._last_deletion_during_load[key] = self._deletion_count
+        self._memory.remove(key)
+        if self._disk_dir is not None:
+            self._disk_index_remove(key)
+            await asyncio.to_thread(self._delete_from_disk, [key])
+        is_deleted = await self.media_store.delete_media(owner_id, media_id)
+        self._missing.set(key, True)
+        return is_deleted
+
+
+class DeduplicatingMediaStore(MediaStore):
+    """
+    Content-addressed wrapper around another media store. Saving media with the same content and
+    filename again returns the existing media id instead of storing another copy (which also reuses
+    Telegram file ids cached for it). Each save adds a reference to the media, and deleting it only
+    removes a reference; the media itself is deleted with the last reference. Media is deduplicated
+    within a single owner.
+    """
+
+    STORE_PREFIX = f"{CONSTRUCTOR_PREFIX}/media-dedup"
+    # must be longer than any save that has found the media id by its hash takes to add a reference to it
+    RELEASED_MARKER_TTL = datetime.timedelta(hours=1)
+
+    def __init__(self, media_store: MediaStore, redis: RedisInterface) -> None:
+        self.media_store = media_store
+        self._redis = redis
+        self._media_id_by_hash_store = KeyValueStore[str](
+            name="media-id-by-hash",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            dumper=str,
+            loader=str,
+        )
+        self._hash_by_media_id_store = KeyValueStore[str](
+            name="hash-by-media-id",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            dumper=str,
+            loader=str,
+        )
+        # unique token per reference, to count references with set operations
+        self._references_store = KeySetStore[str](
+            name="references",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            dumper=str,
+            loader=str,
+        )
+        # set when the last reference to the media is released, no references can be added to it after that
+        self._released_marker_store = KeyValueStore[str](
+            name="released",
+            prefix=self.STORE_PREFIX,
+            redis=redis,
+            expiration_time=self.RELEASED_MARKER_TTL,
+            dumper=str,
+            loader=str,
+        )
+
+    @staticmethod
+    def _key(owner_id: str, id_or_hash: str) -> str:
+        return f"{owner_id}/{id_or_hash}"
+
+    @staticmethod
+    def _hash_filename(hasher: "hashlib._Hash", filename: str | None) -> str:
+        hasher.update(b"\0")
+        if filename is not None:
+            hasher.update(filename.encode("utf-8"))
+        return hasher.hexdigest()
+
+    async def _add_reference(self, owner_id: str, media_id: MediaId) -> None:
+        await self._references_store.add(self._key(owner_id, media_id), str(uuid.uuid4()))
+
+    async def _find_existing(self, owner_id: str, content_hash: str) -> MediaId | None:
+        media_id = await self._media_id_by_hash_store.load(self._key(owner_id, content_hash))
+        if media_id is None:
+            return None
+        # the reference is added atomically with checking that the media has not been released meanwhile
+        key = self._key(owner_id, media_id)
+        token = str(uuid.uuid4())
+        async with self._redis.pipeline() as pipe:
+            await pipe.sadd(self._references_store._full_key(key), token.encode("utf-8"))
+            await pipe.exists(self._released_marker_store._full_key(key))
+            _, is_released = await pipe.execute()
+        if is_released:
+            # the media is being (or has been) deleted, it will be saved as new
+            await self._references_store.remove(key, token)
+            return None
+        return media_id
+
+    async def _register(self, owner_id: str, media_id: MediaId, content_hash: str) -> None:
+        await self._media_id_by_hash_store.save(self._key(owner_id, content_hash), media_id)
+        await self._hash_by_media_id_store.save(self._key(owner_id, media_id), content_hash)
+        await self._add_reference(owner_id, media_id)
+
+    async def save_media(self, owner_id: str, media: Media) -> MediaId | None:
+        content_hash = self._hash_filename(hashlib.sha256(media.content), media.filename)
+        if (existing_media_id := await self._find_existing(owner_id, content_hash)) is not None:
+            return existing_media_id
+        media_id = await self.media_store.save_media(owner_id, media)
+        if media_id is not None:
+            await self._register(owner_id, media_id, content_hash)
+        return media_id
+
+    async def save_media_stream(
+        self, owner_id: str, chunks: AsyncIterator[bytes], filename: str | None
+    ) -> MediaId | None:
+        # content hash is only known after the whole stream is read, so it's saved first and then
+        # deleted if it turns out to be a duplicate
+        hasher = hashlib.sha256()
+
+        async def hashing_chunks() -> AsyncGenerator[bytes, None]:
+            async for chunk in chunks:
+                hasher.update(chunk)
+                yield chunk
+
+        media_id = await self.media_store.save_media_stream(owner_id, hashing_chunks(), filename)
+        if media_id is None:
+            return None
+        content_hash = self._hash_filename(hasher, filename)
+        if (existing_media_id := await self._find_existing(owner_id, content_hash)) is not None:
+            await self.media_store.delete_media(owner_id, media_id)
+            return existing_media_id
+        await self._register(owner_id, media_id, content_hash)
+        return media_id
+
+    async def load_media(self, owner_id: str, media_id: MediaId) -> Media | None:
+        return await self.media_store.load_media(owner_id, media_id)
+
+    async def load_media_stream(self, owner_id: str, media_id: MediaId) -> MediaStream | None:
+        return await self.media_store.load_media_stream(owner_id, media_id)
+
+    async def media_file_path(self, owner_id: str, media_id: MediaId) -> Path | None:
+        return await self.media_store.media_file_path(owner_id, media_id)
+
+    async def release_media(self, owner_id: str, media_id: MediaId) -> bool | None:
+        key = self._key(owner_id, media_id)
+        content_hash = await self._hash_by_media_id_store.load(key)
+        if content_hash is not None:
+            references_key = self._references_store._full_key(key)
+            async with self._redis.pipeline() as pipe:
+                await pipe.spop(references_key, 1)
+                await pipe.smembers(references_key)
+                _, remaining_references = await pipe.execute()
+            if remaining_references:
+                return False
+            # a concurrent save might have found the media by its hash and be adding a reference to it, so the
+            # media is marked as released and references are checked again, atomically
+            async with self._redis.pipeline() as pipe:
+                await pipe.set(self._released_marker_store._full_key(key), b"1", ex=self.RELEASED_MARKER_TTL)
+                await pipe.smembers(references_key)
+                _, remaining_references = await pipe.execute()
+            if remaining_references:
+                await self._released_marker_store.drop(key)
+                return False
+            await self._media_id_by_hash_store.drop(self._key(owner_id, content_hash))
+            await self._hash_by_media_id_store.drop(key)
+        # otherwise, media was saved before deduplication was introduced
+        return await self.media_store.release_media(owner_id, media_id)
+
+    async def delete_media(self, owner_id: str, media_id: MediaId) -> bool:
+        return await self.release_media(owner_id, media_id) is not None
+
+    async def setup(self) -> None:
+        await self.media_store.setup()
+
+    async def cleanup(self) -> None:
+        await self.media_store.cleanup()
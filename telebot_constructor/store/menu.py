@@ -3,11 +3,15 @@ import hashlib
 from typing import Any
 
 import pydantic
+from telebot.callback_data import CallbackData
 from telebot_components.redis_utils.interface import RedisInterface
 from telebot_components.stores.generic import KeyListStore
 
 from telebot_constructor.utils.store import CachedKeyValueStore
 
+BUTTON_ACTION_CALLBACK_DATA = CallbackData("hash", prefix="action")
+NOOP_CALLBACK_DATA = CallbackData(prefix="noop")
+
 
 class ButtonActionData(pydantic.BaseModel):
     block_id: str
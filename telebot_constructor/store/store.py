@@ -1,15 +1,22 @@
+import asyncio
 import itertools
+import json
 import logging
 import time
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Optional, cast
 
+from pydantic import BaseModel
 from telebot_components.redis_utils.interface import RedisInterface
 from telebot_components.stores.generic import (
     KeyDictStore,
+    KeyIntegerStore,
     KeyListStore,
+    KeyValueStore,
     KeyVersionedValueStore,
     SetStore,
+    Version,
 )
+from telebot_components.utils import tail
 
 from telebot_constructor.app_models import BotInfo, BotVersionInfo
 from telebot_constructor.bot_config import BotConfig
@@ -22,6 +29,7 @@ from telebot_constructor.store.types import (
     BotVersion,
 )
 from telebot_constructor.utils import log_prefix
+from telebot_constructor.utils.store import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -31,10 +39,24 @@ def set_current_timestamp(data: BotConfigVersionMetadata | BotEvent):
         data["timestamp"] = time.time()
 
 
+class BotInfoSummary(BaseModel):
+    """Materialized detailed bot info, valid as long as bot's data generation has not changed"""
+
+    generation: int
+    info: BotInfo
+
+
 class Store:
     """Main Redis-based application storage class"""
 
+    # concurrency limit for rebuilding outdated bot info summaries when listing bots
+    SUMMARY_REBUILD_CONCURRENCY = 16
+    # total size of cached parsed configs, estimated as the size of their JSON dumps
+    CONFIG_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
     def __init__(self, redis: RedisInterface) -> None:
+        self._redis = redis
+
         # owner id + bot id composite key -> versioned bot config
         self._config_store = KeyVersionedValueStore[BotConfig, BotConfigVersionMetadata](
             name="config",
@@ -43,6 +65,14 @@ class Store:
             snapshot_dumper=lambda config: config.model_dump(mode="json"),
             snapshot_loader=BotConfig.model_validate,
         )
+        # owner id + bot id + absolute version index + version timestamp -> parsed config and its estimated size;
+        # saved versions are immutable and the timestamp distinguishes them from the versions of a deleted and
+        # re-created bot, so entries never need to be invalidated (even by other processes); parsed configs are
+        # shared and must not be modified by the callers
+        self._config_cache = LRUCache[tuple[BotConfig, int]](
+            max_size=self.CONFIG_CACHE_MAX_BYTES,
+            sizeof=lambda entry: entry[1],
+        )
 
         # owner id -> bot id -> currently running version
         # the version here is either:
@@ -81,8 +111,37 @@ class Store:
             loader=str,
         )
 
+        # owner id + bot id composite key -> counter incremented on every change to the bot's data
+        self._bot_data_generation_store = KeyIntegerStore(
+            name="bot-data-generation",
+            prefix=CONSTRUCTOR_PREFIX,
+            redis=redis,
+            expiration_time=None,
+        )
+        # owner id + bot id composite key -> bot info summary
+        self._bot_info_summary_store = KeyValueStore[BotInfoSummary](
+            name="bot-info-summary",
+            prefix=CONSTRUCTOR_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            dumper=BotInfoSummary.model_dump_json,
+            loader=BotInfoSummary.model_validate_json,
+        )
+
         self.form_results = FormResultsStore(redis=redis)
+        self.form_results.bot_data_updated_callback = self.bot_data_updated
         self.errors = BotErrorsStore(redis=redis)
+        self.errors.bot_data_updated_callback = self.bot_data_updated
+
+        # owner id + media id composite key -> media id of its preview
+        self._media_preview_id_store = KeyValueStore[str](
+            name="media-preview-id",
+            prefix=CONSTRUCTOR_PREFIX,
+            redis=redis,
+            expiration_time=None,
+            dumper=str,
+            loader=str,
+        )
 
     # bot config store CRUD
 
@@ -95,17 +154,28 @@ class Store:
 
     async def load_bot_config(self, owner_id: str, bot_id: str, version: BotVersion = -1) -> BotConfig | None:
         load_version = version if version != "stub" else -1
-        if res := await self._config_store.load_version(
-            self._composite_key(owner_id, bot_id),
-            version=load_version,
-        ):
-            config, _version_meta = res
-            if version == "stub":
-                return config.stub()
-            else:
-                return config
-        else:
+        key = self._composite_key(owner_id, bot_id)
+        version_store = self._config_store._version_store
+        async with self._redis.pipeline() as pipe:
+            await pipe.llen(version_store._full_key(key))
+            await pipe.lrange(version_store._full_key(key), load_version, load_version)
+            version_count, version_dumps = await pipe.execute()
+        version_count = cast(int, version_count)
+        version_dumps = cast(list[bytes], version_dumps)
+        # negative versions are counted from the latest one, resolving them to get a stable cache key
+        version_idx = load_version if load_version >= 0 else version_count + load_version
+        if not 0 <= version_idx < version_count or not version_dumps:
+            return None
+        config = self._cached_config(key, version_idx, version_store.loader(version_dumps[0].decode("utf-8")))
+        if config is None:
+            raw_versions = await self._config_store.load_raw_versions(key, start_version=version_idx)
+            config = self._config_from_raw_versions(key, version_idx, raw_versions)
+        if config is None:
             return None
+        elif version == "stub":
+            return config.stub()
+        else:
+            return config
 
     async def save_bot_config(
         self,
@@ -115,10 +185,18 @@ class Store:
         meta: BotConfigVersionMetadata,
     ) -> bool:
         set_current_timestamp(meta)
-        return await self._config_store.save(self._composite_key(owner_id, bot_id), config, meta)
+        is_saved = await self._config_store.save(self._composite_key(owner_id, bot_id), config, meta)
+        await self.bot_data_updated(owner_id, bot_id)
+        return is_saved
 
     async def remove_bot_config(self, owner_id: str, bot_id: str) -> bool:
-        return await self._config_store.drop(self._composite_key(owner_id, bot_id))
+        is_removed = await self._config_store.drop(self._composite_key(owner_id, bot_id))
+        # cached configs of the removed versions can't be hit anymore, dropping them only frees memory
+        self._config_cache.remove_prefix(self._composite_key(owner_id, bot_id) + "/")
+        await self._bot_info_summary_store.drop(self._composite_key(owner_id, bot_id))
+        await self.errors.remove_errors(owner_id, bot_id)
+        await self.bot_data_updated(owner_id, bot_id)
+        return is_removed
 
     async def bot_config_version_count(self, owner_id: str, bot_id: str) -> int:
         return await self._config_store.count_versions(self._composite_key(owner_id, bot_id))
@@ -144,10 +222,14 @@ class Store:
         return await self._running_version_store.get_subkey(owner_id, bot_id) is not None
 
     async def set_bot_not_running(self, owner_id: str, bot_id: str) -> bool:
-        return await self._running_version_store.remove_subkey(owner_id, bot_id)
+        is_removed = await self._running_version_store.remove_subkey(owner_id, bot_id)
+        await self.bot_data_updated(owner_id, bot_id)
+        return is_removed
 
     async def set_bot_running_version(self, owner_id: str, bot_id: str, version: BotVersion) -> bool:
-        return await self._running_version_store.set_subkey(owner_id, bot_id, version)
+        is_set = await self._running_version_store.set_subkey(owner_id, bot_id, version)
+        await self.bot_data_updated(owner_id, bot_id)
+        return is_set
 
     async def get_bot_running_version(self, owner_id: str, bot_id: str) -> BotVersion | None:
         return await self._running_version_store.get_subkey(owner_id, bot_id)
@@ -163,10 +245,26 @@ class Store:
 
     async def save_event(self, owner_id: str, bot_id: str, event: BotEvent) -> bool:
         set_current_timestamp(event)
-        return await self._bot_events_store.push(self._composite_key(owner_id, bot_id), event) == 1
+        is_saved = await self._bot_events_store.push(self._composite_key(owner_id, bot_id), event) == 1
+        await self.bot_data_updated(owner_id, bot_id)
+        return is_saved
+
+    async def load_last_event_timestamps(self, owner_bot_ids: list[tuple[str, str]]) -> list[float | None]:
+        """Timestamps of the last event for each of the bots, loaded in a single round trip"""
+        async with self._redis.pipeline() as pipe:
+            for owner_id, bot_id in owner_bot_ids:
+                await pipe.lrange(self._bot_events_store._full_key(self._composite_key(owner_id, bot_id)), -1, -1)
+            last_event_dumps: list[list[bytes]] = await pipe.execute()  # type: ignore
+        timestamps: list[float | None] = []
+        for dumps in last_event_dumps:
+            event = self._bot_events_store.loader(dumps[0].decode("utf-8")) if dumps else None
+            timestamps.append(event.get("timestamp") if event is not None else None)
+        return timestamps
 
     async def save_bot_display_name(self, owner_id: str, bot_id: str, display_name: str) -> bool:
-        return await self._display_names_store.set_subkey(owner_id, bot_id, display_name)
+        is_saved = await self._display_names_store.set_subkey(owner_id, bot_id, display_name)
+        await self.bot_data_updated(owner_id, bot_id)
+        return is_saved
 
     async def load_bot_display_name(self, owner_id: str, bot_id: str) -> Optional[str]:
         return await self._display_names_store.get_subkey(owner_id, bot_id)
@@ -176,17 +274,83 @@ class Store:
         INCLUDE_LAST_VERSIONS = 1
         INCLUDE_LAST_ERRORS = 3
 
-        running_version = await self.get_bot_running_version(owner_id, bot_id)
+        key = self._composite_key(owner_id, bot_id)
+        version_store = self._config_store._version_store
+
+        async def load_pipelined() -> list[Any]:
+            async with self._redis.pipeline() as pipe:
+                await pipe.hget(self._running_version_store._full_key(owner_id), bot_id)
+                await pipe.llen(version_store._full_key(key))
+                await pipe.lrange(version_store._full_key(key), -INCLUDE_LAST_VERSIONS, -1)
+                await pipe.hget(self._display_names_store._full_key(owner_id), bot_id)
+                await pipe.lrange(self._bot_events_store._full_key(key), -INCLUDE_LAST_EVENTS, -1)
+                return await pipe.execute()
+
+        # data from other stores is loaded concurrently with the pipelined reads
+        (
+            (
+                running_version_dump,
+                version_count,
+                last_version_dumps,
+                display_name_dump,
+                last_event_dumps,
+            ),
+            alert_chat_id,
+            forms_with_responses,
+            last_errors,
+        ) = await asyncio.gather(
+            load_pipelined(),
+            self.errors.load_alert_chat_id(owner_id, bot_id),
+            self.form_results.list_forms(owner_id, bot_id) if detailed else asyncio.sleep(0, result=[]),
+            (
+                self.errors.load_errors(owner_id, bot_id, offset=0, count=INCLUDE_LAST_ERRORS)
+                if detailed
+                else asyncio.sleep(0, result=[])
+            ),
+        )
+
+        version_count = cast(int, version_count)
+        if version_count == 0:
+            return None
+
+        running_version: BotVersion | None = (
+            self._running_version_store.loader(cast(bytes, running_version_dump).decode("utf-8"))
+            if running_version_dump is not None
+            else None
+        )
         if running_version == "stub":
             running_version = None
 
-        running_version_info: BotVersionInfo | None = None
+        running_version_idx: int | None = None
         if running_version is not None:
-            running_version_info_list = await self.load_version_info(
-                owner_id=owner_id,
-                bot_id=bot_id,
-                start_version=running_version,
-                end_version=running_version,
+            # running version can be stored as a negative index (e.g. -1 for the latest version)
+            running_version_idx = running_version if running_version >= 0 else version_count + running_version
+            if not 0 <= running_version_idx < version_count:
+                logger.error(
+                    f"{log_prefix(owner_id, bot_id)} Running version is out of range: "
+                    + f"{running_version=} {version_count=}"
+                )
+                running_version_idx = None
+
+        min_version = max(version_count - INCLUDE_LAST_VERSIONS, 0)
+        last_raw_versions = [
+            version_store.loader(dump.decode("utf-8")) for dump in cast(list[bytes], last_version_dumps)
+        ]
+
+        # raw versions starting from the running one (or the latest one, if the bot is not running) are needed
+        # to get running version metadata and reconstruct its config; usually they're already loaded
+        target_version_idx = running_version_idx if running_version_idx is not None else version_count - 1
+        raw_versions_from_target: list[Version[BotConfigVersionMetadata]] = []
+        if running_version_idx is not None or detailed:
+            if target_version_idx >= min_version:
+                raw_versions_from_target = last_raw_versions[target_version_idx - min_version :]
+            else:
+                raw_versions_from_target = await version_store.tail(key, start=target_version_idx) or []
+
+        running_version_info: BotVersionInfo | None = None
+        if running_version_idx is not None:
+            running_version_info_list = self._to_version_infos(
+                owner_id, bot_id, raw_versions_from_target[:1], start_version=running_version_idx
             )
             if len(running_version_info_list) == 1:
                 running_version_info = running_version_info_list[0]
@@ -196,19 +360,8 @@ class Store:
                     + f"{len(running_version_info_list)=}"
                 )
 
-        version_count = await self.bot_config_version_count(owner_id, bot_id)
-        if version_count == 0:
-            return None
-        min_version = max(version_count - INCLUDE_LAST_VERSIONS, 0)
-        last_versions = await self.load_version_info(
-            owner_id,
-            bot_id,
-            start_version=min_version,
-            end_version=None,
-        )
-
         admin_chat_ids: list[str | int] = []
-        if detailed and (config := await self.load_bot_config(owner_id, bot_id, version=running_version or -1)):
+        if detailed and (config := self._config_from_raw_versions(key, target_version_idx, raw_versions_from_target)):
             for b in config.user_flow_config.blocks:
                 if b.human_operator is not None and b.human_operator.feedback_handler_config.admin_chat_id is not None:
                     admin_chat_ids.append(b.human_operator.feedback_handler_config.admin_chat_id)
@@ -223,22 +376,148 @@ class Store:
         return BotInfo(
             owner_id=owner_id,
             bot_id=bot_id,
-            display_name=await self.load_bot_display_name(owner_id, bot_id) or bot_id,
+            display_name=(
+                self._display_names_store.loader(cast(bytes, display_name_dump).decode("utf-8"))
+                if display_name_dump is not None
+                else bot_id
+            ),
             running_version=running_version,
             running_version_info=running_version_info,
-            last_versions=last_versions,
-            last_events=(
-                await self._bot_events_store.tail(key=self._composite_key(owner_id, bot_id), start=-INCLUDE_LAST_EVENTS)
-                or []
-            ),
-            forms_with_responses=(await self.form_results.list_forms(owner_id, bot_id) if detailed else []),
-            last_errors=(
-                await self.errors.load_errors(owner_id, bot_id, offset=0, count=INCLUDE_LAST_ERRORS) if detailed else []
-            ),
+            last_versions=self._to_version_infos(owner_id, bot_id, last_raw_versions, start_version=min_version),
+            last_events=[
+                self._bot_events_store.loader(dump.decode("utf-8")) for dump in cast(list[bytes], last_event_dumps)
+            ],
+            forms_with_responses=forms_with_responses,
+            last_errors=last_errors,
             admin_chat_ids=admin_chat_ids,
-            alert_chat_id=await self.errors.load_alert_chat_id(owner_id, bot_id),
+            alert_chat_id=alert_chat_id,
         )
 
+    # materialized bot info summaries
+
+    async def bot_data_updated(self, owner_id: str, bot_id: str) -> None:
+        """Must be called on every change to the data included in bot info, invalidates bot info summary"""
+        await self._bot_data_generation_store.increment(self._composite_key(owner_id, bot_id))
+
+    async def load_bot_infos(self, owner_bot_ids: list[tuple[str, str]], detailed: bool) -> list[BotInfo | None]:
+        """
+        Bulk version of load_bot_info, reading materialized summaries in a single round trip; summaries
+        that are missing or outdated are rebuilt and saved
+        """
+        keys = [self._composite_key(owner_id, bot_id) for owner_id, bot_id in owner_bot_ids]
+        async with self._redis.pipeline() as pipe:
+            for key in keys:
+                await pipe.get(self._bot_info_summary_store._full_key(key))
+                await pipe.get(self._bot_data_generation_store._full_key(key))
+            dumps: list[bytes | None] = await pipe.execute()  # type: ignore
+
+        infos: list[BotInfo | None] = []
+        rebuild_indices: list[int] = []
+        rebuild_generations: list[int] = []
+        for idx, (summary_dump, generation_dump) in enumerate(zip(dumps[::2], dumps[1::2])):
+            generation = (
+                self._bot_data_generation_store.loader(generation_dump.decode("utf-8")) if generation_dump else 0
+            )
+            summary = self._bot_info_summary_store.loader(summary_dump.decode("utf-8")) if summary_dump else None
+            if summary is not None and summary.generation == generation:
+                infos.append(summary.info)
+            else:
+                infos.append(None)
+                rebuild_indices.append(idx)
+                rebuild_generations.append(generation)
+
+        if rebuild_indices:
+            logger.info(f"Rebuilding {len(rebuild_indices)} / {len(keys)} bot info summaries")
+            semaphore = asyncio.Semaphore(self.SUMMARY_REBUILD_CONCURRENCY)
+
+            async def rebuild(idx: int, generation: int) -> None:
+                # generation is read before the rebuild, so any concurrent update makes the new summary outdated
+                owner_id, bot_id = owner_bot_ids[idx]
+                async with semaphore:
+                    info = await self.load_bot_info(owner_id, bot_id, detailed=True)
+                    if info is not None:
+                        await self._bot_info_summary_store.save(
+                            keys[idx], BotInfoSummary(generation=generation, info=info)
+                        )
+                infos[idx] = info
+
+            await asyncio.gather(*(rebuild(idx, gen) for idx, gen in zip(rebuild_indices, rebuild_generations)))
+
+        if detailed:
+            return infos
+        else:
+            return [
+                (
+                    info.model_copy(
+                        update={
+                            "last_events": info.last_events[-1:],
+                            "forms_with_responses": [],
+                            "last_errors": [],
+                            "admin_chat_ids": [],
+                        }
+                    )
+                    if info is not None
+                    else None
+                )
+                for info in infos
+            ]
+
+    def _config_cache_key(
+        self, key: str, version_idx: int, raw_version: Version[BotConfigVersionMetadata]
+    ) -> str | None:
+        timestamp = raw_version.meta.get("timestamp") if raw_version.meta is not None else None
+        if timestamp is None:
+            # legacy versions can't be told apart from the versions of a re-created bot, so they're not cached
+            return None
+        return f"{key}/{version_idx}/{timestamp}"
+
+    def _cached_config(
+        self, key: str, version_idx: int, raw_version: Version[BotConfigVersionMetadata]
+    ) -> BotConfig | None:
+        cache_key = self._config_cache_key(key, version_idx, raw_version)
+        if cache_key is None:
+            return None
+        _, cached = self._config_cache.get(cache_key)
+        return cached[0] if cached is not None else None
+
+    def _config_from_raw_versions(
+        self, key: str, version_idx: int, raw_versions: list[Version[BotConfigVersionMetadata]]
+    ) -> BotConfig | None:
+        """
+        Reconstruct config of the first version in the list (with the given absolute index); the list must go
+        up to the latest version
+        """
+        if not raw_versions:
+            return None
+        if cached := self._cached_config(key, version_idx, raw_versions[0]):
+            return cached
+        snapshot, _ = next(tail(1, self._config_store._iter_versions(raw_versions, key=key)))
+        config = self._config_store.snapshot_loader(snapshot)
+        if (cache_key := self._config_cache_key(key, version_idx, raw_versions[0])) is not None:
+            self._config_cache.set(cache_key, (config, len(json.dumps(snapshot))))
+        return config
+
+    def _to_version_infos(
+        self,
+        owner_id: str,
+        bot_id: str,
+        raw_versions: list[Version[BotConfigVersionMetadata]],
+        start_version: int,
+    ) -> list[BotVersionInfo]:
+        version_metadata = [v.meta for v in raw_versions if v.meta is not None]
+        if len(version_metadata) != len(raw_versions):
+            logger.error(
+                f"{log_prefix(owner_id, bot_id)} Version metadata list has unexpected length: "
+                + f"{len(version_metadata) = }, {len(raw_versions) = }"
+            )
+        return [
+            BotVersionInfo(
+                version=version,
+                metadata=metadata,
+            )
+            for version, metadata in zip(itertools.count(start_version), version_metadata)
+        ]
+
     async def load_version_info(
         self, owner_id: str, bot_id: str, start_version: int, end_version: int | None
     ) -> list[BotVersionInfo]:
@@ -257,19 +536,7 @@ class Store:
             if end_version is None
             else (await self._config_store._version_store.slice(key, start=start_version, end=end_version) or [])
         )
-        version_metadata = [v.meta for v in raw_versions if v.meta is not None]
-        if len(version_metadata) != len(raw_versions):
-            logger.error(
-                f"[{owner_id}][{bot_id}] Version metadata list has unexpected length: "
-                + f"{len(version_metadata) = }, {len(raw_versions) = }"
-            )
-        return [
-            BotVersionInfo(
-                version=version,
-                metadata=metadata,
-            )
-            for version, metadata in zip(itertools.count(start_version), version_metadata)
-        ]
+        return self._to_version_infos(owner_id, bot_id, raw_versions, start_version=start_version)
 
     async def load_owner_id(self, actor_id: str, bot_id: str) -> str | None:
         if await self.is_bot_exists(actor_id, bot_id):
@@ -277,6 +544,15 @@ class Store:
 
         return None
 
+    async def save_media_preview_id(self, owner_id: str, media_id: str, preview_media_id: str) -> bool:
+        return await self._media_preview_id_store.save(self._composite_key(owner_id, media_id), preview_media_id)
+
+    async def load_media_preview_id(self, owner_id: str, media_id: str) -> str | None:
+        return await self._media_preview_id_store.load(self._composite_key(owner_id, media_id))
+
+    async def remove_media_preview_id(self, owner_id: str, media_id: str) -> bool:
+        return await self._media_preview_id_store.drop(self._composite_key(owner_id, media_id))
+
     async def save_used_token_hash(self, hash: str) -> None:
         await self._hashed_tokens_store.add(hash)
 
@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Any, Awaitable, Callable, Literal
 
 from typing_extensions import NotRequired, TypedDict
 
@@ -36,3 +36,7 @@ class BotEditedEvent(BotEventBase):
 
 
 BotEvent = BotStoppedEvent | BotDeletedEvent | BotStartedEvent | BotEditedEvent
+
+
+# invoked with owner id and bot id whenever some data shown in bot info is changed
+BotDataUpdatedCallback = Callable[[str, str], Awaitable[Any]]
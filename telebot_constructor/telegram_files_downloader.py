@@ -9,10 +9,11 @@ from typing import Optional
 from telebot import AsyncTeleBot
 from telebot_components.redis_utils.emulation import RedisEmulation
 from telebot_components.redis_utils.interface import RedisInterface
-from telebot_components.stores.generic import KeyValueStore
 
 from telebot_constructor.constants import CONSTRUCTOR_PREFIX
+from telebot_constructor.utils import hash_token
 from telebot_constructor.utils.rate_limit_retry import rate_limit_retry
+from telebot_constructor.utils.store import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -31,80 +32,109 @@ class TelegramFilesDownloader(abc.ABC):
 
 
 class RedisCacheTelegramFilesDownloader(TelegramFilesDownloader):
+    """
+    Files are cached as raw bytes, access times are tracked in a single hash (file id -> timestamp), so
+    that both a cache hit and eviction take a constant number of round trips to Redis. Concurrent cache
+    misses for the same file share a single download, failed downloads are not retried for a while.
+    """
+
     STORE_PREFIX = f"{CONSTRUCTOR_PREFIX}/files-cache"
+    EXPIRATION_TIME = datetime.timedelta(days=60)
+    FAILED_DOWNLOAD_TTL = datetime.timedelta(minutes=1)
 
     def __init__(self, redis: RedisInterface, max_cached: int = 1024) -> None:
         self.redis = redis
         self.max_cached = max_cached
-        self.cached_files_storage = KeyValueStore[str](
-            name="tg-file",
-            prefix=self.STORE_PREFIX,
-            redis=redis,
-            expiration_time=datetime.timedelta(days=60),
-            dumper=str,
-            loader=str,
-        )
-        self.last_accessed_storage = KeyValueStore[float](
-            name="tg-file-last-accessed",
-            prefix=self.STORE_PREFIX,
-            redis=redis,
-            expiration_time=datetime.timedelta(days=60),
-        )
+        self._access_times_key = f"{self.STORE_PREFIX}/tg-file-access-times"
         self._task: asyncio.Task[None] | None = None
+        # bot token hash + file id -> download task
+        self._downloads_in_flight: dict[str, asyncio.Task[bytes | None]] = {}
+        self._failed_downloads = LRUCache[bool](max_size=10_000, ttl=self.FAILED_DOWNLOAD_TTL)
+
+    def _file_key(self, file_id: str) -> str:
+        return f"{self.STORE_PREFIX}/tg-file-content/{file_id}"
+
+    async def _load_cached(self, file_id: str) -> bytes | None:
+        """Load file from cache, refreshing its expiration and access time"""
+        file_key = self._file_key(file_id)
+        async with self.redis.pipeline() as pipe:
+            await pipe.get(file_key)
+            await pipe.expire(file_key, self.EXPIRATION_TIME)
+            file_bytes, _ = await pipe.execute()
+        if file_bytes is None:
+            return None
+        # access time is recorded only for cached files, otherwise they would be counted in the cache size
+        async with self.redis.pipeline() as pipe:
+            await self._record_access(pipe, file_id)
+            await pipe.execute()
+        return file_bytes  # type: ignore
+
+    async def _record_access(self, pipe: RedisInterface, file_id: str) -> None:
+        await pipe.hset(self._access_times_key, file_id, str(time.time()).encode("utf-8"))
+        await pipe.expire(self._access_times_key, self.EXPIRATION_TIME)
+
+    async def _download(self, bot: AsyncTeleBot, file_id: str) -> bytes | None:
+        try:
+            async for attempt in rate_limit_retry():
+                with attempt:
+                    file = await bot.get_file(file_id)
+                    file_bytes = await bot.download_file(file_path=file.file_path)
+            async with self.redis.pipeline() as pipe:
+                await pipe.set(self._file_key(file_id), file_bytes, ex=self.EXPIRATION_TIME)
+                await self._record_access(pipe, file_id)
+                await pipe.execute()
+            return file_bytes
+        except Exception:
+            logger.info("Error downloading file, ignoring", exc_info=True)
+            return None
+
+    async def _download_once(self, bot: AsyncTeleBot, file_id: str) -> bytes | None:
+        key = f"{hash_token(bot.token)}/{file_id}"
+        is_failed, _ = self._failed_downloads.get(key)
+        if is_failed:
+            return None
+        task = self._downloads_in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._download(bot, file_id), name=f"Downloading Telegram file {file_id}")
+            self._downloads_in_flight[key] = task
+
+            def on_download_done(task: asyncio.Task[bytes | None]) -> None:
+                self._downloads_in_flight.pop(key, None)
+                if not task.cancelled() and task.exception() is None and task.result() is None:
+                    self._failed_downloads.set(key, True)
+
+            task.add_done_callback(on_download_done)
+        # shielding the download so that one of the waiting requests being cancelled doesn't affect others
+        return await asyncio.shield(task)
 
     async def get_base64_file(self, bot: AsyncTeleBot, file_id: str) -> str | None:
-        cached_b64 = await self.cached_files_storage.load(file_id)
-        await self.last_accessed_storage.save(file_id, time.time())
-        if cached_b64 is not None:
-            await self.cached_files_storage.touch(file_id)
-            return cached_b64
-        else:
-            try:
-                async for attempt in rate_limit_retry():
-                    with attempt:
-                        file = await bot.get_file(file_id)
-                        file_bytes = await bot.download_file(file_path=file.file_path)
-                file_b64 = base64.b64encode(file_bytes).decode("utf-8")
-                await self.cached_files_storage.save(file_id, file_b64)
-                return file_b64
-            except Exception:
-                logger.info("Error downloading file, ignoring", exc_info=True)
-                return None
+        file_bytes = await self._load_cached(file_id)
+        if file_bytes is None:
+            file_bytes = await self._download_once(bot, file_id)
+        if file_bytes is None:
+            return None
+        return base64.b64encode(file_bytes).decode("utf-8")
 
     async def _evict_extra_cached_files(self) -> None:
-        cached_file_ids = await self.cached_files_storage.list_keys()
-        total_cached_count = len(cached_file_ids)
-        if total_cached_count < self.max_cached:
+        # NOTE: the access times hash may contain ids of already expired files, they are the oldest
+        # ones and are evicted first
+        cached_count = await self.redis.hlen(self._access_times_key)
+        if cached_count <= self.max_cached:
             return
-        logger.info(
-            f"Cached files count ({total_cached_count}) exceeds the limit ({self.max_cached}), starting cleanup"
+        logger.info(f"Cached files count ({cached_count}) exceeds the limit ({self.max_cached}), starting cleanup")
+        access_times = await self.redis.hgetall(self._access_times_key)
+        access_order = sorted(
+            ((file_id.decode("utf-8"), float(t)) for file_id, t in access_times.items()),
+            key=lambda id_time: id_time[1],
         )
-        last_accessed_times: dict[str, float] = dict()
-        evict_file_ids: set[str] = set()
-        for cached_file_id in cached_file_ids:
-            last_used = await self.last_accessed_storage.load(cached_file_id)
-            if last_used is None:
-                evict_file_ids.add(cached_file_id)
-            else:
-                last_accessed_times[cached_file_id] = last_used
-        if evict_file_ids:
-            logger.info(f"Last access time not found for {len(evict_file_ids)} files, will evict them")
-
-        access_order = sorted(last_accessed_times.items(), key=lambda key_time: key_time[1])
-        evict_count = total_cached_count - self.max_cached
-        evict_file_ids.union(file_id for file_id, _ in access_order[:evict_count])
-        logger.info(f"Will evict a total of {len(evict_file_ids)} files")
-
-        evicted_count = 0
-        for file_id in evict_file_ids:
-            try:
-                await self.last_accessed_storage.drop(file_id)
-                await self.cached_files_storage.drop(file_id)
-                evicted_count += 1
-            except Exception:
-                logger.info(f"Error evicting file {file_id!r}, ignoring", exc_info=True)
-
-        logger.info(f"Eviction completed ({evicted_count} / {len(evict_file_ids)} successful)")
+        evict_file_ids = [file_id for file_id, _ in access_order[: len(access_order) - self.max_cached]]
+        if not evict_file_ids:
+            return
+        async with self.redis.pipeline() as pipe:
+            await pipe.delete(*(self._file_key(file_id) for file_id in evict_file_ids))
+            await pipe.hdel(self._access_times_key, *evict_file_ids)
+            await pipe.execute()
+        logger.info(f"Evicted {len(evict_file_ids)} files")
 
     async def _evict_extra_cached_in_background(self) -> None:
         while True:
@@ -8,7 +8,6 @@ from typing import List, Optional
 from telebot import AsyncTeleBot
 from telebot_components.redis_utils.interface import RedisInterface
 from telebot_components.stores.banned_users import BannedUsersStore
-from telebot_components.stores.generic import KeyValueStore
 
 from telebot_constructor.store.errors import BotSpecificErrorsStore
 from telebot_constructor.store.form_results import BotSpecificFormResultsStore
@@ -18,6 +17,10 @@ from telebot_constructor.user_flow.blocks.base import UserFlowBlock
 from telebot_constructor.user_flow.blocks.form import FormBlock
 from telebot_constructor.user_flow.blocks.human_operator import HumanOperatorBlock
 from telebot_constructor.user_flow.blocks.language_select import LanguageSelectBlock
+from telebot_constructor.user_flow.dispatcher import (
+    ActiveBlockDispatcher,
+    InlineMenuRouter,
+)
 from telebot_constructor.user_flow.entrypoints.base import UserFlowEntryPoint
 from telebot_constructor.user_flow.entrypoints.command import CommandEntryPoint
 from telebot_constructor.user_flow.types import (
@@ -27,6 +30,7 @@ from telebot_constructor.user_flow.types import (
     UserFlowSetupContext,
 )
 from telebot_constructor.utils import validate_unique
+from telebot_constructor.utils.store import WriteThroughCachedKeyValueStore
 
 logger = logging.getLogger(__name__)
 
@@ -36,8 +40,10 @@ class UserFlow:
     entrypoints: List[UserFlowEntryPoint]
     blocks: List[UserFlowBlock]
 
+    ACTIVE_BLOCK_CACHE_SIZE = 10_000  # users per bot
+
     def __post_init__(self) -> None:
-        self._active_block_id_store: Optional[KeyValueStore[str]] = None
+        self._active_block_id_store: Optional[WriteThroughCachedKeyValueStore[str]] = None
 
         validate_unique([b.block_id for b in self.blocks], items_name="block ids")
         validate_unique([e.entrypoint_id for e in self.entrypoints], items_name="entrypoint ids")
@@ -85,7 +91,7 @@ class UserFlow:
         validate_unique([b.form_name for b in self.blocks if isinstance(b, FormBlock)], items_name="form names")
 
     @property
-    def active_block_id_store(self) -> KeyValueStore[str]:
+    def active_block_id_store(self) -> WriteThroughCachedKeyValueStore[str]:
         if self._active_block_id_store is None:
             raise RuntimeError("Active block id is not properly initialized, probably accessed before setup")
         return self._active_block_id_store
@@ -118,18 +124,23 @@ class UserFlow:
         errors_store: BotSpecificErrorsStore,
         media_store: UserSpecificMediaStore | None,
         owner_chat_id: int,
+        warm_up_media_file_ids: bool = False,
     ) -> SetupResult:
-        self._active_block_id_store = KeyValueStore[str](
+        # active block is checked by many filters on every update, so it's cached in memory; the bot
+        # runs in a single process, so write-through cache is never stale
+        self._active_block_id_store = WriteThroughCachedKeyValueStore[str](
             name="user-flow-active-block",
             prefix=bot_prefix,
             redis=redis,
             expiration_time=datetime.timedelta(days=14),
             dumper=str,
             loader=str,
+            cache_size=self.ACTIVE_BLOCK_CACHE_SIZE,
         )
 
         # setting up flow elements
         setup_result = SetupResult.empty()
+        menu_metadata_store = MenuMetadataStore(redis, bot_prefix)
         setup_context = UserFlowSetupContext(
             bot_prefix=bot_prefix,
             bot=bot,
@@ -138,12 +149,18 @@ class UserFlow:
             errors_store=errors_store,
             banned_users_store=banned_users_store,
             media_store=media_store,
-            menu_metadata_store=MenuMetadataStore(redis, bot_prefix),
+            menu_metadata_store=menu_metadata_store,
             feedback_handlers=dict(),
             language_store=None,  # set later, when landuage select blocks are set up
             enter_block=self._enter_block,
             get_active_block_id=self._get_active_block_id,
+            active_block_dispatcher=ActiveBlockDispatcher(get_active_block_id=self._get_active_block_id),
+            inline_menu_router=InlineMenuRouter(
+                load_action=menu_metadata_store.button_action_store.load,
+                save_actions=menu_metadata_store.button_action_store.save_multiple,
+            ),
             owner_chat_id=owner_chat_id,
+            warm_up_media_file_ids=warm_up_media_file_ids,
         )
         setup_block_ids: set[str] = set()
 
@@ -181,4 +198,6 @@ class UserFlow:
                 raise ValueError(f"Error setting up {block}: {e}") from e
             setup_result.merge(block_setup_result)
 
+        setup_context.active_block_dispatcher.setup(bot)
+        await setup_context.inline_menu_router.setup(bot)
         return setup_result
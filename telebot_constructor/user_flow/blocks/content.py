@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from typing import Any, Optional
 
 from pydantic import BaseModel
+from telebot import AsyncTeleBot
 from telebot import types as tg
 from telebot_components.language import any_text_to_str, vaildate_singlelang_text
 from telebot_components.stores.generic import KeyValueStore
@@ -140,6 +141,29 @@ class ContentBlock(UserFlowBlock):
             next_block_id=next_block_id,
         )
 
+    async def _prepare_attachments(self, content: Content) -> "list[PreparedAttachment]":
+        """Load attachments' sources: Telegram file ids from cache in one go, media from storage concurrently"""
+        if not content.attachments:
+            return []
+        media_ids = [attachment.media_id() for attachment in content.attachments]
+        sources: list[str | Media | None] = list(await self._tg_file_id_by_media_id_store.load_multiple(media_ids))
+
+        missing_idx = [idx for idx, source in enumerate(sources) if source is None]
+        if missing_idx and self._media_store is not None:
+            loaded_media = await self._media_store.load_media_multiple([media_ids[idx] for idx in missing_idx])
+            for idx, media in zip(missing_idx, loaded_media):
+                if media is None:
+                    self._logger.error(
+                        f"Failed to load media from the store: {media_ids[idx]}; will proceed without it"
+                    )
+                sources[idx] = media
+
+        return [
+            PreparedAttachment(attachment=attachment, source=source)
+            for attachment, source in zip(content.attachments, sources)
+            if source is not None
+        ]
+
     async def enter(self, context: UserFlowContext) -> None:
         chat_id = context.chat.id if context.chat is not None else context.user.id
         language = (
@@ -148,23 +172,7 @@ class ContentBlock(UserFlowBlock):
         for content in self.contents:
             parse_mode = content.text.markup.parse_mode() if content.text is not None else None
 
-            # preparing attachments: either loading from cache or from storage
-            prepared_attachments: list[PreparedAttachment] = []
-            for attachment in content.attachments:
-                source: str | Media | None = await self._tg_file_id_by_media_id_store.load(attachment.media_id())
-                if source is None and self._media_store is not None:
-                    source = await self._media_store.load_media(attachment.media_id())
-                    if source is None:
-                        self._logger.error(
-                            f"Failed to load media from the store: {attachment.media_id()}; will proceed without it"
-                        )
-                if source is not None:
-                    prepared_attachments.append(
-                        PreparedAttachment(
-                            attachment=attachment,
-                            source=source,
-                        )
-                    )
+            prepared_attachments = await self._prepare_attachments(content)
             self._logger.debug("Prepared attachments: %s", prepared_attachments)
 
             if not prepared_attachments:
@@ -227,6 +235,7 @@ class ContentBlock(UserFlowBlock):
                         + f"({len(messages) = }, {len(prepared_attachments) = })"
                     )
 
+                new_file_ids: dict[str, str] = {}
                 for message, pa in zip(messages, prepared_attachments):
                     if isinstance(pa.source, str):
                         # already cached
@@ -236,11 +245,31 @@ class ContentBlock(UserFlowBlock):
                         continue
                     new_file_id = message.photo[0].file_id
                     self._logger.debug(f"Caching Telegram file_id for attachment: {pa} -> {new_file_id}")
-                    await self._tg_file_id_by_media_id_store.save(pa.attachment.media_id(), new_file_id)
+                    new_file_ids[pa.attachment.media_id()] = new_file_id
+                if new_file_ids:
+                    await self._tg_file_id_by_media_id_store.save_multiple(new_file_ids)
 
         if self.next_block_id is not None:
             await context.enter_block(self.next_block_id, context)
 
+    async def warm_up_file_ids(self, bot: AsyncTeleBot, chat_id: int) -> None:
+        """
+        Upload attachments without cached Telegram file ids once (as silent messages to the given chat,
+        deleted right away), so that the first users entering the block get them by file id
+        """
+        for content in self.contents:
+            for pa in await self._prepare_attachments(content):
+                if isinstance(pa.source, str):
+                    continue
+                try:
+                    message = await bot.send_photo(chat_id=chat_id, photo=pa.source.content, disable_notification=True)
+                    if message.photo is None:
+                        continue
+                    await self._tg_file_id_by_media_id_store.save(pa.attachment.media_id(), message.photo[0].file_id)
+                    await bot.delete_message(chat_id=chat_id, message_id=message.id)
+                except Exception as e:
+                    self._logger.info(f"Error uploading attachment {pa} in advance, will upload it on demand: {e!r}")
+
     async def setup(self, context: UserFlowSetupContext) -> SetupResult:
         self._logger = context.make_instrumented_logger(__name__, self.block_id)
         self._tg_file_id_by_media_id_store = KeyValueStore[str](
@@ -264,7 +293,14 @@ class ContentBlock(UserFlowBlock):
 
         self._media_store = context.media_store
 
-        return SetupResult.empty()
+        setup_result = SetupResult.empty()
+        if (
+            context.warm_up_media_file_ids
+            and self._media_store is not None
+            and any(c.attachments for c in self.contents)
+        ):
+            setup_result.background_jobs.append(self.warm_up_file_ids(context.bot, chat_id=context.owner_chat_id))
+        return setup_result
 
 
 def md5_hash(data: str) -> str:
@@ -1,16 +1,19 @@
+from dataclasses import dataclass
 from typing import Any
 
 from pydantic import BaseModel
 from telebot import types as tg
 from telebot.api import ApiHTTPException
-from telebot.callback_data import CallbackData
-from telebot.types import constants as tgconst
 from telebot.types import service as tgservice
-from telebot_components.language import any_text_to_str
+from telebot_components.language import LanguageData, any_text_to_str
 from telebot_components.menu.menu import MenuMechanism
 from telebot_components.utils import TextMarkup
 
-from telebot_constructor.store.menu import ButtonActionData
+from telebot_constructor.store.menu import (
+    BUTTON_ACTION_CALLBACK_DATA,
+    NOOP_CALLBACK_DATA,
+    ButtonActionData,
+)
 from telebot_constructor.user_flow.blocks.base import UserFlowBlock
 from telebot_constructor.user_flow.types import (
     MenuBlocksContext,
@@ -21,9 +24,6 @@ from telebot_constructor.user_flow.types import (
 from telebot_constructor.utils import preprocess_for_telegram, without_nones
 from telebot_constructor.utils.pydantic import LocalizableText
 
-BUTTON_ACTION_CALLBACK_DATA = CallbackData("hash", prefix="action")
-NOOP_CALLBACK_DATA = CallbackData(prefix="noop")
-
 
 class MenuItem(BaseModel):
     label: LocalizableText
@@ -63,6 +63,13 @@ class Menu(BaseModel):
         self._text_preprocessed = preprocess_for_telegram(self.text, self.markup)
 
 
+@dataclass(frozen=True)
+class _RenderedMenu:
+    text: str
+    reply_markup: tg.ReplyMarkup
+    reply_markup_with_back: tg.ReplyMarkup
+
+
 class MenuBlock(UserFlowBlock):
     menu: Menu
 
@@ -78,77 +85,96 @@ class MenuBlock(UserFlowBlock):
         else:
             return f"u{user_id}"
 
-    async def enter(self, context: UserFlowContext) -> None:
-        user = context.user
-        language = None if self._language_store is None else await self._language_store.get_user_language(context.user)
-        is_nested_menu = context.menu_blocks_ctx is not None
-        updateable_message_id = (
-            context.menu_blocks_ctx.updateable_message_id if context.menu_blocks_ctx is not None else None
+    def _render(self, language: LanguageData | None) -> _RenderedMenu:
+        labels = [any_text_to_str(item.label, language) for item in self.menu.items]
+        back_label = (
+            any_text_to_str(self.menu.config.back_label, language) if self.menu.config.back_label is not None else None
         )
-        history_session_id = self._history_session_id(user.id, updateable_message_id)
-        if history_session_id is not None and not is_nested_menu:
-            await self._metadata_store.user_history_store.drop(history_session_id)
-
-        can_go_back = (
-            is_nested_menu
-            and history_session_id is not None
-            and (await self._metadata_store.user_history_store.length(history_session_id) > 0)
-        )
-        if history_session_id is not None:
-            await self._metadata_store.user_history_store.push(history_session_id, self.block_id)
 
         if self.menu.config.mechanism.is_inline_kbd():
             inline_buttons: list[tg.InlineKeyboardButton] = []
-            button_actions = dict[str, ButtonActionData]()
-            for menu_item in self.menu.items:
+            for menu_item, label in zip(self.menu.items, labels):
                 if menu_item.next_block_id is not None:
                     action = ButtonActionData(block_id=self.block_id, route_to_block_id=menu_item.next_block_id)
-                    button_actions[action.md5_hash] = action
                     inline_buttons.append(
                         tg.InlineKeyboardButton(
-                            text=any_text_to_str(menu_item.label, language),
+                            text=label,
                             callback_data=BUTTON_ACTION_CALLBACK_DATA.new(action.md5_hash),
                         )
                     )
                 elif menu_item.link_url is not None:
-                    inline_buttons.append(
-                        tg.InlineKeyboardButton(
-                            text=any_text_to_str(menu_item.label, language),
-                            url=menu_item.link_url,
-                        )
-                    )
+                    inline_buttons.append(tg.InlineKeyboardButton(text=label, url=menu_item.link_url))
                 else:
                     inline_buttons.append(
                         tg.InlineKeyboardButton(
-                            text=any_text_to_str(menu_item.label, language),
+                            text=label,
                             callback_data=NOOP_CALLBACK_DATA.new(),  # type: ignore
                         )
                     )
-
-            if can_go_back and self.menu.config.back_label is not None:
-                action = ButtonActionData(block_id=self.block_id, route_to_block_id=None)
-                button_actions[action.md5_hash] = action
-                inline_buttons.append(
-                    tg.InlineKeyboardButton(
-                        text=any_text_to_str(self.menu.config.back_label, language),
-                        callback_data=BUTTON_ACTION_CALLBACK_DATA.new(action.md5_hash),
-                    )
-                )
-
             reply_markup: tg.ReplyMarkup = tg.InlineKeyboardMarkup(keyboard=[[button] for button in inline_buttons])
-            await self._metadata_store.button_action_store.save_multiple(button_actions)
+            reply_markup_with_back = reply_markup
+            if back_label is not None:
+                back_action = ButtonActionData(block_id=self.block_id, route_to_block_id=None)
+                back_button = tg.InlineKeyboardButton(
+                    text=back_label,
+                    callback_data=BUTTON_ACTION_CALLBACK_DATA.new(back_action.md5_hash),
+                )
+                reply_markup_with_back = tg.InlineKeyboardMarkup(
+                    keyboard=[[button] for button in inline_buttons] + [[back_button]]
+                )
         else:
-            reply_markup = tg.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-            for item in self.menu.items:
-                reply_markup.add(tg.KeyboardButton(text=any_text_to_str(item.label, language)))
-            if self.menu.config.back_label is not None and can_go_back:
-                reply_markup.add(tg.KeyboardButton(text=any_text_to_str(self.menu.config.back_label, language)))
+
+            def reply_keyboard(with_back: bool) -> tg.ReplyKeyboardMarkup:
+                markup = tg.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+                for label in labels:
+                    markup.add(tg.KeyboardButton(text=label))
+                if with_back and back_label is not None:
+                    markup.add(tg.KeyboardButton(text=back_label))
+                return markup
+
+            reply_markup = reply_keyboard(with_back=False)
+            reply_markup_with_back = reply_keyboard(with_back=True)
+
+        return _RenderedMenu(
+            text=any_text_to_str(self.menu._text_preprocessed, language),
+            reply_markup=reply_markup,
+            reply_markup_with_back=reply_markup_with_back,
+        )
+
+    def _get_rendered(self, language: LanguageData | None) -> _RenderedMenu:
+        rendered = self._rendered_by_language.get(language)
+        if rendered is None:
+            rendered = self._render(language)
+            self._rendered_by_language[language] = rendered
+        return rendered
+
+    async def enter(self, context: UserFlowContext) -> None:
+        user = context.user
+        language = None if self._language_store is None else await self._language_store.get_user_language(context.user)
+        is_nested_menu = context.menu_blocks_ctx is not None
+        updateable_message_id = (
+            context.menu_blocks_ctx.updateable_message_id if context.menu_blocks_ctx is not None else None
+        )
+        history_session_id = self._history_session_id(user.id, updateable_message_id)
+        if history_session_id is not None and not is_nested_menu:
+            await self._metadata_store.user_history_store.drop(history_session_id)
+
+        can_go_back = (
+            is_nested_menu
+            and history_session_id is not None
+            and (await self._metadata_store.user_history_store.length(history_session_id) > 0)
+        )
+        if history_session_id is not None:
+            await self._metadata_store.user_history_store.push(history_session_id, self.block_id)
+
+        rendered = self._get_rendered(language)
+        reply_markup = rendered.reply_markup_with_back if can_go_back else rendered.reply_markup
 
         if updateable_message_id is not None and self.menu.config.mechanism.is_updateable():
             try:
                 await context.bot.edit_message_text(
                     chat_id=user.id,
-                    text=any_text_to_str(self.menu._text_preprocessed, language),
+                    text=rendered.text,
                     parse_mode=self.menu.markup.parse_mode(),
                     message_id=updateable_message_id,
                     reply_markup=reply_markup,
@@ -160,7 +186,7 @@ class MenuBlock(UserFlowBlock):
 
         new_message = await context.bot.send_message(
             chat_id=user.id,
-            text=any_text_to_str(self.menu._text_preprocessed, language),
+            text=rendered.text,
             parse_mode=self.menu.markup.parse_mode(),
             reply_markup=reply_markup,
             disable_web_page_preview=self.menu.disable_link_preview,
@@ -172,6 +198,16 @@ class MenuBlock(UserFlowBlock):
                     self.block_id,
                 )
 
+    def _possible_button_actions(self) -> list[ButtonActionData]:
+        actions = [
+            ButtonActionData(block_id=self.block_id, route_to_block_id=item.next_block_id)
+            for item in self.menu.items
+            if item.next_block_id is not None
+        ]
+        if self.menu.config.back_label is not None:
+            actions.append(ButtonActionData(block_id=self.block_id, route_to_block_id=None))
+        return actions
+
     async def get_back_destination(self, history_id: str) -> str | None:
         # NOTE: to understand why 2 pops are needed, consider two-level menu A->B
         # - user enters A, "A" is pushed into history
@@ -187,25 +223,25 @@ class MenuBlock(UserFlowBlock):
         self._language_store = context.language_store
         self._metadata_store = context.menu_metadata_store
 
-        @context.bot.callback_query_handler(callback_data=BUTTON_ACTION_CALLBACK_DATA, auto_answer=True)  # type: ignore
-        async def handle_inline_menu(call: tg.CallbackQuery) -> tgservice.HandlerResult | None:
-            cbk_data = BUTTON_ACTION_CALLBACK_DATA.parse(call.data)
-            action = await self._metadata_store.button_action_store.load(cbk_data["hash"])
-            if action is None:
-                return None
-            if action.block_id != self.block_id:
-                # the button was created by a different menu block and should be handled from there
-                return tgservice.HandlerResult(continue_to_other_handlers=True)
+        # menu texts and keyboards only depend on the user's language, so they are rendered once here;
+        # button actions are persisted by the inline menu router, also once per setup
+        self._rendered_by_language: dict[LanguageData | None, _RenderedMenu] = {}
+        languages: list[LanguageData | None] = [None]
+        if self._language_store is not None:
+            languages = list(self._language_store.languages)
+        for language in languages:
+            self._get_rendered(language)
 
+        async def handle_button_action(action: ButtonActionData, call: tg.CallbackQuery) -> None:
             if action.route_to_block_id is not None:
                 next_block_id = action.route_to_block_id
             else:
                 history_id = self._history_session_id(call.from_user.id, call.message.id)
                 if history_id is None:
-                    return None
+                    return
                 maybe_next_block_id = await self.get_back_destination(history_id)
                 if maybe_next_block_id is None:
-                    return None
+                    return
                 else:
                     next_block_id = maybe_next_block_id
             await context.enter_block(
@@ -220,18 +256,15 @@ class MenuBlock(UserFlowBlock):
                     last_update_content=call,
                 ),
             )
-            return None
 
-        @context.bot.message_handler(
-            priority=1000,
-            chat_types=[tgconst.ChatType.private],
-            func=context.active_block_filter(self.block_id),
-        )  # type: ignore
+        context.inline_menu_router.register_menu(
+            self.block_id,
+            handler=handle_button_action,
+            actions=self._possible_button_actions(),
+        )
+
         async def maybe_handle_reply_menu(message: tg.Message) -> tgservice.HandlerResult | None:
             passthrough = tgservice.HandlerResult(continue_to_other_handlers=True)
-            if self.menu.config.mechanism is not MenuMechanism.REPLY_KEYBOARD:
-                return passthrough
-
             next_block_ctx = UserFlowContext.from_setup_context(
                 context,
                 user=message.from_user,
@@ -262,8 +295,7 @@ class MenuBlock(UserFlowBlock):
 
             return passthrough
 
-        @context.bot.callback_query_handler(callback_data=NOOP_CALLBACK_DATA, auto_answer=True)  # type: ignore
-        async def handle_noop(call: tg.CallbackQuery) -> tgservice.HandlerResult | None:
-            return None
+        if self.menu.config.mechanism is MenuMechanism.REPLY_KEYBOARD:
+            context.active_block_dispatcher.register(self.block_id, maybe_handle_reply_menu)
 
         return SetupResult.empty()
@@ -0,0 +1,107 @@
+import logging
+from typing import Awaitable, Callable, Iterable, Mapping
+
+from telebot import AsyncTeleBot
+from telebot import types as tg
+from telebot.types import constants as tgconst
+from telebot.types import service as tgservice
+
+from telebot_constructor.store.menu import (
+    BUTTON_ACTION_CALLBACK_DATA,
+    NOOP_CALLBACK_DATA,
+    ButtonActionData,
+)
+
+logger = logging.getLogger(__name__)
+
+
+ActiveBlockMessageHandler = Callable[[tg.Message], Awaitable[tgservice.HandlerResult | None]]
+GetActiveBlockId = Callable[[int], Awaitable[str | None]]
+
+
+class ActiveBlockDispatcher:
+    """
+    Routes users' private messages to the handler of their currently active block. Instead of each
+    block adding its own filtered handler (and resolving the active block in every filter), blocks
+    register here and a single bot handler resolves the active block once per message.
+    """
+
+    def __init__(self, get_active_block_id: GetActiveBlockId) -> None:
+        self._get_active_block_id = get_active_block_id
+        self._handlers: dict[str, ActiveBlockMessageHandler] = {}
+
+    def register(self, block_id: str, handler: ActiveBlockMessageHandler) -> None:
+        if block_id in self._handlers:
+            raise ValueError(f"Active block message handler is already registered for block {block_id!r}")
+        self._handlers[block_id] = handler
+
+    async def dispatch(self, message: tg.Message) -> tgservice.HandlerResult | None:
+        active_block_id = await self._get_active_block_id(message.from_user.id)
+        handler = self._handlers.get(active_block_id) if active_block_id is not None else None
+        if handler is None:
+            return tgservice.HandlerResult(continue_to_other_handlers=True)
+        return await handler(message)
+
+    def setup(self, bot: AsyncTeleBot) -> None:
+        """Add bot handler, must be called after all the blocks are set up"""
+        if not self._handlers:
+            return
+
+        @bot.message_handler(priority=1000, chat_types=[tgconst.ChatType.private])  # type: ignore
+        async def active_block_dispatcher_handler(message: tg.Message) -> tgservice.HandlerResult | None:
+            return await self.dispatch(message)
+
+
+MenuActionHandler = Callable[[ButtonActionData, tg.CallbackQuery], Awaitable[None]]
+LoadButtonAction = Callable[[str], Awaitable[ButtonActionData | None]]
+SaveButtonActions = Callable[[Mapping[str, ButtonActionData]], Awaitable[bool]]
+
+
+class InlineMenuRouter:
+    """
+    Routes inline menu button clicks to the menu blocks. All button actions possible in the current
+    config are known at setup time, so callback data is resolved with a dict lookup; stored actions
+    are loaded only for buttons unknown to the routing table (e.g. sent by a previous bot version).
+    The actions are saved to the store once, on setup, for future bot versions to use.
+    """
+
+    def __init__(self, load_action: LoadButtonAction, save_actions: SaveButtonActions) -> None:
+        self._load_action = load_action
+        self._save_actions = save_actions
+        self._action_by_hash: dict[str, ButtonActionData] = {}
+        self._handler_by_block_id: dict[str, MenuActionHandler] = {}
+
+    def register_menu(self, block_id: str, handler: MenuActionHandler, actions: Iterable[ButtonActionData]) -> None:
+        if block_id in self._handler_by_block_id:
+            raise ValueError(f"Menu action handler is already registered for block {block_id!r}")
+        self._handler_by_block_id[block_id] = handler
+        for action in actions:
+            self._action_by_hash[action.md5_hash] = action
+
+    async def route(self, call: tg.CallbackQuery) -> None:
+        action_hash = BUTTON_ACTION_CALLBACK_DATA.parse(call.data)["hash"]
+        action = self._action_by_hash.get(action_hash)
+        if action is None:
+            action = await self._load_action(action_hash)
+        if action is None:
+            return
+        handler = self._handler_by_block_id.get(action.block_id)
+        if handler is None:
+            logger.info(f"Button action for a missing menu block: {action}")
+            return
+        await handler(action, call)
+
+    async def setup(self, bot: AsyncTeleBot) -> None:
+        """Save actions and add bot handlers, must be called after all the blocks are set up"""
+        if not self._handler_by_block_id:
+            return
+        if self._action_by_hash:
+            await self._save_actions(self._action_by_hash)
+
+        @bot.callback_query_handler(callback_data=BUTTON_ACTION_CALLBACK_DATA, auto_answer=True)  # type: ignore
+        async def inline_menu_router_handler(call: tg.CallbackQuery) -> None:
+            await self.route(call)
+
+        @bot.callback_query_handler(callback_data=NOOP_CALLBACK_DATA, auto_answer=True)  # type: ignore
+        async def handle_noop(call: tg.CallbackQuery) -> None:
+            pass
@@ -7,7 +7,6 @@ from telebot import AsyncTeleBot
 from telebot import types as tg
 from telebot.runner import AuxBotEndpoint
 from telebot.types import service as service_types
-from telebot.types import service as tgservice
 from telebot_components.feedback import FeedbackHandler
 from telebot_components.redis_utils.interface import RedisInterface
 from telebot_components.stores.banned_users import BannedUsersStore
@@ -17,6 +16,10 @@ from telebot_constructor.store.errors import BotSpecificErrorsStore
 from telebot_constructor.store.form_results import BotSpecificFormResultsStore
 from telebot_constructor.store.media import UserSpecificMediaStore
 from telebot_constructor.store.menu import MenuMetadataStore
+from telebot_constructor.user_flow.dispatcher import (
+    ActiveBlockDispatcher,
+    InlineMenuRouter,
+)
 from telebot_constructor.utils import AnyChatId
 
 
@@ -32,9 +35,13 @@ class UserFlowSetupContext:
     feedback_handlers: dict[AnyChatId | None, FeedbackHandler]
     enter_block: "EnterUserFlowBlockCallback"
     get_active_block_id: "GetActiveUserFlowBlockId"
+    active_block_dispatcher: ActiveBlockDispatcher
+    inline_menu_router: InlineMenuRouter
     media_store: UserSpecificMediaStore | None
     menu_metadata_store: MenuMetadataStore
     owner_chat_id: int  # Telegram chat somehow associated with the bot owner
+    # if set, blocks upload their media to the owner chat on bot start to get Telegram file ids in advance
+    warm_up_media_file_ids: bool = False
 
     def make_instrumented_logger(self, module_name: str, block_id: str) -> logging.Logger:
         logger_name = module_name + f"[{self.bot_prefix}][{block_id}]"
@@ -42,13 +49,6 @@ class UserFlowSetupContext:
         self.errors_store.instrument(logger)
         return logger
 
-    def active_block_filter(self, block_id: str) -> tgservice.FilterFunc[tg.Message]:
-        async def filter_(update_content: tg.Message) -> bool:
-            current_block_id = await self.get_active_block_id(update_content.from_user.id)
-            return current_block_id == block_id
-
-        return filter_
-
 
 @dataclass(frozen=True)
 class MenuBlocksContext:
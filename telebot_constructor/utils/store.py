@@ -1,23 +1,195 @@
+import collections
 import dataclasses
 import datetime
 import json
-from typing import Any, Callable, Generic, Mapping
+import time
+from typing import Any, Callable, Generic, Mapping, TypeVar
 
 from telebot_components.stores.generic import KeyValueStore, PrefixedStore, ValueT, str_able
 
-_CACHE = dict[str, Any]()
+CachedT = TypeVar("CachedT")
+
+
+@dataclasses.dataclass
+class CacheStats:
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class LRUCache(Generic[CachedT]):
+    """
+    Bounded in-memory cache with least recently used eviction and optional per-entry TTL. By default,
+    the size is the number of entries; with sizeof function it can be e.g. the total size in bytes.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: datetime.timedelta | None = None,
+        sizeof: Callable[[CachedT], int] | None = None,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError(f"max_size must be positive, got {max_size=}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof
+        # key -> (value, expiration timestamp, entry size)
+        self._entries = collections.OrderedDict[str, tuple[CachedT, float | None, int]]()
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> tuple[bool, CachedT | None]:
+        """Returns a (is found, value) tuple"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at < time.time():
+            self.remove(key)
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: str, value: CachedT, ttl: datetime.timedelta | None = None) -> None:
+        """Cache the value; ttl overrides the cache-wide one for this entry"""
+        size = self.sizeof(value) if self.sizeof is not None else 1
+        if size > self.max_size:
+            # the value would evict everything else and still not fit
+            self.remove(key)
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl.total_seconds() if ttl is not None else None
+        self.remove(key)
+        self._entries[key] = (value, expires_at, size)
+        self.total_size += size
+        while self.total_size > self.max_size:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.total_size -= evicted_size
+            self.evictions += 1
+
+    def remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_size -= entry[2]
+
+    def remove_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            self.remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_size = 0
+
+    def stats(self) -> CacheStats:
+        return CacheStats(size=len(self._entries), hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+@dataclasses.dataclass
+class WriteThroughCachedKeyValueStore(KeyValueStore[ValueT]):
+    """
+    KeyValueStore with a bounded in-memory cache, updated on every write. Missing values are cached
+    too. Suitable for data written only by the current process, e.g. per-bot state of a running bot.
+    Saved values are cached for the expiration time, as it's reset in Redis on save. Values loaded
+    from Redis might be close to expiring there, so they are cached only for a short time.
+    """
+
+    cache_size: int = 10_000
+    loaded_cache_ttl: datetime.timedelta = datetime.timedelta(minutes=5)
+
+    def __post_init__(self):
+        super().__post_init__()
+        self._cache = LRUCache[ValueT | None](max_size=self.cache_size, ttl=self.expiration_time)
+        # writes are counted to detect the ones made while a value is being loaded, so that the loaded
+        # (possibly older) value doesn't overwrite the cached one
+        self._write_count = 0
+        self._loads_in_flight = dict[str, int]()  # full key -> number of concurrent loads
+        self._last_write_during_load = dict[str, int]()  # full key -> write count
+
+    def _cache_written(self, full_key: str, value: ValueT | None) -> None:
+        self._write_count += 1
+        if full_key in self._loads_in_flight:
+            self._last_write_during_load[full_key] = self._write_count
+        self._cache.set(full_key, value)
+
+    async def save(self, key: str_able, value: ValueT) -> bool:
+        self._cache_written(self._full_key(key), value)
+        return await super().save(key, value)
+
+    async def save_multiple(self, mapping: Mapping[str, ValueT]) -> bool:
+        for key, value in mapping.items():
+            self._cache_written(self._full_key(key), value)
+        return await super().save_multiple(mapping)
+
+    async def load(self, key: str_able) -> ValueT | None:
+        full_key = self._full_key(key)
+        is_cached, cached = self._cache.get(full_key)
+        if is_cached:
+            return cached
+        load_started_at = self._write_count
+        self._loads_in_flight[full_key] = self._loads_in_flight.get(full_key, 0) + 1
+        try:
+            from_store = await super().load(key)
+        finally:
+            last_write = self._last_write_during_load.get(full_key)
+            self._loads_in_flight[full_key] -= 1
+            if self._loads_in_flight[full_key] == 0:
+                del self._loads_in_flight[full_key]
+                self._last_write_during_load.pop(full_key, None)
+        if last_write is not None and last_write > load_started_at:
+            # the value was written during the load, the cached one is newer
+            is_cached, cached = self._cache.get(full_key)
+            return cached if is_cached else from_store
+        self._cache.set(
+            full_key,
+            from_store,
+            ttl=min(self.loaded_cache_ttl, self.expiration_time) if self.expiration_time is not None else None,
+        )
+        return from_store
+
+    async def drop(self, key: str_able) -> bool:
+        self._cache_written(self._full_key(key), None)
+        return await super().drop(key)
+
+
+# (namespace, store name) -> store's cache, where namespace is the store prefix (e.g. bot prefix); kept
+# on the module level to survive stores re-creation (e.g. when the bot is restarted with a new config)
+_CACHES = dict[tuple[str, str], LRUCache[Any]]()
+
+
+def purge_cached_stores(namespace: str) -> dict[str, CacheStats]:
+    """
+    Drop all cached values for the namespace, must be called when the bot is stopped or deleted;
+    returns the final stats of the dropped caches by store name
+    """
+    purged = {key: cache for key, cache in _CACHES.items() if key[0] == namespace}
+    for key in purged:
+        del _CACHES[key]
+    return {name: cache.stats() for (_, name), cache in purged.items()}
 
 
 @dataclasses.dataclass
 class CachedKeyValueStore(PrefixedStore, Generic[ValueT]):
     """
-    Like KeyValueStore, but caches everything in memory for faster repeated reads.
-    The cache is *never* invalidated, so it's suitable mostly for immutable stores.
+    Like KeyValueStore, but caches values in memory for faster repeated reads. Cache is bounded and
+    shared by all instances of the store, prefix is used as a namespace for purging. The cache is not
+    invalidated on external writes, so it's suitable mostly for immutable stores.
     """
 
     dumper: Callable[[ValueT], str] = json.dumps
     loader: Callable[[str], ValueT] = json.loads
     expiration_time: datetime.timedelta | None = None
+    cache_size: int = 10_000
+    cache_ttl: datetime.timedelta | None = datetime.timedelta(days=1)
 
     def __post_init__(self):
         super().__post_init__()
@@ -30,20 +202,35 @@ class CachedKeyValueStore(PrefixedStore, Generic[ValueT]):
             loader=self.loader,
         )
 
+    @property
+    def _cache(self) -> LRUCache[ValueT]:
+        cache = _CACHES.get((self.prefix, self.name))
+        if cache is None:
+            cache = LRUCache[Any](max_size=self.cache_size, ttl=self.cache_ttl)
+            _CACHES[(self.prefix, self.name)] = cache
+        elif cache.max_size != self.cache_size or cache.ttl != self.cache_ttl:
+            raise ValueError(
+                f"Store {self.name!r} in {self.prefix!r} is already cached with different parameters: "
+                + f"{cache.max_size=}, {cache.ttl=}"
+            )
+        return cache
+
     async def save(self, key: str_able, value: ValueT) -> bool:
-        _CACHE[self._full_key(key)] = value
+        self._cache.set(self._full_key(key), value)
         return await self._persistent.save(key, value)
 
     async def save_multiple(self, mapping: Mapping[str, ValueT]) -> bool:
+        cache = self._cache
         for key, value in mapping.items():
-            _CACHE[self._full_key(key)] = value
+            cache.set(self._full_key(key), value)
         return await self._persistent.save_multiple(mapping)
 
     async def load(self, key: str_able) -> ValueT | None:
         full_key = self._full_key(key)
-        if cached := _CACHE.get(full_key):
-            return cached  # type: ignore
+        is_cached, cached = self._cache.get(full_key)
+        if is_cached:
+            return cached
         from_store = await self._persistent.load(key)
         if from_store is not None:
-            _CACHE[full_key] = from_store
+            self._cache.set(full_key, from_store)
         return from_store
@@ -377,3 +377,16 @@ async def test_admin_chat_ids(
             "alert_chat_id": None,
         }
     ]
+
+
+async def test_startup_progress(
+    constructor_app: tuple[ModuliApp, aiohttp.web.Application],
+    aiohttp_client: AiohttpClient,
+) -> None:
+    constructor, web_app = constructor_app
+    client = await aiohttp_client(web_app)
+
+    await constructor._start_stored_bots_task
+    resp = await client.get("/api/startup-progress")
+    assert resp.status == 200
+    assert await resp.json() == {"total": 0, "started": 0, "failed": 0, "pending": 0, "is_completed": True}
@@ -1,3 +1,4 @@
+import re
 import time
 from typing import Any, Tuple
 
@@ -72,6 +73,7 @@ async def test_bot_level_errors(
         ]
     )
     assert not bot.method_calls
+    await constructor.store.errors.flush()
 
     def check_error(error: Any, user_id: int) -> None:
         assert isinstance(error, dict)
@@ -105,6 +107,7 @@ async def test_bot_level_errors(
             for user_id in range(5)
         ]
     )
+    await constructor.store.errors.flush()
 
     # calling the bot errors api to get the full list (3 last errors in this case)
     resp = await client.get("/api/errors/mybot?count=3")
@@ -112,3 +115,13 @@ async def test_bot_level_errors(
     errors = mask_recent_timestamps(await resp.json())["errors"]  # type: ignore
     for user_id, error in zip((2, 3, 4), errors):
         check_error(error, user_id=user_id)
+
+    resp = await client.get("/api/error-stats/mybot")
+    assert resp.status == 200
+    error_stats: Any = mask_recent_timestamps(await resp.json())["error_stats"]  # type: ignore
+    assert len(error_stats) == 1
+    assert error_stats[0]["count"] == 6
+    assert error_stats[0]["exc_type"] == "RuntimeError"
+    assert re.fullmatch(r".*telebot_constructor/user_flow/blocks/internal\.py:\d+ in enter", error_stats[0]["location"])
+    assert error_stats[0]["first_seen"] == RECENT_TIMESTAMP
+    assert error_stats[0]["last_seen"] == RECENT_TIMESTAMP
@@ -6,6 +6,7 @@ from pytest_aiohttp.plugin import AiohttpClient  # type: ignore
 from telebot.test_util import MockedAsyncTeleBot
 
 from telebot_constructor.app import ModuliApp
+from telebot_constructor.store.form_results import TIMESTAMP_KEY, USER_KEY, GlobalFormId
 from tests.test_app.conftest import MockBotRunner
 from tests.utils import (
     RECENT_TIMESTAMP,
@@ -340,3 +341,55 @@ Timestamp,User,one,two
 {timestamps[2]},CCC,First answer by user #3,Second answer by user #3
 """.strip()
     )
+
+
+async def test_form_results_export_multiple_pages(
+    constructor_app: Tuple[ModuliApp, aiohttp.web.Application],
+    aiohttp_client: AiohttpClient,
+) -> None:
+    constructor, web_app = constructor_app
+    constructor.FORM_RESULTS_EXPORT_PAGE_SIZE = 2
+    client = await aiohttp_client(web_app)
+
+    resp = await client.post("/api/secrets/test-token", data="aaaaaa")
+    assert resp.status == 200
+    resp = await client.post(
+        "/api/config/mybot",
+        params={"new": "true"},
+        json={
+            "config": {
+                "token_secret_name": "test-token",
+                "user_flow_config": {"entrypoints": [], "blocks": [], "node_display_coords": {}},
+            },
+            "start": False,
+            "version_message": "init",
+        },
+    )
+    assert resp.status == 201
+
+    form_id = GlobalFormId(owner_id="no-auth", bot_id="mybot", form_block_id="form-block")
+    start = datetime.datetime(2024, 1, 1).timestamp()
+    for i in range(5):
+        await constructor.store.form_results.save_form_result(
+            form_id,
+            result={TIMESTAMP_KEY: start + i, USER_KEY: f"user #{i}", "field": f"answer #{i}"},
+            field_names={"field": "Question"},
+            prompt="Prompt",
+        )
+    timestamps = [datetime.datetime.fromtimestamp(start + i).isoformat() for i in range(5)]
+
+    resp = await client.get("/api/forms/mybot/form-block/export")
+    assert resp.status == 200
+    assert resp.headers["Transfer-Encoding"] == "chunked"
+    assert (await resp.text()).replace("\r\n", "\n") == "Timestamp,User,Question\n" + "".join(
+        f"{timestamps[i]},user #{i},answer #{i}\n" for i in range(5)
+    )
+
+    # filtered export starting in the middle of a page, without header
+    resp = await client.get(
+        "/api/forms/mybot/form-block/export", params={"min_timestamp": str(int(start + 1)), "header": "false"}
+    )
+    assert resp.status == 200
+    assert (await resp.text()).replace("\r\n", "\n") == "".join(
+        f"{timestamps[i]},user #{i},answer #{i}\n" for i in range(1, 5)
+    )
@@ -1,7 +1,18 @@
+import io
+from pathlib import Path
+
 import aiohttp.web
+from PIL import Image
 from pytest_aiohttp.plugin import AiohttpClient  # type: ignore
 
 from telebot_constructor.app import ModuliApp
+from telebot_constructor.store.media import DeduplicatingMediaStore, FilesystemMediaStore
+
+
+def image_bytes(size: tuple[int, int], format: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color=(200, 100, 50)).save(buffer, format=format)
+    return buffer.getvalue()
 
 
 async def test_media_api(
@@ -11,7 +22,7 @@ async def test_media_api(
     _, web_app = constructor_app
     client = await aiohttp_client(web_app)
 
-    content = b"abcde"
+    content = image_bytes((100, 50), "PNG")
     resp = await client.post("/api/media", data=content, headers={"X-Telebot-Constructor-Filename": "image.png"})
     assert resp.status == 200
     media_id = await resp.text()
@@ -20,7 +31,7 @@ async def test_media_api(
     assert resp.status == 200
     assert resp.headers["Content-Type"] == "image/png"
     assert resp.headers["X-Telebot-Constructor-Filename"] == "image.png"
-    assert await resp.read() == content
+    assert Image.open(io.BytesIO(await resp.read())).size == (100, 50)
 
     resp = await client.delete(f"/api/media/{media_id}")
     assert resp.status == 200
@@ -29,3 +40,119 @@ async def test_media_api(
     assert resp.status == 404
     resp = await client.delete(f"/api/media/{media_id}")
     assert resp.status == 404
+
+
+async def test_media_api_image_normalization(
+    constructor_app: tuple[ModuliApp, aiohttp.web.Application],
+    aiohttp_client: AiohttpClient,
+) -> None:
+    _, web_app = constructor_app
+    client = await aiohttp_client(web_app)
+
+    resp = await client.post(
+        "/api/media",
+        data=image_bytes((4000, 3000), "WEBP"),
+        headers={"X-Telebot-Constructor-Filename": "photo.webp"},
+    )
+    assert resp.status == 200
+    media_id = await resp.text()
+
+    # downscaled and recompressed
+    resp = await client.get(f"/api/media/{media_id}")
+    assert resp.status == 200
+    assert resp.headers["Content-Type"] == "image/jpeg"
+    assert resp.headers["X-Telebot-Constructor-Filename"] == "photo.jpg"
+    image = Image.open(io.BytesIO(await resp.read()))
+    assert image.format == "JPEG"
+    assert image.size == (2560, 1920)
+
+    resp = await client.get(f"/api/media/{media_id}/preview")
+    assert resp.status == 200
+    assert Image.open(io.BytesIO(await resp.read())).size == (320, 240)
+
+    resp = await client.post("/api/media", data=b"abcde", headers={"X-Telebot-Constructor-Filename": "image.png"})
+    assert resp.status == 400
+
+    # media not identified as a normalized image format is stored as is
+    for filename, content in (
+        ("README", b"not an image"),
+        ("logo.svg", b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"></svg>'),
+        ("photo.heic", b"not really a heic image"),
+    ):
+        resp = await client.post("/api/media", data=content, headers={"X-Telebot-Constructor-Filename": filename})
+        assert resp.status == 200
+        media_id = await resp.text()
+        resp = await client.get(f"/api/media/{media_id}")
+        assert resp.status == 200
+        assert resp.headers["X-Telebot-Constructor-Filename"] == filename
+        assert await resp.read() == content
+
+
+async def test_media_api_deduplicated_previews(
+    constructor_app: tuple[ModuliApp, aiohttp.web.Application],
+    aiohttp_client: AiohttpClient,
+) -> None:
+    constructor, web_app = constructor_app
+    assert constructor.media_store is not None
+    constructor.media_store = DeduplicatingMediaStore(constructor.media_store, constructor.redis)
+    client = await aiohttp_client(web_app)
+
+    async def upload() -> str:
+        resp = await client.post(
+            "/api/media",
+            data=image_bytes((1000, 500), "PNG"),
+            headers={"X-Telebot-Constructor-Filename": "image.png"},
+        )
+        assert resp.status == 200
+        return await resp.text()
+
+    async def preview_size(media_id: str) -> tuple[int, int] | None:
+        resp = await client.get(f"/api/media/{media_id}/preview")
+        if resp.status == 404:
+            return None
+        return Image.open(io.BytesIO(await resp.read())).size
+
+    media_id = await upload()
+    assert await upload() == media_id
+    assert await preview_size(media_id) == (320, 160)
+    preview_media_id = await constructor.store.load_media_preview_id("no-auth", media_id)
+    assert preview_media_id is not None
+
+    # the other copy and its preview are intact
+    resp = await client.delete(f"/api/media/{media_id}")
+    assert resp.status == 200
+    assert await preview_size(media_id) == (320, 160)
+
+    resp = await client.delete(f"/api/media/{media_id}")
+    assert resp.status == 200
+    assert await preview_size(media_id) is None
+    assert await constructor.store.load_media_preview_id("no-auth", media_id) is None
+    resp = await client.get(f"/api/media/{preview_media_id}")
+    assert resp.status == 404
+
+
+async def test_media_api_filesystem_store(
+    constructor_app: tuple[ModuliApp, aiohttp.web.Application],
+    aiohttp_client: AiohttpClient,
+    tmp_path: Path,
+) -> None:
+    constructor, web_app = constructor_app
+    constructor.media_store = FilesystemMediaStore(tmp_path)
+    client = await aiohttp_client(web_app)
+
+    content = b"abcde" * 1000
+    resp = await client.post("/api/media", data=content)
+    assert resp.status == 200
+    media_id = await resp.text()
+    assert (tmp_path / "no-auth" / media_id).read_bytes() == content
+
+    resp = await client.get(f"/api/media/{media_id}")
+    assert resp.status == 200
+    assert resp.headers["Cache-Control"] == "private, max-age=31536000"
+    assert "ETag" in resp.headers  # served as a file
+    assert await resp.read() == content
+
+    resp = await client.delete(f"/api/media/{media_id}")
+    assert resp.status == 200
+    resp = await client.get(f"/api/media/{media_id}")
+    assert resp.status == 404
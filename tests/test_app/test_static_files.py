@@ -1,10 +1,17 @@
 import re
+from pathlib import Path
 from typing import Tuple
 
 import aiohttp.web
 from pytest_aiohttp.plugin import AiohttpClient  # type: ignore
 
 from telebot_constructor.app import ModuliApp
+from telebot_constructor.static import (
+    STATIC_FILES_CACHE,
+    StaticFile,
+    load_static_file,
+    preload_static_files,
+)
 
 
 async def test_serve_index(
@@ -100,3 +107,66 @@ async def test_prefilled_messages(
 
         assert all(["/skip" in msg for msg in resp_json["field_is_skippable"].values()])
         assert all("/cancel" in msg for msg in resp_json["cancel_command_is"].values())
+
+
+async def test_serve_precompressed_static_files(
+    constructor_app: Tuple[ModuliApp, aiohttp.web.Application], aiohttp_client: AiohttpClient
+) -> None:
+    constructor, web_app = constructor_app
+    client = await aiohttp_client(web_app)
+
+    assets_dir = constructor.static_files_dir / "assets"
+    assets_dir.mkdir()
+    script = "console.log('hello world');\n" * 100
+    (assets_dir / "index-4ed993c7.js").write_text(script)
+    (constructor.static_files_dir / "favicon.png").write_bytes(b"\x89PNG" + b"\x00" * 1000)
+
+    resp = await client.get("/assets/index-4ed993c7.js", headers={"Accept-Encoding": "gzip, deflate"})
+    assert resp.status == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert int(resp.headers["Content-Length"]) < len(script)
+    assert await resp.text("utf-8") == script  # decompressed by the client
+    gzip_etag = resp.headers["ETag"]
+
+    resp = await client.get("/assets/index-4ed993c7.js", headers={"Accept-Encoding": "identity"})
+    assert resp.status == 200
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["ETag"] != gzip_etag
+    assert await resp.text("utf-8") == script
+
+    resp = await client.get(
+        "/assets/index-4ed993c7.js", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}
+    )
+    assert resp.status == 304
+    assert await resp.read() == b""
+
+    # images are not compressed, not fingerprinted files are not immutable
+    resp = await client.get("/favicon.png", headers={"Accept-Encoding": "gzip"})
+    assert resp.status == 200
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["Cache-Control"] == "private, max-age=2628000"
+
+
+def test_static_file_encoding_negotiation() -> None:
+    static_file = StaticFile(content=b"content", mimetype="text/plain", etag="etag", encoded={"gzip": b"gzipped"})
+    assert static_file.encoding_for("gzip, deflate, br") == "gzip"
+    assert static_file.encoding_for("br;q=1.0, gzip;q=0.5") == "gzip"
+    assert static_file.encoding_for("*") == "gzip"
+    assert static_file.encoding_for("gzip;q=0, *") is None
+    assert static_file.encoding_for("identity") is None
+    assert static_file.encoding_for("") is None
+
+
+def test_preload_static_files_symlinked_dir(tmp_path: Path) -> None:
+    real_dir = tmp_path / "static-real"
+    (real_dir / "assets").mkdir(parents=True)
+    (real_dir / "assets" / "app-4ed993c7.js").write_text("console.log(1);")
+    static_files_dir = tmp_path / "static"
+    static_files_dir.symlink_to(real_dir)
+
+    preload_static_files(static_files_dir)
+    cached = STATIC_FILES_CACHE.get((static_files_dir / "assets" / "app-4ed993c7.js").resolve())
+    assert cached is not None
+    assert load_static_file(static_files_dir / "assets" / "app-4ed993c7.js") is cached
@@ -0,0 +1,49 @@
+import asyncio
+
+from telebot_constructor.bots_startup import StoredBot, StoredBotsStarter
+
+
+async def test_stored_bots_starter() -> None:
+    started_order: list[str] = []
+    currently_starting = 0
+    max_currently_starting = 0
+
+    async def start_bot(stored_bot: StoredBot) -> bool:
+        nonlocal currently_starting, max_currently_starting
+        started_order.append(stored_bot.bot_id)
+        currently_starting += 1
+        max_currently_starting = max(max_currently_starting, currently_starting)
+        await asyncio.sleep(0.01)
+        currently_starting -= 1
+        if stored_bot.bot_id == "broken":
+            raise RuntimeError("oops")
+        return stored_bot.bot_id != "failing"
+
+    starter = StoredBotsStarter(start_bot=start_bot, max_concurrency=2, max_starts_per_second=1000)
+    assert starter.progress().model_dump() == {
+        "total": 0,
+        "started": 0,
+        "failed": 0,
+        "pending": 0,
+        "is_completed": False,
+    }
+
+    await starter.run(
+        [
+            StoredBot(owner_id="user", bot_id="old", version=0, last_activity=100.0),
+            StoredBot(owner_id="user", bot_id="unknown", version=0, last_activity=None),
+            StoredBot(owner_id="user", bot_id="failing", version=1, last_activity=200.0),
+            StoredBot(owner_id="user", bot_id="recent", version="stub", last_activity=400.0),
+            StoredBot(owner_id="user", bot_id="broken", version=2, last_activity=300.0),
+        ]
+    )
+
+    assert started_order == ["recent", "broken", "failing", "old", "unknown"]
+    assert max_currently_starting == 2
+    assert starter.progress().model_dump() == {
+        "total": 5,
+        "started": 3,
+        "failed": 2,
+        "pending": 0,
+        "is_completed": True,
+    }
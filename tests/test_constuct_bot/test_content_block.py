@@ -576,3 +576,82 @@ def test_content_block_splits_too_many_attachments() -> None:
     img_content_2 = block.contents[2]
     assert img_content_2.text is None
     assert len(img_content_2.attachments) == 5
+
+
+async def test_file_ids_warm_up() -> None:
+    redis = RedisEmulation()
+    secret_store = dummy_secret_store(redis)
+    owner_id = "test-username"
+    await secret_store.save_secret(secret_name="token", secret_value="<token>", owner_id=owner_id)
+    media_store = RedisMediaStore(redis)
+    media_id = await media_store.save_media(owner_id, Media(content=b"attachment-body", filename=None))
+
+    bot_config = BotConfig(
+        token_secret_name="token",
+        display_name="Content block test bot",
+        user_flow_config=UserFlowConfig(
+            entrypoints=[
+                UserFlowEntryPointConfig(
+                    command=CommandEntryPoint(entrypoint_id="command-1", command="start", next_block_id="content-1"),
+                )
+            ],
+            blocks=[
+                UserFlowBlockConfig(
+                    content=ContentBlock(
+                        block_id="content-1",
+                        contents=[
+                            Content(text=None, attachments=[ContentBlockContentAttachment(image=media_id)]),
+                        ],
+                        next_block_id=None,
+                    ),
+                ),
+            ],
+            node_display_coords={},
+        ),
+    )
+
+    bot_runner = await construct_bot(
+        owner_id=owner_id,
+        bot_id="warm-up-bot",
+        bot_config=bot_config,
+        form_results_store=dummy_form_results_store(),
+        errors_store=dummy_errors_store(),
+        secret_store=secret_store,
+        redis=redis,
+        owner_chat_id=42,
+        media_store=media_store.adapter_for(owner_id),
+        warm_up_media_file_ids=True,
+        _bot_factory=MockedAsyncTeleBot,
+    )
+    bot = bot_runner.bot
+    assert isinstance(bot, MockedAsyncTeleBot)
+    bot.method_calls.clear()
+    bot.add_return_values(
+        "send_photo",
+        tg.Message(
+            message_id=1,
+            from_user=tg.User(id=1, is_bot=True, first_name="Bot"),
+            date=int(time.time()),
+            chat=None,  # type: ignore
+            content_type="photo",
+            options={"photo": [tg.PhotoSize(file_id="warm-file-id", file_unique_id="unused", width=1, height=1)]},
+            json_string={},
+        ),
+    )
+
+    # warm-up job uploads the attachment to the owner chat and deletes the message
+    assert len(bot_runner.background_jobs) == 1
+    await bot_runner.background_jobs[0]
+    assert_method_call_kwargs_include(
+        bot.method_calls["send_photo"],
+        [{"chat_id": 42, "photo": b"attachment-body", "disable_notification": True}],
+    )
+    assert_method_call_kwargs_include(bot.method_calls["delete_message"], [{"chat_id": 42, "message_id": 1}])
+    bot.method_calls.clear()
+
+    # the first user already gets the file id
+    await bot.process_new_updates([tg_update_message_to_bot(user_id=1, first_name="User", text="/start")])
+    assert_method_call_kwargs_include(
+        bot.method_calls["send_photo"],
+        [{"chat_id": 1, "photo": "warm-file-id"}],
+    )
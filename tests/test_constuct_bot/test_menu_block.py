@@ -1,3 +1,6 @@
+from typing import Mapping
+
+from telebot import types as tg
 from telebot.test_util import MockedAsyncTeleBot
 from telebot_components.redis_utils.emulation import RedisEmulation
 
@@ -8,6 +11,7 @@ from telebot_constructor.bot_config import (
     UserFlowEntryPointConfig,
 )
 from telebot_constructor.construct import construct_bot
+from telebot_constructor.store.menu import ButtonActionData
 from telebot_constructor.user_flow.blocks.content import ContentBlock
 from telebot_constructor.user_flow.blocks.menu import (
     Menu,
@@ -16,6 +20,7 @@ from telebot_constructor.user_flow.blocks.menu import (
     MenuItem,
     MenuMechanism,
 )
+from telebot_constructor.user_flow.dispatcher import InlineMenuRouter
 from telebot_constructor.user_flow.entrypoints.command import CommandEntryPoint
 from tests.utils import (
     assert_method_call_dictified_kwargs_include,
@@ -1023,3 +1028,50 @@ async def test_multilevel_menu_reply_kbd() -> None:
         ],
     )
     bot.method_calls.clear()
+
+
+async def test_inline_menu_router() -> None:
+    loaded_hashes: list[str] = []
+    # stored by the previous bot version, not present in the current config
+    stored_action = ButtonActionData(block_id="menu-A", route_to_block_id="removed-block")
+    stored_orphan_action = ButtonActionData(block_id="removed-menu", route_to_block_id="menu-A")
+
+    async def load_action(action_hash: str) -> ButtonActionData | None:
+        loaded_hashes.append(action_hash)
+        return {a.md5_hash: a for a in (stored_action, stored_orphan_action)}.get(action_hash)
+
+    saved_actions: list[ButtonActionData] = []
+
+    async def save_actions(actions: Mapping[str, ButtonActionData]) -> bool:
+        saved_actions.extend(actions.values())
+        return True
+
+    handled_actions: list[ButtonActionData] = []
+
+    async def handler(action: ButtonActionData, call: tg.CallbackQuery) -> None:
+        handled_actions.append(action)
+
+    router = InlineMenuRouter(load_action=load_action, save_actions=save_actions)
+    known_action = ButtonActionData(block_id="menu-A", route_to_block_id="menu-B")
+    router.register_menu("menu-A", handler=handler, actions=[known_action])
+    await router.setup(MockedAsyncTeleBot("token"))
+    # actions are persisted once, on setup
+    assert saved_actions == [known_action]
+
+    def click(action_hash: str) -> tg.CallbackQuery:
+        update = tg_update_callback_query(1312, first_name="User", callback_query=f"action:{action_hash}")
+        assert update.callback_query is not None
+        return update.callback_query
+
+    # actions known from config are routed without loading them from the store
+    await router.route(click(known_action.md5_hash))
+    assert handled_actions == [known_action]
+    assert not loaded_hashes
+
+    await router.route(click(stored_action.md5_hash))
+    assert handled_actions == [known_action, stored_action]
+    assert loaded_hashes == [stored_action.md5_hash]
+
+    await router.route(click(stored_orphan_action.md5_hash))
+    await router.route(click("unknown"))
+    assert handled_actions == [known_action, stored_action]
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+from telebot import AsyncTeleBot
+from telebot.test_util import MockedAsyncTeleBot
+
+from telebot_constructor.error_alerts import ErrorAlertsDigester
+from telebot_constructor.store.errors import BotError, BotErrorContext
+
+
+async def test_error_alerts_digest() -> None:
+    bots_created = 0
+    bot = MockedAsyncTeleBot("TOKEN")
+
+    async def make_bot(owner_id: str, bot_id: str) -> AsyncTeleBot:
+        nonlocal bots_created
+        bots_created += 1
+        return bot
+
+    digester = ErrorAlertsDigester(make_bot=make_bot, window=0.05)
+
+    def error_ctx(message: str, exc_type: str | None = None) -> BotErrorContext:
+        return BotErrorContext(
+            owner_id="user",
+            bot_id="bot",
+            alert_chat_id=1312,
+            error=BotError(timestamp=time.time(), message=message, exc_type=exc_type),
+        )
+
+    # the first error is sent right away
+    await digester.on_error(error_ctx("Error for user 1"))
+    assert [c.kwargs["text"] for c in bot.method_calls["send_message"]] == ["Error for user 1"]
+    bot.method_calls.clear()
+
+    # the following ones are coalesced into a digest
+    for user_id in range(2, 12):
+        await digester.on_error(error_ctx(f"Error for user {user_id}"))
+    await digester.on_error(error_ctx("Something else", exc_type="KeyError"))
+    assert not bot.method_calls
+
+    await asyncio.sleep(0.07)
+    assert [c.kwargs["text"] for c in bot.method_calls["send_message"]] == [
+        "⚠️ <b>11 more error(s)</b> in the last 1 min\n\n"
+        + "• 10× Error for user &lt;N&gt;\n\n"
+        + "• 1× <code>KeyError</code> Something else"
+    ]
+    bot.method_calls.clear()
+
+    # the window stays open while errors keep coming
+    await digester.on_error(error_ctx("Error for user 12"))
+    assert not bot.method_calls
+    # but test alerts are sent right away
+    test_ctx = error_ctx("Test alert")
+    test_ctx.send_immediately = True
+    await digester.on_error(test_ctx)
+    assert [c.kwargs["text"] for c in bot.method_calls["send_message"]] == ["Test alert"]
+    bot.method_calls.clear()
+
+    # pending digest is sent on flush
+    await digester.flush()
+    assert [c.kwargs["text"] for c in bot.method_calls["send_message"]] == [
+        "⚠️ <b>1 more error(s)</b> in the last 1 min\n\n• 1× Error for user &lt;N&gt;"
+    ]
+    bot.method_calls.clear()
+
+    # after the window is closed, the error is sent right away again
+    await digester.on_error(error_ctx("Error for user 13"))
+    assert [c.kwargs["text"] for c in bot.method_calls["send_message"]] == ["Error for user 13"]
+    await digester.flush()
+
+    # bot client is reused
+    assert bots_created == 1
+
+
+async def test_error_alerts_send_failures() -> None:
+    bot = MockedAsyncTeleBot("TOKEN")
+    make_bot_errors: list[Exception] = []
+
+    async def make_bot(owner_id: str, bot_id: str) -> AsyncTeleBot:
+        if make_bot_errors:
+            raise make_bot_errors.pop()
+        return bot
+
+    digester = ErrorAlertsDigester(make_bot=make_bot, window=0.05, bot_ttl=-1)
+
+    def error_ctx(message: str, bot_id: str = "bot") -> BotErrorContext:
+        return BotErrorContext(
+            owner_id="user",
+            bot_id=bot_id,
+            alert_chat_id=1312,
+            error=BotError(timestamp=time.time(), message=message),
+        )
+
+    # the failed alert doesn't prevent the following errors from being digested
+    make_bot_errors.append(RuntimeError("token not found"))
+    await digester.on_error(error_ctx("Error 1"))
+    await digester.on_error(error_ctx("Error 2"))
+    await digester.flush()
+    assert [c.kwargs["text"] for c in bot.method_calls["send_message"]] == [
+        "⚠️ <b>1 more error(s)</b> in the last 1 min\n\n• 1× Error &lt;N&gt;",
+    ]
+
+    # but test alert failures are reported to the caller
+    make_bot_errors.append(RuntimeError("token not found"))
+    test_ctx = error_ctx("Test alert")
+    test_ctx.send_immediately = True
+    with pytest.raises(RuntimeError):
+        await digester.on_error(test_ctx)
+    await digester.flush()
+
+    # expired bot clients are dropped
+    await digester.on_error(error_ctx("Error", bot_id="other-bot"))
+    await digester.flush()
+    assert list(digester._bots) == [("user", "other-bot")]
@@ -1,15 +1,36 @@
+import asyncio
+import gc
+import logging
 import time
+from pathlib import Path
+from typing import Any, AsyncIterator
 
 import pytest
 from telebot_components.redis_utils.emulation import RedisEmulation
 
+from telebot_constructor.bot_config import BotConfig
+from telebot_constructor.store.errors import BotError, BotErrorContext, BotErrorsStore
 from telebot_constructor.store.form_results import (
     TIMESTAMP_KEY,
+    FormInfo,
+    FormInfoBasic,
     FormResult,
     FormResultsFilter,
     FormResultsStore,
     GlobalFormId,
 )
+from telebot_constructor.store.media import (
+    AwsS3Credentials,
+    AwsS3MediaStore,
+    CachedMediaStore,
+    DeduplicatingMediaStore,
+    FilesystemMediaStore,
+    Media,
+    RedisMediaStore,
+    UserSpecificMediaStore,
+)
+from telebot_constructor.store.store import Store
+from tests.utils import InterleavingRedisEmulation
 
 
 @pytest.mark.parametrize(
@@ -77,3 +98,583 @@ async def test_form_results_load_with_filter(load_page_size: int):
     assert await matching(FormResultsFilter(min_timestamp=now - 110, max_timestamp=now - 10)) == all_results[0:5]
     assert await matching(FormResultsFilter(min_timestamp=now - 110, max_timestamp=None)) == all_results[0:6]
     assert await matching(FormResultsFilter(min_timestamp=None, max_timestamp=now - 90)) == all_results[0:1]
+
+
+async def test_form_results_load_long_history() -> None:
+    redis = RedisEmulation()
+    form_results_store = FormResultsStore(redis)
+
+    form_id = GlobalFormId(owner_id="test", bot_id="testbot", form_block_id="testform")
+
+    day = 24 * 3600.0
+    start = time.time() - 1000 * day
+    all_results: list[FormResult] = [{TIMESTAMP_KEY: start + i * day, "i": i} for i in range(1000)]
+    # result started before the previous one, but completed after it
+    all_results[501][TIMESTAMP_KEY] = start + 500 * day - 3600
+    for r in all_results:
+        await form_results_store.save(form_id, result=r)
+
+    results, is_full = await form_results_store.load(
+        form_id,
+        filter=FormResultsFilter(min_timestamp=start + 500 * day - 7200, max_timestamp=start + 510.5 * day),
+    )
+    assert is_full
+    assert [r["i"] for r in results] == list(range(500, 511))
+
+    results, is_full = await form_results_store.load(
+        form_id,
+        filter=FormResultsFilter(min_timestamp=start + 2000 * day, max_timestamp=None),
+    )
+    assert is_full
+    assert results == []
+
+
+async def test_form_results_list_forms() -> None:
+    redis = RedisEmulation()
+    form_results_store = FormResultsStore(redis)
+
+    # form saved before the per-bot forms registry was introduced
+    legacy_form_id = GlobalFormId(owner_id="test", bot_id="testbot", form_block_id="legacy-form")
+    await form_results_store._results_store.push(legacy_form_id.as_key(), {TIMESTAMP_KEY: time.time()})
+    await form_results_store.save_form_prompt(legacy_form_id, "legacy prompt")
+
+    adapter = form_results_store.adapter_for("test", "testbot")
+    for _ in range(3):
+        assert await adapter.save_form_result(
+            form_block_id="new-form",
+            form_result={TIMESTAMP_KEY: time.time(), "field-1": "hello"},
+            field_names={"field-1": "Field one"},
+            prompt="new prompt",
+        )
+    await form_results_store.save_form_title(GlobalFormId("test", "testbot", "new-form"), "New form")
+    other_adapter = form_results_store.adapter_for("test", "other-bot")
+    assert await other_adapter.save_form_result(
+        form_block_id="other-form",
+        form_result={TIMESTAMP_KEY: time.time()},
+        field_names={},
+        prompt="other prompt",
+    )
+
+    expected = [
+        FormInfoBasic(form_block_id="legacy-form", prompt="legacy prompt", title=None, total_responses=1),
+        FormInfoBasic(form_block_id="new-form", prompt="new prompt", title="New form", total_responses=3),
+    ]
+    assert await form_results_store.list_forms("test", "testbot") == expected
+    # second time the forms are loaded from the registry
+    assert await form_results_store.list_forms("test", "testbot") == expected
+    assert await form_results_store.list_forms("test", "other-bot") == [
+        FormInfoBasic(form_block_id="other-form", prompt="other prompt", title=None, total_responses=1),
+    ]
+    assert await form_results_store.list_forms("test", "no-forms-bot") == []
+
+    assert await form_results_store.load_form_info(GlobalFormId("test", "testbot", "new-form")) == FormInfo(
+        form_block_id="new-form",
+        prompt="new prompt",
+        title="New form",
+        field_names={"field-1": "Field one"},
+        total_responses=3,
+    )
+    assert await form_results_store.load_form_info(GlobalFormId("test", "testbot", "missing-form")) is None
+
+
+async def test_load_bot_info() -> None:
+    store = Store(RedisEmulation())
+    assert await store.load_bot_info("user", "bot", detailed=True) is None
+
+    def config(admin_chat_id: int) -> BotConfig:
+        return BotConfig.model_validate(
+            {
+                "token_secret_name": "token",
+                "user_flow_config": {
+                    "entrypoints": [],
+                    "blocks": [
+                        {
+                            "human_operator": {
+                                "block_id": "ho",
+                                "catch_all": False,
+                                "feedback_handler_config": {
+                                    "admin_chat_id": admin_chat_id,
+                                    "forum_topic_per_user": False,
+                                    "anonimyze_users": True,
+                                    "max_messages_per_minute": 10,
+                                    "messages_to_user": {"forwarded_to_admin_ok": "ok", "throttling": "slow down"},
+                                    "messages_to_admin": {
+                                        "copied_to_user_ok": "ok",
+                                        "deleted_message_ok": "ok",
+                                        "can_not_delete_message": "can't",
+                                    },
+                                    "hashtags_in_admin_chat": False,
+                                    "unanswered_hashtag": None,
+                                    "hashtag_message_rarer_than": None,
+                                    "message_log_to_admin_chat": False,
+                                },
+                            }
+                        }
+                    ],
+                    "node_display_coords": {},
+                },
+            }
+        )
+
+    for admin_chat_id in (100, 200, 300):
+        await store.save_bot_config("user", "bot", config(admin_chat_id), meta={"message": str(admin_chat_id)})
+    await store.save_bot_display_name("user", "bot", "My bot")
+
+    info = await store.load_bot_info("user", "bot", detailed=True)
+    assert info is not None
+    assert info.display_name == "My bot"
+    assert info.running_version is None
+    assert info.running_version_info is None
+    assert [v.version for v in info.last_versions] == [2]
+    assert info.admin_chat_ids == [300]
+
+    # running version is older than the latest loaded versions
+    await store.set_bot_running_version("user", "bot", version=0)
+    info = await store.load_bot_info("user", "bot", detailed=True)
+    assert info is not None
+    assert info.running_version == 0
+    assert info.running_version_info is not None
+    assert info.running_version_info.version == 0
+    assert info.running_version_info.metadata["message"] == "100"
+    assert [v.version for v in info.last_versions] == [2]
+    assert info.admin_chat_ids == [100]
+
+    # running version stored as a negative index
+    await store.set_bot_running_version("user", "bot", version=-1)
+    info = await store.load_bot_info("user", "bot", detailed=False)
+    assert info is not None
+    assert info.running_version == -1
+    assert info.running_version_info is not None
+    assert info.running_version_info.version == 2
+    assert info.admin_chat_ids == []
+
+
+async def test_load_bot_infos_from_summaries() -> None:
+    store = Store(RedisEmulation())
+    config = BotConfig.model_validate(
+        {"token_secret_name": "token", "user_flow_config": {"entrypoints": [], "blocks": [], "node_display_coords": {}}}
+    )
+    await store.save_bot_config("user", "bot-1", config, meta={"message": None})
+    await store.save_bot_config("user", "bot-2", config, meta={"message": None})
+    await store.save_bot_display_name("user", "bot-1", "Bot 1")
+
+    infos = await store.load_bot_infos([("user", "bot-1"), ("user", "bot-2"), ("user", "missing")], detailed=True)
+    assert [i.display_name if i is not None else None for i in infos] == ["Bot 1", "bot-2", None]
+
+    # summaries are used as long as nothing changed...
+    await store._display_names_store.set_subkey("user", "bot-2", "Bot 2 (sneaky update)")
+    infos = await store.load_bot_infos([("user", "bot-1"), ("user", "bot-2")], detailed=True)
+    assert [i.display_name if i is not None else None for i in infos] == ["Bot 1", "bot-2"]
+
+    # ... and rebuilt after any update to the bot's data
+    await store.set_bot_running_version("user", "bot-2", version=0)
+    infos = await store.load_bot_infos([("user", "bot-1"), ("user", "bot-2")], detailed=False)
+    assert [i.display_name if i is not None else None for i in infos] == ["Bot 1", "Bot 2 (sneaky update)"]
+    assert [i.running_version if i is not None else None for i in infos] == [None, 0]
+
+    await store.errors.save_alert_chat_id("user", "bot-1", chat_id=1312)
+    infos = await store.load_bot_infos([("user", "bot-1")], detailed=True)
+    assert infos[0] is not None
+    assert infos[0].alert_chat_id == 1312
+
+
+async def test_bot_info_loading_error() -> None:
+    class FailingPipelinesRedisEmulation(RedisEmulation):
+        def pipeline(self, *args: Any, **kwargs: Any) -> Any:
+            pipe = super().pipeline(*args, **kwargs)
+
+            async def failing_execute(*args: Any, **kwargs: Any) -> Any:
+                for command in pipe._stack:
+                    command.close()
+                raise ConnectionError("Redis is down")
+
+            pipe.execute = failing_execute  # type: ignore
+            return pipe
+
+    unhandled_errors: list[dict[str, Any]] = []
+    loop = asyncio.get_running_loop()
+    loop.set_exception_handler(lambda _, context: unhandled_errors.append(context))
+    try:
+        store = Store(FailingPipelinesRedisEmulation())
+        with pytest.raises(ConnectionError):
+            await store.load_bot_info("user", "bot", detailed=True)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        gc.collect()
+        assert unhandled_errors == []
+    finally:
+        loop.set_exception_handler(None)
+
+
+async def test_parsed_bot_configs_cache() -> None:
+    redis = RedisEmulation()
+    store = Store(redis)
+    # e.g. API server and bot runner processes sharing the same storage
+    other_process_store = Store(redis)
+
+    def config(token_secret_name: str) -> BotConfig:
+        return BotConfig.model_validate(
+            {
+                "token_secret_name": token_secret_name,
+                "user_flow_config": {"entrypoints": [], "blocks": [], "node_display_coords": {}},
+            }
+        )
+
+    assert await store.load_bot_config("user", "bot") is None
+    for token_secret_name in ("token-1", "token-2"):
+        await store.save_bot_config("user", "bot", config(token_secret_name), meta={"message": None})
+
+    latest = await store.load_bot_config("user", "bot")
+    assert latest is not None
+    assert latest.token_secret_name == "token-2"
+    # the same version requested by absolute or negative index is parsed once
+    assert await store.load_bot_config("user", "bot", version=1) is latest
+    first = await store.load_bot_config("user", "bot", version=0)
+    assert first is not None
+    assert first.token_secret_name == "token-1"
+    assert await store.load_bot_config("user", "bot", version=-2) is first
+    assert await store.load_bot_config("user", "bot", version=2) is None
+    assert store._config_cache.stats().size == 2
+    other_process_first = await other_process_store.load_bot_config("user", "bot", version=0)
+    assert other_process_first is not None
+    assert other_process_first.token_secret_name == "token-1"
+
+    # re-created bot reuses version indices, cached configs of the removed one must not be returned by any process
+    await store.remove_bot_config("user", "bot")
+    assert await store.load_bot_config("user", "bot") is None
+    await store.save_bot_config("user", "bot", config("token-3"), meta={"message": None})
+    for s in (store, other_process_store):
+        recreated = await s.load_bot_config("user", "bot", version=0)
+        assert recreated is not None
+        assert recreated.token_secret_name == "token-3"
+
+
+async def test_errors_fingerprinting_and_sampling() -> None:
+    errors_store = BotErrorsStore(RedisEmulation())
+    errors_store.MAX_SAMPLES_PER_FINGERPRINT = 3
+    errors_store.MAX_SAMPLES_PER_BOT = 5
+    errors_store.MAX_STORED_SAMPLES = 4
+
+    alerted: list[BotErrorContext] = []
+
+    async def error_callback(ctx: BotErrorContext) -> None:
+        alerted.append(ctx)
+
+    errors_store.error_callback = error_callback
+    await errors_store.save_alert_chat_id("user", "bot", chat_id=1312)
+
+    # all errors must fall into the same sampling window
+    window = errors_store.SAMPLING_WINDOW.total_seconds()
+    now = time.time() // window * window
+    for user_id in range(10):
+        assert await errors_store.process_error(
+            "user", "bot", BotError(timestamp=now + user_id, message=f"Error for user {user_id}")
+        )
+    for i in range(3):
+        assert await errors_store.process_error(
+            "user", "bot", BotError(timestamp=now + 100 + i, message="Other error", exc_type="KeyError")
+        )
+
+    error_stats = await errors_store.load_error_stats("user", "bot")
+    assert [(s.message_template, s.count) for s in error_stats] == [("Other error", 3), ("Error for user <N>", 10)]
+    assert error_stats[1].first_seen == now
+    assert error_stats[1].last_seen == now + 9
+
+    # all errors are passed to the alert callback, regardless of sampling
+    assert len(alerted) == 13
+    assert {ctx.alert_chat_id for ctx in alerted} == {1312}
+
+    # 3 samples of the first error, then 2 of the second one before hitting the bot-wide limit;
+    # only the last samples are stored
+    assert [e.message for e in await errors_store.load_errors("user", "bot", offset=0, count=10)] == [
+        "Error for user 1",
+        "Error for user 2",
+        "Other error",
+        "Other error",
+    ]
+
+    # e.g. when the bot is deleted
+    assert len(await errors_store._redis.keys(errors_store._error_count_store._full_key("*"))) == 2
+    await errors_store.remove_errors("user", "bot")
+    assert await errors_store.load_error_stats("user", "bot") == []
+    assert await errors_store.load_errors("user", "bot", offset=0, count=10) == []
+    assert await errors_store._redis.keys(errors_store._error_count_store._full_key("*")) == []
+    assert await errors_store.load_alert_chat_id("user", "bot") == 1312
+
+
+async def test_error_stats_concurrent_writers() -> None:
+    redis = InterleavingRedisEmulation()
+    # e.g. two processes writing errors of the same bot
+    stores = [BotErrorsStore(redis), BotErrorsStore(redis)]
+    for store in stores:
+        store.MAX_SAMPLES_PER_BOT = 4
+    window = BotErrorsStore.SAMPLING_WINDOW.total_seconds()
+    now = time.time() // window * window
+
+    await asyncio.gather(
+        *[
+            store.process_errors("user", "bot", [BotError(timestamp=now + i, message="Oops") for i in range(5)])
+            for store in stores
+            for _ in range(3)
+        ]
+    )
+
+    error_stats = await stores[0].load_error_stats("user", "bot")
+    assert [(s.message_template, s.count) for s in error_stats] == [("Oops", 30)]
+    assert error_stats[0].first_seen == now
+    assert error_stats[0].last_seen == now + 4
+    # sampling limits are shared by the writers
+    assert len(await stores[0].load_errors("user", "bot", offset=0, count=100)) == 4
+
+
+async def test_errors_log_handler_queue() -> None:
+    errors_store = BotErrorsStore(RedisEmulation())
+    errors_store._queue = asyncio.Queue(maxsize=3)
+    test_logger = logging.getLogger("test-errors-log-handler")
+    errors_store.instrument(test_logger, owner_id="user", bot_id="bot")
+
+    for i in range(5):
+        try:
+            raise ValueError(f"oops {i}")
+        except ValueError:
+            test_logger.exception("Something went wrong")
+    assert errors_store.dropped_errors_count == 2
+
+    await errors_store.flush()
+    errors = await errors_store.load_errors("user", "bot", offset=0, count=10)
+    assert [e.exc_data for e in errors] == ["ValueError: oops 0", "ValueError: oops 1", "ValueError: oops 2"]
+    error_stats = await errors_store.load_error_stats("user", "bot")
+    assert len(error_stats) == 1
+    assert error_stats[0].count == 3
+
+    # writer is restarted after flushing
+    test_logger.error("Another error")
+    await errors_store.flush()
+    assert len(await errors_store.load_errors("user", "bot", offset=0, count=10)) == 4
+
+
+async def test_user_specific_media_store_concurrent_loads() -> None:
+    concurrent_loads = 0
+    max_concurrent_loads = 0
+
+    class SlowMediaStore(RedisMediaStore):
+        async def load_media(self, owner_id: str, media_id: str) -> Media | None:
+            nonlocal concurrent_loads, max_concurrent_loads
+            concurrent_loads += 1
+            max_concurrent_loads = max(max_concurrent_loads, concurrent_loads)
+            await asyncio.sleep(0.01)
+            concurrent_loads -= 1
+            return await super().load_media(owner_id, media_id)
+
+    media_store = SlowMediaStore(RedisEmulation())
+    media_ids: list[str] = []
+    for i in range(10):
+        media_id = await media_store.save_media("user", Media(content=f"media {i}".encode(), filename=None))
+        assert media_id is not None
+        media_ids.append(media_id)
+
+    adapter = UserSpecificMediaStore(media_store, owner_id="user", max_concurrent_loads=3)
+    loaded = await adapter.load_media_multiple(media_ids + ["missing"])
+    assert [m.content if m is not None else None for m in loaded] == [f"media {i}".encode() for i in range(10)] + [None]
+    assert max_concurrent_loads == 3
+
+
+async def test_cached_media_store(tmp_path: Path) -> None:
+    backend_loads: list[str] = []
+
+    class CountingMediaStore(RedisMediaStore):
+        async def load_media(self, owner_id: str, media_id: str) -> Media | None:
+            backend_loads.append(media_id)
+            return await super().load_media(owner_id, media_id)
+
+    backend = CountingMediaStore(RedisEmulation())
+
+    def make_cached_store() -> CachedMediaStore:
+        return CachedMediaStore(backend, max_memory_bytes=10, disk_dir=tmp_path / "cache", max_disk_bytes=20)
+
+    store = make_cached_store()
+    await store.setup()
+    media_ids: list[str] = []
+    for i in range(3):
+        media_id = await store.save_media("user", Media(content=f"content {i}".encode(), filename=f"{i}.png"))
+        assert media_id is not None
+        media_ids.append(media_id)
+
+    for _ in range(2):
+        media = await store.load_media("user", media_ids[0])
+        assert media is not None
+        assert media.content == b"content 0"
+        assert media.filename == "0.png"
+    assert backend_loads == [media_ids[0]]
+
+    # memory tier fits only one media, disk tier -- two
+    assert await store.load_media("user", media_ids[1]) is not None
+    assert await store.load_media("user", media_ids[2]) is not None
+    assert await store.load_media("user", media_ids[1]) is not None  # from disk
+    assert await store.load_media("user", media_ids[0]) is not None  # evicted from disk
+    assert backend_loads == [media_ids[0], media_ids[1], media_ids[2], media_ids[0]]
+
+    # disk tier survives restarts
+    backend_loads.clear()
+    store = make_cached_store()
+    await store.setup()
+    assert await store.load_media("user", media_ids[1]) is not None
+    assert backend_loads == []
+
+    # missing media ids are cached too
+    assert await store.load_media("user", "missing") is None
+    assert await store.load_media("user", "missing") is None
+    assert backend_loads == ["missing"]
+
+    assert await store.delete_media("user", media_ids[1])
+    assert await store.load_media("user", media_ids[1]) is None
+    assert await backend.load_media("user", media_ids[1]) is None
+
+
+async def test_cached_media_store_delete_during_load(tmp_path: Path) -> None:
+    load_started = asyncio.Event()
+    deleted = asyncio.Event()
+
+    class SlowMediaStore(RedisMediaStore):
+        async def load_media(self, owner_id: str, media_id: str) -> Media | None:
+            media = await super().load_media(owner_id, media_id)
+            load_started.set()
+            await deleted.wait()
+            return media
+
+    store = CachedMediaStore(SlowMediaStore(RedisEmulation()), disk_dir=tmp_path / "cache")
+    await store.setup()
+    media_id = await store.save_media("user", Media(content=b"content", filename=None))
+    assert media_id is not None
+
+    async def delete() -> None:
+        await load_started.wait()
+        assert await store.delete_media("user", media_id)
+        deleted.set()
+
+    await asyncio.gather(store.load_media("user", media_id), delete())
+    assert await store.load_media("user", media_id) is None
+    assert store._memory.get(store._key("user", media_id)) == (False, None)
+    assert not store._disk_index
+    assert not list((tmp_path / "cache").glob("*/*"))
+
+
+async def test_s3_media_store_streaming() -> None:
+    objects: dict[str, bytes] = {}
+    uploaded_parts: dict[str, list[bytes]] = {}
+
+    class FakeS3Body:
+        def __init__(self, content: bytes) -> None:
+            self.content = content
+            self.is_closed = False
+
+        async def iter_chunks(self, chunk_size: int) -> AsyncIterator[bytes]:
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i : i + chunk_size]
+
+        def close(self) -> None:
+            self.is_closed = True
+
+    class FakeS3Client:
+        async def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs: Any) -> dict:
+            objects[Key] = Body
+            return {}
+
+        async def create_multipart_upload(self, Bucket: str, Key: str, **kwargs: Any) -> dict:
+            uploaded_parts[Key] = []
+            return {"UploadId": Key}
+
+        async def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes) -> dict:
+            assert PartNumber == len(uploaded_parts[UploadId]) + 1
+            uploaded_parts[UploadId].append(Body)
+            return {"ETag": str(PartNumber)}
+
+        async def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict) -> dict:
+            assert [p["PartNumber"] for p in MultipartUpload["Parts"]] == list(range(1, len(uploaded_parts[Key]) + 1))
+            objects[Key] = b"".join(uploaded_parts[Key])
+            return {}
+
+        async def get_object(self, Bucket: str, Key: str) -> dict:
+            return {"Body": FakeS3Body(objects[Key]), "ContentLength": len(objects[Key]), "Metadata": {}}
+
+    store = AwsS3MediaStore(AwsS3Credentials(access_key_id="", secret_access_key="", region="", bucket="test"))
+    store._client = FakeS3Client()
+    store.MULTIPART_PART_SIZE = 10
+    store.DOWNLOAD_CHUNK_SIZE = 4
+
+    async def chunks(content: bytes, size: int) -> AsyncIterator[bytes]:
+        for i in range(0, len(content), size):
+            yield content[i : i + size]
+
+    small_id = await store.save_media_stream("user", chunks(b"small", 2), filename=None)
+    assert objects[f"user/{small_id}"] == b"small"
+    assert not uploaded_parts
+
+    content = bytes(range(35))
+    large_id = await store.save_media_stream("user", chunks(content, 3), filename=None)
+    # all parts except the last one have exactly the part size
+    assert [len(p) for p in uploaded_parts[f"user/{large_id}"]] == [10, 10, 15]
+    assert objects[f"user/{large_id}"] == content
+
+    assert large_id is not None
+    media_stream = await store.load_media_stream("user", large_id)
+    assert media_stream is not None
+    assert media_stream.size == 35
+    assert [len(chunk) async for chunk in media_stream.chunks] == [4] * 8 + [3]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+async def test_deduplicating_media_store(tmp_path: Path, streaming: bool) -> None:
+    backend = FilesystemMediaStore(tmp_path)
+    store = DeduplicatingMediaStore(backend, RedisEmulation())
+
+    async def save(owner_id: str, content: bytes, filename: str | None = None) -> str:
+        if streaming:
+
+            async def chunks() -> AsyncIterator[bytes]:
+                yield content
+
+            media_id = await store.save_media_stream(owner_id, chunks(), filename)
+        else:
+            media_id = await store.save_media(owner_id, Media(content=content, filename=filename))
+        assert media_id is not None
+        return media_id
+
+    media_id = await save("user", b"image")
+    assert await save("user", b"image") == media_id
+    assert await save("user", b"image", filename="image.png") != media_id
+    assert await save("user", b"other image") != media_id
+    assert await save("other-user", b"image") != media_id
+    assert len(list((tmp_path / "user").iterdir())) == 3
+
+    # the media is deleted only after all references to it are deleted
+    assert await store.delete_media("user", media_id)
+    assert await store.load_media("user", media_id) is not None
+    assert await store.delete_media("user", media_id)
+    assert await store.load_media("user", media_id) is None
+    assert not await store.delete_media("user", media_id)
+
+    # and then it's saved anew
+    assert await save("user", b"image") != media_id
+
+
+async def test_deduplicating_media_store_concurrent_save_and_release(tmp_path: Path) -> None:
+    store = DeduplicatingMediaStore(FilesystemMediaStore(tmp_path), InterleavingRedisEmulation())
+    media = Media(content=b"image", filename="image.png")
+
+    async def delayed_save(delay: int) -> str | None:
+        for _ in range(delay):
+            await asyncio.sleep(0)
+        return await store.save_media("user", media)
+
+    # the same content is saved again while its last reference is released, at every point of the release
+    for delay in range(30):
+        media_id = await store.save_media("user", media)
+        assert media_id is not None
+        _, saved_media_id = await asyncio.gather(store.release_media("user", media_id), delayed_save(delay))
+        assert saved_media_id is not None
+        loaded = await store.load_media("user", saved_media_id)
+        assert loaded is not None
+        assert loaded.content == media.content
+        assert await store.release_media("user", saved_media_id)
+        assert await store.load_media("user", saved_media_id) is None
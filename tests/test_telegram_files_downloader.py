@@ -0,0 +1,60 @@
+import asyncio
+import base64
+
+from telebot.test_util import MockedAsyncTeleBot
+from telebot_components.redis_utils.emulation import RedisEmulation
+
+from telebot_constructor.telegram_files_downloader import (
+    RedisCacheTelegramFilesDownloader,
+)
+
+
+async def test_redis_cache_telegram_files_downloader() -> None:
+    redis = RedisEmulation()
+    downloader = RedisCacheTelegramFilesDownloader(redis, max_cached=2)
+    bot = MockedAsyncTeleBot("token")
+    expected_b64 = base64.b64encode(b"mock downloaded file bytes").decode("utf-8")
+
+    for file_id in ("a", "b", "c"):
+        assert await downloader.get_base64_file(bot, file_id) == expected_b64
+    assert len(bot.method_calls["download_file"]) == 3
+    # stored as raw bytes
+    assert await redis.get(downloader._file_key("a")) == b"mock downloaded file bytes"
+
+    # cache hit, "a" is now more recently used than "b"
+    assert await downloader.get_base64_file(bot, "a") == expected_b64
+    assert len(bot.method_calls["download_file"]) == 3
+
+    await downloader._evict_extra_cached_files()
+    assert await redis.get(downloader._file_key("b")) is None
+    assert await redis.get(downloader._file_key("a")) is not None
+    assert await redis.get(downloader._file_key("c")) is not None
+    assert await redis.hlen(downloader._access_times_key) == 2
+
+
+async def test_telegram_files_downloader_coalesces_downloads() -> None:
+    downloader = RedisCacheTelegramFilesDownloader(RedisEmulation())
+    bot = MockedAsyncTeleBot("token")
+
+    results = await asyncio.gather(*[downloader.get_base64_file(bot, "file") for _ in range(5)])
+    assert len(set(results)) == 1
+    assert results[0] is not None
+    assert len(bot.method_calls["download_file"]) == 1
+    assert downloader._downloads_in_flight == {}
+
+
+async def test_telegram_files_downloader_remembers_failed_downloads() -> None:
+    redis = RedisEmulation()
+    downloader = RedisCacheTelegramFilesDownloader(redis)
+    bot = MockedAsyncTeleBot("token")
+    bot.add_return_values("get_file", RuntimeError("file is too big"))
+
+    assert await downloader.get_base64_file(bot, "file") is None
+    assert await downloader.get_base64_file(bot, "file") is None
+    assert len(bot.method_calls["get_file"]) == 1
+    # files that are not cached don't count towards the cache size
+    assert await redis.hlen(downloader._access_times_key) == 0
+
+    # the failure is per bot
+    other_bot = MockedAsyncTeleBot("other-token")
+    assert await downloader.get_base64_file(other_bot, "file") is not None
@@ -1,8 +1,20 @@
+import asyncio
+import datetime
+
 import pytest
+from telebot_components.redis_utils.emulation import RedisEmulation
 
 from telebot_constructor.user_flow.blocks.form import join_localizable_texts
 from telebot_constructor.utils import page_params_to_redis_indices
 from telebot_constructor.utils.pydantic import Language, LocalizableText
+from telebot_constructor.utils.store import (
+    CachedKeyValueStore,
+    CacheStats,
+    LRUCache,
+    WriteThroughCachedKeyValueStore,
+    purge_cached_stores,
+)
+from tests.utils import InterleavingRedisEmulation
 
 
 @pytest.mark.parametrize(
@@ -45,3 +57,127 @@ def test_join_localizable_texts(texts: list[LocalizableText], expected_result: L
 )
 def test_page_params_to_redis_indices(params: tuple[int, int], expected_result: tuple[int, int]):
     assert page_params_to_redis_indices(*params) == expected_result
+
+
+def test_lru_cache() -> None:
+    cache = LRUCache[int](max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.set("c", 3)  # "b" is the least recently used one
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert len(cache) == 2
+    assert cache.stats() == CacheStats(size=2, hits=3, misses=1, evictions=1)
+
+    sized_cache = LRUCache[str](max_size=5, sizeof=len)
+    sized_cache.set("a", "aa")
+    sized_cache.set("b", "bbb")
+    sized_cache.set("too-large", "xxxxxx")
+    assert len(sized_cache) == 2
+    sized_cache.set("c", "c")
+    assert sized_cache.get("a") == (False, None)
+    assert sized_cache.get("b") == (True, "bbb")
+    assert sized_cache.total_size == 4
+
+    expiring_cache = LRUCache[int](max_size=2, ttl=datetime.timedelta(seconds=-1))
+    expiring_cache.set("a", 1)
+    assert expiring_cache.get("a") == (False, None)
+
+
+async def test_write_through_cached_key_value_store() -> None:
+    redis = RedisEmulation()
+    store = WriteThroughCachedKeyValueStore[str](
+        name="test",
+        prefix="test",
+        redis=redis,
+        expiration_time=datetime.timedelta(days=1),
+        dumper=str,
+        loader=str,
+    )
+    assert await store.load("missing") is None
+    await store.save("key", "value")
+    assert await store.load("key") == "value"
+
+    # reads are served from memory, including missing values
+    await redis.set(store._full_key("key"), b"updated behind the cache")
+    await redis.set(store._full_key("missing"), b"updated behind the cache")
+    assert await store.load("key") == "value"
+    assert await store.load("missing") is None
+
+    await store.drop("key")
+    assert await store.load("key") is None
+    assert await redis.get(store._full_key("key")) is None
+
+    # values loaded from redis are cached for a short time only, they might expire there soon
+    store.loaded_cache_ttl = datetime.timedelta(seconds=-1)
+    await redis.set(store._full_key("loaded"), b"value")
+    assert await store.load("loaded") == "value"
+    await redis.delete(store._full_key("loaded"))
+    assert await store.load("loaded") is None
+    await store.save("saved", "value")
+    await redis.delete(store._full_key("saved"))
+    assert await store.load("saved") == "value"
+
+
+async def test_write_through_cached_key_value_store_write_during_load() -> None:
+    store = WriteThroughCachedKeyValueStore[str](
+        name="test",
+        prefix="test",
+        redis=InterleavingRedisEmulation(),
+        expiration_time=datetime.timedelta(days=1),
+        dumper=str,
+        loader=str,
+    )
+    await store.save("key", "old")
+    store._cache.clear()
+
+    # the value is saved while the old one is being loaded from redis
+    loaded, _ = await asyncio.gather(store.load("key"), store.save("key", "new"))
+    assert loaded == "new"
+    assert await store.load("key") == "new"
+    assert not store._loads_in_flight
+    assert not store._last_write_during_load
+
+
+async def test_cached_key_value_store() -> None:
+    redis = RedisEmulation()
+
+    def make_store(prefix: str, name: str = "test", cache_size: int = 2) -> CachedKeyValueStore[str]:
+        return CachedKeyValueStore[str](
+            name=name, prefix=prefix, redis=redis, dumper=str, loader=str, cache_size=cache_size
+        )
+
+    store = make_store("bot-1")
+    other_bot_store = make_store("bot-2")
+    await store.save("a", "1")
+    await store.save_multiple({"b": "2", "c": "3"})
+    await other_bot_store.save("a", "other")
+
+    assert await store.load("c") == "3"
+    assert await store.load("a") == "1"  # evicted from cache, loaded from redis
+    assert await other_bot_store.load("a") == "other"
+    assert store._cache.stats() == CacheStats(size=2, hits=1, misses=1, evictions=2)
+
+    # cache is shared between store instances, e.g. on bot restart
+    await redis.set(store._full_key("a"), b"updated")
+    assert await make_store("bot-1").load("a") == "1"
+
+    # other stores in the same namespace have their own caches, with their own parameters
+    another_store = make_store("bot-1", name="another", cache_size=10)
+    await another_store.save("a", "another")
+    assert another_store._cache.max_size == 10
+    with pytest.raises(ValueError):
+        await make_store("bot-1", name="another", cache_size=5).load("a")
+
+    purge_stats = purge_cached_stores("bot-1")
+    assert purge_stats == {
+        "test": CacheStats(size=2, hits=2, misses=1, evictions=2),
+        "another": CacheStats(size=1, hits=0, misses=0, evictions=0),
+    }
+    assert await store.load("a") == "updated"
+    await redis.set(other_bot_store._full_key("a"), b"updated")
+    assert await other_bot_store.load("a") == "other"
+    purge_cached_stores("bot-1")
+    purge_cached_stores("bot-2")
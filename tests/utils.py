@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import time
 from typing import Any, Callable, Optional, TypeVar
@@ -7,7 +8,7 @@ from telebot import types as tg
 from telebot.metrics import TelegramUpdateMetrics
 from telebot.test_util import MethodCall
 from telebot.types import Dictionaryable
-from telebot_components.redis_utils.emulation import RedisEmulation
+from telebot_components.redis_utils.emulation import RedisEmulation, RedisPipelineEmulatiom
 from telebot_components.redis_utils.interface import RedisInterface
 from telebot_components.utils.secrets import RedisSecretStore, SecretStore
 from typing_extensions import TypeGuard
@@ -19,6 +20,55 @@ from telebot_constructor.store.form_results import (
 )
 
 
+class InterleavingRedisEmulation(RedisEmulation):
+    """
+    Lets other tasks run before each command and pipeline, as a real Redis client would; commands within
+    a pipeline are still executed atomically
+    """
+
+    INTERLEAVED_COMMANDS = {
+        "get",
+        "set",
+        "delete",
+        "exists",
+        "incr",
+        "sadd",
+        "srem",
+        "smembers",
+        "spop",
+        "hset",
+        "hget",
+    }
+
+    def __getattribute__(self, name: str) -> Any:
+        attr = super().__getattribute__(name)
+        if name not in InterleavingRedisEmulation.INTERLEAVED_COMMANDS:
+            return attr
+
+        async def interleaved(*args: Any, **kwargs: Any) -> Any:
+            await asyncio.sleep(0)
+            return await attr(*args, **kwargs)
+
+        return interleaved
+
+    def pipeline(self, *args: Any, **kwargs: Any) -> Any:
+        redis = self
+
+        class _Atomic:
+            def __getattr__(self, name: str) -> Any:
+                return getattr(RedisEmulation, name).__get__(redis)
+
+        pipe = RedisPipelineEmulatiom(_Atomic())  # type: ignore
+        execute = pipe.execute
+
+        async def interleaved_execute(*args: Any, **kwargs: Any) -> Any:
+            await asyncio.sleep(0)
+            return await execute(*args, **kwargs)
+
+        pipe.execute = interleaved_execute  # type: ignore
+        return pipe
+
+
 def dummy_secret_store(redis: RedisInterface) -> SecretStore:
     return RedisSecretStore(
         redis,